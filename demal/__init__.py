@@ -4,4 +4,34 @@ demal
 MAL (Meta Attack Language) to JSON decoding library and command-line tool.
 """
 
-from .demal import *
\ No newline at end of file
+from .demal import *
+
+# Names of the optional modules, imported on first use so that converting a file only loads demal.demal.
+LAZY = {
+    'ResultCache': 'cache',
+    'Expressions': 'expression',
+    'Distribution': 'distribution', 'Sampler': 'distribution',
+    'AttackGraph': 'graph',
+    'Model': 'model',
+    'Server': 'server', 'Client': 'server',
+    'Snapshot': 'snapshot',
+    'Tracer': 'trace', 'MemorySink': 'trace', 'JsonSink': 'trace', 'StderrSink': 'trace'
+}
+MODULES = {'cache', 'diff', 'distribution', 'expression', 'graph', 'model', 'schema', 'server', 'snapshot', 'trace', 'validate'}
+
+def __getattr__(name):
+    '''
+    Import an optional module, or the module of one of its names, when it is first used.
+    '''
+    import importlib
+    if name in LAZY:
+        return getattr(importlib.import_module(f'.{LAZY[name]}', __name__), name)
+    if name in MODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    '''
+    Module attributes, the optional ones included.
+    '''
+    return sorted(set(globals()) | LAZY.keys() | MODULES)
\ No newline at end of file
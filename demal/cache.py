@@ -0,0 +1,154 @@
+'''
+demal.cache
+-----------
+Persistent on-disk cache of parse results for the command-line tool.
+'''
+
+import os, json, hashlib
+
+from .demal import __version__
+
+class ResultCache:
+    '''
+    Size-bounded, least-recently-used cache of JSON output keyed by source content,
+    demal version and the content of every included file.
+
+    Entries are stored as <key>.json (the exact output) next to <key>.deps (included files and their hashes).
+    '''
+
+    def __init__(self, root, limit = None):
+        '''
+        Open (and create if needed) a cache directory, limit is the maximum size in bytes.
+        '''
+        self.root = root
+        self.limit = limit if limit is not None else int(float(os.getenv('DEMAL_CACHE_SIZE', 256)) * 2**20)
+        os.makedirs(root, exist_ok=True)
+        self.counters = self._load('stats.json') or {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f"<ResultCache object: '{self.root}'>"
+
+    @staticmethod
+    def digest(data):
+        '''
+        Content hash of a str or bytes object.
+        '''
+        return hashlib.sha256(data.encode() if type(data) is str else data).hexdigest()
+
+    def key(self, source, variant = ''):
+        '''
+        Cache key of a MAL source for the running demal version and output variant.
+        '''
+        return self.digest(f'demal {__version__} {variant}\0'.encode() + (source.encode() if type(source) is str else source))
+
+    def get(self, key, base = '.'):
+        '''
+        Return the cached output for a key, None if missing or if an included file changed.
+        Included files are resolved against the base directory of the source.
+        '''
+        path = os.path.join(self.root, key + '.json')
+        deps = self._load(key + '.deps')
+        try:
+            if deps is None:
+                raise IOError
+            for name, digest in deps:
+                with open(os.path.join(base, name), 'rb') as f:
+                    if self.digest(f.read()) != digest:
+                        raise IOError
+            with open(path, encoding='utf-8', newline='\n') as f:
+                data = f.read()
+        except (IOError, ValueError):
+            self.counters['misses'] += 1
+            return None
+        os.utime(path)
+        self.counters['hits'] += 1
+        return data
+
+    def put(self, key, data, includes = (), base = '.'):
+        '''
+        Store the output for a key along with the files that were included to produce it.
+        '''
+        deps = []
+        for name in includes:
+            with open(name, 'rb') as f:
+                deps.append((os.path.relpath(name, base), self.digest(f.read())))
+        self._save(key + '.json', data)
+        self._save(key + '.deps', json.dumps(deps))
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove least recently used entries until the cache fits within its limit.
+        '''
+        entries = [(st.st_mtime, st.st_size, name[:-5]) for name, st in self._entries()]
+        total = sum(x[1] for x in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.limit:
+                break
+            for ext in ('.json', '.deps'):
+                try:
+                    os.remove(os.path.join(self.root, key + ext))
+                except IOError:
+                    pass
+            total -= size
+            self.counters['evictions'] += 1
+
+    def stats(self):
+        '''
+        Current size of the cache and its lifetime hit, miss and eviction counts.
+        '''
+        entries = list(self._entries())
+        return dict(self.counters, entries=len(entries), size=sum(st.st_size for _, st in entries), limit=self.limit)
+
+    def report(self):
+        '''
+        Human-readable summary of the cache statistics.
+        '''
+        s = self.stats()
+        lookups = s['hits'] + s['misses']
+        ratio = f' ({s["hits"] / lookups:.0%} hit rate)' if lookups else ''
+        return '\n'.join((
+            f'Cache: {os.path.abspath(self.root)}',
+            f'Entries: {s["entries"]}, {s["size"] / 2**20:.1f} of {s["limit"] / 2**20:.1f} MB',
+            f'Hits: {s["hits"]}, misses: {s["misses"]}{ratio}, evictions: {s["evictions"]}'
+        ))
+
+    def close(self):
+        '''
+        Persist the statistics counters.
+        '''
+        self._save('stats.json', json.dumps(self.counters))
+
+    def _entries(self):
+        '''
+        Generate the name and stat of every cached output, skipping any removed concurrently.
+        '''
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.json') and entry.name != 'stats.json':
+                try:
+                    yield entry.name, entry.stat()
+                except IOError:
+                    pass
+
+    def _load(self, name):
+        '''
+        Read a JSON file from the cache directory, None if missing or corrupt.
+        '''
+        try:
+            with open(os.path.join(self.root, name), encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _save(self, name, data):
+        '''
+        Atomically write a file in the cache directory.
+        '''
+        path = os.path.join(self.root, name)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(data)
+        os.replace(tmp, path)
@@ -10,30 +10,797 @@ __version__ = '2.1.1'
 __author__ = 'Victor Azzam'
 __url__ = 'https://github.com/victorazzam/demal'
 
-import os, io, re, sys, copy, json, inspect
+import os, io, re, sys, copy, glob, json, mmap, types, codecs, functools, itertools, contextlib, collections
 
 # Default
 CLI = False
 
+# Stands in for a tracer phase when not tracing.
+NOTRACE = contextlib.nullcontext()
+
 # Check if the terminal supports styled output.
 colors = 'win' not in sys.platform or any(os.getenv(x) is not None for x in ('WT_SESSION', 'WT_PROFILE_ID'))
 
 # Red, green, yellow, blue, cyan, white, default.
 r, g, y, b, c, w, z = (f'\x1b[{x}m' * colors for x in (91,92,93,94,96,97,0))
 
+# Grammar tables shared by every parser instance and thread, compiled once at import.
+Grammar = collections.namedtuple('Grammar', 'token token_bytes wide name block escape unsafe kinds sym symbols ops tags cia')
+GRAMMAR = Grammar(
+    # One alternative per token kind, leading blanks are absorbed into each match.
+    token = re.compile(r'''[^\S\n]*(?:
+        (?P<newline>\n)
+      | (?P<comment>//[^\n]*|/\*[\s\S]*?\*/)
+      | (?P<string>"(?:[^"\\\n]|\\.)*")
+      | (?P<number>\d+(?:\.\d+)?)
+      | (?P<name>[^\W\d]\w*)
+      | (?P<error>/\*|")
+      | (?P<op><--|-->|->|<-|\+>|/\\|\\/|\.\.|[^\s\w])
+      | $)
+    ''', re.X),
+    # The same over UTF-8 bytes for memory-mapped files: non-ASCII bytes are read as name characters, see Lexer.scan_bytes().
+    token_bytes = re.compile(rb'''[^\S\n]*(?:
+        (?P<newline>\n)
+      | (?P<comment>//[^\n]*|/\*[\s\S]*?\*/)
+      | (?P<string>"(?:[^"\\\n]|\\.)*")
+      | (?P<number>\d+(?:\.\d+)?)
+      | (?P<name>[A-Za-z_\x80-\xff][\w\x80-\xff]*)
+      | (?P<error>/\*|")
+      | (?P<op><--|-->|->|<-|\+>|/\\|\\/|\.\.|[^\s\w])
+      | $)
+    ''', re.X),
+    # Non-ASCII bytes, and what names read from bytes must be once decoded.
+    wide = re.compile(rb'[\x80-\xff]'),
+    name = re.compile(r'[^\W\d]\w*'),
+    # What can end a declaration that is still arriving: strings, comments, braces, and unterminated strings and comments.
+    block = re.compile(r'"(?:[^"\\\n]|\\.)*"|//[^\n]*|/\*[\s\S]*?\*/|[{}]|/\*|"'),
+    # Escaped characters in quoted strings, and characters that need escaping on output.
+    escape = re.compile(r'\\(["\\])'),
+    unsafe = re.compile(r'\\(?=["\\]|$)|"'),
+    # Attack step types and expression operators.
+    kinds = types.MappingProxyType(dict(zip('| & # E !E'.split(), 'or and defense exists lacks'.split()))),
+    sym = types.MappingProxyType(dict(zip('+> -> <-'.split(), 'append leads_to require'.split()))),
+    # The same the other way around, for writing MAL.
+    symbols = types.MappingProxyType(dict(zip('or and defense exists lacks'.split(), '| & # E !E'.split()))),
+    ops = types.MappingProxyType(dict(zip('append leads_to require'.split(), '+> -> <-'.split()))),
+    tags = frozenset(('hidden', 'debug', 'trace')),
+    cia = ('C', 'I', 'A')
+)
+
+# A token and its position in the source: kind is one of name, number, string, op.
+Token = collections.namedtuple('Token', 'kind value line col start end')
+
+class Lexer:
+    '''
+    Single-pass MAL tokenizer with one-token lookahead helpers for the parser.
+    Whitespace and comments are skipped, quoted strings may contain escaped quotes.
+    '''
+    def __new__(cls, data, name = '<string>', tracer = None, *args):
+        '''
+        A TracedLexer when given a Tracer, so that lexers without one do no tracing work per token.
+        '''
+        return super().__new__(TracedLexer if tracer is not None and cls is Lexer else cls)
+
+    def __init__(self, data, name = '<string>', tracer = None, start = 0, end = None, line = 1):
+        '''
+        Prepare to tokenize the given source text, or the region of it that starts on the given line.
+        Source lines are recorded by the given Tracer, if any.
+        '''
+        self.data = data
+        self.name = name
+        self.chars = type(data) is str
+        self.tokens = (self.scan if self.chars else self.scan_bytes)(start, len(data) if end is None else end, line)
+        self.tracer = tracer
+        self.ahead = collections.deque()
+        self.last = None
+
+    def __iter__(self):
+        '''
+        Tokens are consumed by iterating over the lexer.
+        '''
+        return self
+
+    def __next__(self):
+        '''
+        Consume the next token.
+        '''
+        tok = self.ahead.popleft() if self.ahead else next(self.tokens)
+        self.last = tok
+        return tok
+
+    def scan(self, start, end, line):
+        '''
+        Generate tokens in a single pass over the source.
+        '''
+        data, new = self.data, tuple.__new__
+        bol = data.rfind('\n', 0, start) + 1
+        for m in GRAMMAR.token.finditer(data, start, end):
+            kind = m.lastgroup
+            if kind == 'newline':
+                line, bol = line + 1, m.end()
+                continue
+            start, end = m.span(kind) if kind else (0, 0)
+            if kind == 'name' or kind == 'op' or kind == 'number':
+                yield new(Token, (kind, m.group(kind), line, start - bol + 1, start, end))
+            elif kind == 'string':
+                value = m.group(kind)[1:-1]
+                if '\\' in value:
+                    value = GRAMMAR.escape.sub(r'\1', value)
+                yield new(Token, (kind, value, line, start - bol + 1, start, end))
+            elif kind == 'comment':
+                if (n := data.count('\n', start, end)):
+                    line, bol = line + n, data.rindex('\n', start, end) + 1
+            elif kind == 'error':
+                what = 'comment' if m.group(kind) == '/*' else 'string'
+                raise SyntaxError(f'Unterminated {what} in {self.name} at line {line}, column {start - bol + 1}')
+
+    def scan_bytes(self, start, end, line):
+        '''
+        Generate the same tokens from UTF-8 bytes, such as a memory-mapped file, decoding only token values.
+        Repeated names and operators share one string, columns count characters as they do in text.
+        '''
+        data, new, values = self.data, tuple.__new__, {}
+        bol = data.rfind(b'\n', 0, start) + 1
+        wide = -1
+        try:
+            for m in GRAMMAR.token_bytes.finditer(data, start, end):
+                kind = m.lastgroup
+                if kind == 'newline':
+                    line, bol = line + 1, m.end()
+                    continue
+                if kind is None:
+                    continue
+                start, end = m.span(kind)
+                if kind == 'comment':
+                    text = m.group(kind)
+                    if (n := text.count(b'\n')):
+                        line, bol = line + n, start + text.rindex(b'\n') + 1
+                    continue
+                # Columns are offsets unless the line has non-ASCII characters before the token.
+                if wide < bol:
+                    wide = x.start() if (x := GRAMMAR.wide.search(data, bol)) else len(data)
+                col = start - bol + 1 if wide >= start else len(data[bol:start].decode('utf-8', 'replace')) + 1
+                if kind == 'string':
+                    value = m.group(kind)[1:-1].decode('utf-8')
+                    if '\\' in value:
+                        value = GRAMMAR.escape.sub(r'\1', value)
+                    yield new(Token, (kind, value, line, col, start, end))
+                elif kind == 'error':
+                    what = 'comment' if m.group(kind) == b'/*' else 'string'
+                    raise SyntaxError(f'Unterminated {what} in {self.name} at line {line}, column {col}')
+                else:
+                    raw = m.group(kind)
+                    if (value := values.get(raw)) is None:
+                        value = values[raw] = raw.decode('utf-8')
+                        if kind == 'name' and not value.isascii() and not GRAMMAR.name.fullmatch(value):
+                            raise SyntaxError(f'Improper syntax in {self.name} at line {line}, column {col}: {value!r}')
+                    yield new(Token, (kind, value, line, col, start, end))
+        except UnicodeDecodeError:
+            raise SyntaxError(f'Invalid UTF-8 in {self.name} at line {line}') from None
+
+    def peek(self, n = 0):
+        '''
+        Look ahead without consuming, None when past the end of input.
+        '''
+        if n < len(self.ahead):
+            return self.ahead[n]
+        while len(self.ahead) <= n:
+            if (tok := next(self.tokens, None)) is None:
+                return None
+            self.ahead.append(tok)
+        return self.ahead[n]
+
+    def expect(self, kind, value = None):
+        '''
+        Consume the next token, which must be of the given kind (and value).
+        '''
+        tok = next(self)
+        if tok.kind != kind or value is not None and tok.value != value:
+            raise self.error(tok)
+        return tok
+
+    def rest(self, tok, inclusive = False):
+        '''
+        Consume the remaining tokens on the line of the given token.
+        '''
+        tokens = [tok] if inclusive else []
+        while (nxt := self.peek()) and nxt.line == tok.line:
+            tokens.append(next(self))
+        return tokens
+
+    def until(self, tok, value):
+        '''
+        Consume tokens on the line of the given token up to the closing operator.
+        '''
+        tokens = []
+        while (nxt := next(self))[:2] != ('op', value):
+            if nxt.line != tok.line:
+                raise self.error(nxt)
+            tokens.append(nxt)
+        return tokens
+
+    def multiplicity(self, tok, value):
+        '''
+        Consume an association multiplicity such as 1, *, 0..1 or 1..*
+        '''
+        tokens = self.until(tok, value)
+        for x in tokens or [self.last]:
+            if x.kind != 'number' and x.value not in ('*', '..'):
+                raise self.error(x)
+        return self.text(tokens)
+
+    def meta_ahead(self, tok):
+        '''
+        Check whether the rest of the line reads as a metadata key, e.g. user info:
+        '''
+        i = 0
+        while (nxt := self.peek(i)) and nxt.line == tok.line and nxt.kind == 'name':
+            i += 1
+        return bool(nxt) and nxt.line == tok.line and nxt[:2] == ('op', ':')
+
+    def text(self, tokens):
+        '''
+        Source text spanned by a run of tokens, comments in between become a space.
+        '''
+        if not tokens:
+            return ''
+        data, space = self.data, ' ' if self.chars else b' '
+        parts = [data[tokens[0].start:tokens[0].end]]
+        for a, b in zip(tokens, tokens[1:]):
+            if b.start > a.end:
+                gap = data[a.end:b.start]
+                parts.append(gap if gap.isspace() else space)
+            parts.append(data[b.start:b.end])
+        return ''.join(parts) if self.chars else b''.join(parts).decode('utf-8')
+
+    def line(self, tok):
+        '''
+        The stripped source line containing a token.
+        '''
+        if tok is None:
+            return ''
+        newline = '\n' if self.chars else b'\n'
+        start = self.data.rfind(newline, 0, tok.start) + 1
+        end = self.data.find(newline, tok.start)
+        line = self.data[start:end if end >= 0 else len(self.data)].strip()
+        return line if self.chars else line.decode('utf-8', 'replace')
+
+    def error(self, tok):
+        '''
+        Build a syntax error pointing at a token.
+        '''
+        return SyntaxError(f'Improper syntax in {self.name} at line {tok.line}, column {tok.col}: {repr(self.line(tok))}')
+
+class TracedLexer(Lexer):
+    '''
+    Lexer passing each new source line to its Tracer along with the token that starts it, once consumed.
+    Tokens only looked at with peek() are not counted, so a line is credited to the method that reads it.
+    '''
+
+    # Line of the last token consumed.
+    traced = 0
+
+    def __next__(self):
+        '''
+        Consume the next token, recording its line if it is the first token consumed from that line.
+        '''
+        tok = Lexer.__next__(self)
+        if tok.line != self.traced:
+            self.traced = tok.line
+            self.tracer.line(self, tok)
+        return tok
+
+# A top-level declaration of an incrementally parsed source.
+class Block:
+    '''
+    Position of a top-level declaration and its own results, or the file it includes.
+    '''
+    __slots__ = ('start', 'end', 'line', 'last', 'result', 'include', 'included')
+
+    def __init__(self, start, end, line, last, result, include = None):
+        '''
+        Span of the declaration as offsets and first/last line numbers.
+        '''
+        self.start, self.end, self.line, self.last = start, end, line, last
+        self.result, self.include, self.included = result, include, None
+
+    def provides(self):
+        '''
+        Generate what the block contributes to the results: defines, categories and associations.
+        '''
+        for key, value in (self.result or {}).items():
+            if key == 'categories':
+                yield from (('category', x) for x in value)
+            elif key == 'associations':
+                yield ('associations',)
+            else:
+                yield ('#', key)
+
+class Handler:
+    '''
+    Receiver of parse events, see MalParser.handle() and MalParser.events().
+    Every method passes its event on to event(), override either.
+    '''
+
+    def event(self, name, *args):
+        '''
+        Any event, by name with its arguments.
+        '''
+
+    def define(self, key, value):
+        '''
+        A #key: "value" definition, both strings.
+        '''
+        self.event('define', key, value)
+
+    def include(self, file):
+        '''
+        An include statement, with the file name as written.
+        '''
+        self.event('include', file)
+
+    def category(self, name):
+        '''
+        The start of a category, by name.
+        '''
+        self.event('category', name)
+
+    def category_end(self, name):
+        '''
+        The end of a category, by name.
+        '''
+        self.event('category_end', name)
+
+    def asset(self, name, extends, abstract):
+        '''
+        The start of an asset, with the name of the asset it extends or None, and whether it is abstract.
+        '''
+        self.event('asset', name, extends, abstract)
+
+    def asset_end(self, name):
+        '''
+        The end of an asset, by name.
+        '''
+        self.event('asset_end', name)
+
+    def attribute(self, name, kind, probability, cia, tags):
+        '''
+        An attack step or defense: its name, its kind (or, and, defense, exists or lacks),
+        the probability distribution as written or None, the CIA letters in order or None, and a list of tags.
+        '''
+        self.event('attribute', name, kind, probability, cia, tags)
+
+    def expression(self, field, key, value):
+        '''
+        An expression of the latest attribute: the field (append, leads_to or require), its key (the name
+        of a let variable, otherwise its number within the field as a string) and the expression as written.
+        '''
+        self.event('expression', field, key, value)
+
+    def association(self, name, asset_l, field_l, mult_l, mult_r, field_r, asset_r):
+        '''
+        An association: its name, then the left asset, field and multiplicity, and the right multiplicity,
+        field and asset, the multiplicities as written, e.g. 1..*
+        '''
+        self.event('association', name, asset_l, field_l, mult_l, mult_r, field_r, asset_r)
+
+    def meta(self, key, value):
+        '''
+        Metadata of the latest category, asset, attribute or association, its key as written and its value.
+        '''
+        self.event('meta', key, value)
+
+class Events(Handler):
+    '''
+    Handler passing every event to a callback as a (name, arguments...) tuple.
+    '''
+
+    def __init__(self, callback):
+        '''
+        Pass events to a callable taking one tuple.
+        '''
+        self.callback = callback
+
+    def event(self, name, *args):
+        '''
+        Call back with the event name followed by its arguments.
+        '''
+        self.callback((name,) + args)
+
+class Builder(Handler):
+    '''
+    Handler building the results of a parser, used by every parse.
+    '''
+
+    def __init__(self, parser):
+        '''
+        Build into the results of the given parser, whichever dictionary they are at the time.
+        '''
+        self.parser = parser
+        self.assets = self.attributes = self.last = self.target = None
+
+    def define(self, key, value):
+        '''
+        Set a top-level value of the results.
+        '''
+        self.parser.result[key] = value
+
+    def include(self, file):
+        '''
+        Nothing to build, the parser follows includes itself.
+        '''
+        pass
+
+    def category(self, name):
+        '''
+        Start a category, its metadata and assets filled by the events that follow.
+        '''
+        result = self.parser.result
+        if 'categories' not in result:
+            result['categories'] = {}
+        section = result['categories'][name] = {
+            'meta': {},
+            'assets': {}
+        }
+        self.target, self.assets = section['meta'], section['assets']
+
+    def asset(self, name, extends, abstract):
+        '''
+        Start an asset of the current category.
+        '''
+        section = self.assets[name] = {
+            'meta': {},
+            'attributes': {},
+            'extends': extends,
+            'abstract': abstract
+        }
+        self.target, self.attributes = section['meta'], section['attributes']
+
+    def attribute(self, name, kind, probability, cia, tags):
+        '''
+        Start an attack step or defense of the current asset.
+        '''
+        self.last = self.attributes[name] = {
+            'meta': {},
+            'type': kind,
+            'probability': probability,
+            'cia': cia,
+            'tags': tags
+        }
+        self.target = self.last['meta']
+
+    def expression(self, field, key, value):
+        '''
+        Add an expression to a field of the latest attribute.
+        '''
+        if field not in self.last:
+            self.last[field] = {}
+        self.last[field][key] = value
+
+    def association(self, name, asset_l, field_l, mult_l, mult_r, field_r, asset_r):
+        '''
+        Append an association to the results.
+        '''
+        result = self.parser.result
+        if 'associations' not in result:
+            result['associations'] = []
+        result['associations'].append({
+            'name': name,        'meta': {},
+            'asset_l': asset_l,  'asset_r': asset_r,
+            'field_l': field_l,  'field_r': field_r,
+            'mult_l' : mult_l,   'mult_r' : mult_r
+        })
+        self.target = result['associations'][-1]['meta']
+
+    def meta(self, key, value):
+        '''
+        Set metadata of the latest category, asset, attribute or association.
+        '''
+        self.target[key] = value
+
+class Feed:
+    '''
+    Source text received in chunks, cut into complete top-level declarations as they arrive.
+    Tokens at the end of the buffer may be cut short, so they are scanned again once more text arrives.
+    The buffer is data followed by parts, both scanned up to pos, then rest, the text not scanned yet.
+    Parts are only joined into data once a declaration completes, so a long one arriving in many chunks is not copied
+    each time.
+    '''
+    __slots__ = ('data', 'parts', 'rest', 'pos', 'line', 'start', 'first', 'depth', 'decoder')
+
+    def __init__(self):
+        '''
+        Start with an empty buffer whose first line is line 1.
+        '''
+        self.data, self.parts, self.rest, self.pos, self.line = '', [], '', 0, 1
+        self.start, self.first, self.depth = None, None, 0
+        self.decoder = None
+
+    def push(self, chunk, final = False):
+        '''
+        Append text, or UTF-8 bytes which may end in the middle of a character.
+        '''
+        if type(chunk) is not str:
+            self.decoder = self.decoder or codecs.getincrementaldecoder('utf-8')()
+            chunk = self.decoder.decode(chunk, final)
+        self.rest += chunk
+
+    def cut(self, final = False):
+        '''
+        Spans of the declarations completed in the buffer as (start, end, line), offsets into data.
+        At the end of input, what remains is returned as well so that parsing it reports the error.
+        '''
+        # Offsets in the text not scanned yet, base is where it starts in the buffer.
+        data, spans, size, pos, base = self.rest, [], len(self.rest), 0, self.pos
+        while True:
+            if self.start is None:
+                # The first token tells how the declaration ends.
+                m = GRAMMAR.token.match(data, pos)
+                kind = m.lastgroup
+                if kind is None or not final and (kind == 'error' or m.end() == size and kind != 'newline'):
+                    break
+                pos = m.end()
+                if kind == 'newline' or kind == 'comment':
+                    continue
+                self.start, self.first, self.depth = base + m.start(kind), m.group(kind), 0
+                if self.first in ('#', 'include', 'category', 'associations'):
+                    continue
+            else:
+                # Inside a declaration only strings, comments and braces matter.
+                m = GRAMMAR.block.search(data, pos)
+                if m is None:
+                    pos = max(pos, size - 1)
+                    break
+                value = m.group()
+                if not final and (value == '/*' or m.end() == size and value[:2] == '//' or value == '"' and data.find('\n', m.end()) < 0):
+                    pos = m.start()
+                    break
+                pos = m.end()
+                if self.first in ('#', 'include'):
+                    if value[0] != '"':
+                        continue
+                elif value in '{}':
+                    self.depth += 1 if value == '{' else -1
+                    if self.depth > 0:
+                        continue
+                elif value != '"':
+                    continue
+            spans.append((self.start, base + pos))
+            self.start = None
+        if final:
+            pos = size
+            if self.start is not None:
+                spans.append((self.start, base + size))
+        self.rest, self.pos = data[pos:], base + pos
+        if pos:
+            self.parts.append(data[:pos])
+        if not spans:
+            return []
+        self.data = ''.join([self.data, *self.parts])
+        self.parts = []
+        return [(start, end, self.line + self.data.count('\n', 0, start)) for start, end in spans]
+
+    def trim(self, end):
+        '''
+        Drop the lines of the buffer that were parsed up to an offset.
+        '''
+        cut = self.data.rfind('\n', 0, end) + 1
+        self.line += self.data.count('\n', 0, cut)
+        self.data, self.pos = self.data[cut:], self.pos - cut
+        if self.start is not None:
+            self.start -= cut
+
+class Index:
+    '''
+    Lookup tables over a parse result for assets, inheritance, associations and attack steps.
+    Built once in a single pass, every query is a dictionary lookup.
+    '''
+
+    def __init__(self, result):
+        '''
+        Index the given result dictionary.
+        '''
+        self.result = result
+        self.shape = self._shape(result)
+        self.names = []
+        self.categories = {}
+        self.assets = {}
+        self.parents = {}
+        self.subclasses = collections.defaultdict(list)
+        self.links = collections.defaultdict(list)
+        self.fields = {}
+        self.steps = {}
+        self.flattened = {}
+        categories = result.get('categories')
+        for cname, category in (categories.items() if type(categories) is dict else ()):
+            assets = category.get('assets') if type(category) is dict else None
+            if type(assets) is not dict:
+                continue
+            for name in sorted(assets):
+                asset = assets[name]
+                self.names.append(f'{cname}.{name}')
+                if name in self.assets or type(asset) is not dict:
+                    continue
+                self.categories[name] = cname
+                self.assets[name] = asset
+                if (parent := asset.get('extends')):
+                    self.parents[name] = parent
+                    self.subclasses[parent].append(name)
+                attributes = asset.get('attributes')
+                for step, attr in (attributes.items() if type(attributes) is dict else ()):
+                    self.steps[f'{name}.{step}'] = attr
+        associations = result.get('associations')
+        for link in (associations if type(associations) is list else ()):
+            left, right = link.get('asset_l'), link.get('asset_r')
+            self.links[left].append(link)
+            if right != left:
+                self.links[right].append(link)
+            self.fields.setdefault((left, link.get('field_r')), (link, right))
+            self.fields.setdefault((right, link.get('field_l')), (link, left))
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Index object: {len(self.assets)} assets, {len(self.steps)} steps>'
+
+    @staticmethod
+    def _shape(result):
+        '''
+        The categories and associations containers of a result with their sizes, held rather than their ids
+        so that a new container cannot take the id of a replaced one.
+        '''
+        categories, links = result.get('categories'), result.get('associations')
+        return (categories, len(categories) if type(categories) is dict else 0, links, len(links) if type(links) is list else 0)
+
+    def describes(self, result):
+        '''
+        Whether the index is still over the given result: the same dictionary, categories and associations,
+        none of them grown or shrunk. Changes further down, such as an asset added to a category, are not seen.
+        '''
+        if result is not self.result:
+            return False
+        old, new = self.shape, self._shape(result)
+        return old[0] is new[0] and old[1] == new[1] and old[2] is new[2] and old[3] == new[3]
+
+    def category(self, asset):
+        '''
+        Name of the category declaring an asset, None if unknown.
+        '''
+        return self.categories.get(asset)
+
+    def asset(self, name):
+        '''
+        Asset dictionary by name, None if unknown.
+        '''
+        return self.assets.get(name)
+
+    def parent(self, asset):
+        '''
+        Name of the asset extended by an asset, None if it extends nothing.
+        '''
+        return self.parents.get(asset)
+
+    def children(self, asset):
+        '''
+        Names of the assets directly extending an asset.
+        '''
+        return list(self.subclasses.get(asset, ()))
+
+    def descendants(self, asset):
+        '''
+        Names of all assets extending an asset, directly or not, breadth first.
+        '''
+        found, queue, seen = [], collections.deque((asset,)), {asset}
+        while queue:
+            for child in self.subclasses.get(queue.popleft(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    found.append(child)
+                    queue.append(child)
+        return found
+
+    def ancestors(self, asset):
+        '''
+        Names of the assets an asset inherits from, nearest first.
+        '''
+        found, seen = [], {asset}
+        while (asset := self.parents.get(asset)) and asset not in seen:
+            seen.add(asset)
+            found.append(asset)
+        return found
+
+    def associations(self, asset):
+        '''
+        Associations with the asset on either side.
+        '''
+        return list(self.links.get(asset, ()))
+
+    def field(self, asset, field):
+        '''
+        The association and target asset reached from an asset through a field, None if unknown.
+        '''
+        return self.fields.get((asset, field))
+
+    def step(self, ref, step = None):
+        '''
+        Attribute dictionary of an attack step or defense, by 'Asset.step' or asset and step names.
+        '''
+        return self.steps.get(ref if step is None else f'{ref}.{step}')
+
+    def flatten(self, asset):
+        '''
+        Effective attributes of an asset including inherited ones, None if unknown.
+        Each asset is resolved once, raises SyntaxError on inheritance cycles and unknown parents.
+        '''
+        if asset in self.flattened or asset not in self.assets:
+            return self.flattened.get(asset)
+        chain = [asset]
+        while (parent := self.parents.get(chain[-1])) and parent not in self.flattened:
+            if parent not in self.assets:
+                raise SyntaxError(f"Asset '{chain[-1]}' extends unknown asset '{parent}'")
+            if parent in chain:
+                raise SyntaxError('Inheritance cycle: ' + ' -> '.join(chain[chain.index(parent):] + [parent]))
+            chain.append(parent)
+        for name in reversed(chain):
+            base = self.flattened.get(self.parents.get(name), {})
+            self.flattened[name] = self._inherit(base, self.assets[name].get('attributes'))
+        return self.flattened[asset]
+
+    @staticmethod
+    def _inherit(base, attributes):
+        '''
+        Override inherited attributes with an asset's own, appending +> targets to the inherited leads_to.
+        Attributes that need no merging are shared with the results, not copied.
+        '''
+        flat = dict(base)
+        for step, attr in (attributes.items() if type(attributes) is dict else ()):
+            if type(attr) is dict and type(attr.get('append')) is dict:
+                inherited = base.get(step) if type(base.get(step)) is dict else {}
+                targets = [x for d in (inherited.get('leads_to'), attr.get('leads_to'), attr['append']) if type(d) is dict for x in d.items()]
+                attr = {k: v for k, v in attr.items() if k != 'append'}
+                attr['leads_to'] = leads = {}
+                n = 0
+                for key, target in targets:
+                    if key.isdigit():
+                        key, n = str(n), n + 1
+                    leads[key] = target
+            flat[step] = attr
+        return flat
+
 class MalParser:
     '''
     Mal language parser that converts .mal files into JSON data.
     '''
+    # Files this large are memory-mapped rather than read into a string, None to never map them.
+    mmap_size = 2**26
 
-    def __init__(self, file, debug = False):
+    def __init__(self, file, debug = False, cache = None, trace = None):
         '''
         Create new instance without parsing the MAL source file yet.
+        Pass the same cache dictionary to several instances to share parsed includes.
+        Pass a demal.Tracer to record the work done, debug traces to stderr.
         '''
         self.src = file
         self.result = {}
         self.stop = True
         self.debug = debug
+        if trace is None and debug:
+            from .trace import Tracer, StderrSink
+            trace = Tracer(StderrSink())
+        self.tracer = trace
+        self.cache = {} if cache is None else cache
+        self.included = set()
+        self.conflicts = []
+        self.handler = Builder(self)
+        from .expression import Expressions
+        self.expressions = Expressions()
+        self._index = None
+        self._assets = None
+        self._input = None
+        self._shared = set()
+        self._links = (None, 0, None)
+        self._temporary = False
 
     def __repr__(self):
         '''
@@ -47,31 +814,144 @@ class MalParser:
         '''
         return json.dumps(self.result, sort_keys=True, indent=2)
 
+    # References to an instance inside its __add__ when only the expression being evaluated holds it:
+    # the expression, self, the argument of sys.getrefcount and the back reference of its Builder.
+    TEMPORARY = 4
+
     def __add__(self, other):
         '''
         Handle: addition, multiplication, bitwise-or.
-        The result will always be a union between both dictionaries.
-        '''
-        if isinstance(other, (dict, MalParser)):
-            new = MalParser(self.src, self.debug)
-            new.result = copy.deepcopy(self.result)
-            newdata = copy.deepcopy(other if type(other) is dict else other.result)
-            for key in newdata:
-                n, newer = new.result.get(key), newdata[key]
-                if type(n) == type(newer) == dict:
-                    if key == 'categories' and all(type(y) is dict and 'assets' in y and 'meta' in y for x in (n, newer) for y in x):
-                        for cat in n:
-                            for i in ('assets', 'meta'):
-                                n[cat][i].update(newer[cat][i])
-                    else:
-                        n.update(newer)
+        The result will always be a union between both dictionaries, copied from both, see merge().
+        A result of + that nothing else refers to is extended in place, so a + b + c, sum() and reduce() take linear time.
+        '''
+        if self._temporary and hasattr(sys, 'getrefcount') and sys.getrefcount(self) <= self.TEMPORARY:
+            self.update(other)
+            return self
+        new = MalParser.merge(self, other)
+        new._temporary = True
+        return new
+
+    def __radd__(self, other):
+        '''
+        Handle: reflected addition, multiplication, bitwise-or, with the other taken first.
+        A copy of this instance when other is 0, the start value of sum().
+        '''
+        new = MalParser.merge(self) if type(other) is int and other == 0 else MalParser.merge(other, self)
+        new._temporary = True
+        return new
+
+    # Let __add__ and __radd__ handle + * | for consistency.
+    __mul__ = __or__ = __add__
+    __rmul__ = __ror__ = __radd__
+
+    def __iadd__(self, other):
+        '''
+        Handle: in-place addition, multiplication, bitwise-or, merging a copy of the other into this instance.
+        '''
+        self.update(other)
+        return self
+
+    __imul__ = __ior__ = __iadd__
+
+    @classmethod
+    def merge(cls, *parsers, share = False):
+        '''
+        Combine the results of parsers or result dictionaries into a new instance, later ones taking precedence.
+        Merging is linear in the size of the inputs, see update() for share=True.
+        '''
+        first = next((x for x in parsers if isinstance(x, MalParser)), None)
+        new = cls(first.src, first.debug, trace=first.tracer) if first else cls(None)
+        with new._phase('merge', count=len(parsers)):
+            for other in parsers:
+                new.update(other, share)
+        return new
+
+    def update(self, other, share = False):
+        '''
+        Merge the results of a parser or a result dictionary into this instance.
+        Categories, assets, attack steps and metadata are merged by name, associations are appended unless already
+        present. Values defined differently on both sides are replaced and listed in conflicts as (path, old, new).
+        Data taken from the other is copied. With share=True it is referenced instead, and shared containers are
+        copied before merging, including or editing changes them in either instance; changing nested results by hand
+        would still change both.
+        '''
+        if not isinstance(other, (dict, MalParser)):
+            raise SyntaxError(f'MalParser does not support combining with {type(other)} objects.')
+        data = other if type(other) is dict else other.result
+        if not share:
+            shared = None
+        elif isinstance(other, MalParser) and other is not self:
+            shared = (self._shared, other._shared)
+        else:
+            shared = (self._shared,)
+        self._index = None
+        self._merge(self.__dict__, 'result', data, '', shared)
+
+    def _merge(self, parent, key, value, path, shared, depth = 0):
+        '''
+        Merge a value into parent[key] following the rules of update(), unset (None) values never override.
+        Depth is the nesting level of the value: results, categories, category, assets, asset, attributes, attack step.
+        '''
+        old = parent.get(key)
+        if old is value or value is None:
+            return
+        if old is None:
+            parent[key] = self._borrow(value, shared)
+        elif type(old) is dict and type(value) is dict and depth < 6:
+            target = self._own(parent, key)
+            for k, v in value.items():
+                child = f'{path}.{k}' if path else k
+                if depth == 0 and k == 'associations':
+                    self._merge_links(target, v, child, shared)
                 else:
-                    new.result[key] = newdata[key]
-            return new
-        raise SyntaxError(f'MalParser does not support combining with {type(other)} objects.')
+                    self._merge(target, k, v, child, shared, 6 if key == 'meta' else depth + 1)
+        elif old != value:
+            self.conflicts.append((path, old, value))
+            parent[key] = self._borrow(value, shared)
+
+    def _merge_links(self, result, links, path, shared):
+        '''
+        Append associations that are not present yet, identical ones are kept once.
+        '''
+        if type(links) is not list or type(result.get('associations')) is not list:
+            return self._merge(result, 'associations', links, path, shared, 6)
+        target = self._own(result, 'associations')
+        found = self._links
+        if found[0] is not target or found[1] != len(target):
+            found = (target, len(target), {self._link_key(x): i for i, x in enumerate(target)})
+        for link in links:
+            if (key := self._link_key(link)) not in found[2]:
+                found[2][key] = len(target)
+                target.append(self._borrow(link, shared))
+        self._links = (target, len(target), found[2])
 
-    # Let __add__ handle + * | for consistency.
-    __rmul__ = __mul__ = __ror__ = __or__ = __radd__ = __add__
+    @staticmethod
+    def _link_key(link):
+        '''
+        Hashable form of an association, equal for identical associations.
+        '''
+        return json.dumps(link, sort_keys=True)
+
+    def _borrow(self, value, shared):
+        '''
+        Reference a container from another instance, marking it as shared in both, or copy it when not sharing.
+        '''
+        if shared is None:
+            return self._clone(value)
+        if type(value) in (dict, list):
+            for x in shared:
+                x.add(id(value))
+        return value
+
+    def _own(self, parent, key):
+        '''
+        The container at parent[key], copied first if it is shared with another instance.
+        '''
+        value = parent[key]
+        if id(value) in self._shared:
+            value = parent[key] = copy.copy(value)
+            self._shared.update(id(x) for x in (value.values() if type(value) is dict else value) if type(x) in (dict, list))
+        return value
 
     def __getitem__(self, item):
         '''
@@ -81,26 +961,117 @@ class MalParser:
 
     def __iter__(self):
         '''
-        Allow iteration of assets using for loops.
+        Allow iteration of assets using for loops, in dot notation: category.asset
         '''
-        self.i = 0
-        self.assets = []
-        for cat in self.result.get('categories', []):
-            category = self.result['categories'][cat]
-            if type(category) is dict:
-                for asset in sorted(category.get('assets', [])):
-                    self.assets.append(f'{cat}.{asset}')
-        return self
+        return iter(self.index.names)
 
     def __next__(self):
         '''
-        Allow iteration of assets using for loops.
+        The next asset, so that next(parser) works as it did when the parser was its own iterator.
+        It keeps its own place, apart from for loops, and starts over once the assets run out.
+        '''
+        if self._assets is None:
+            self._assets = iter(self)
+        try:
+            return next(self._assets)
+        except StopIteration:
+            self._assets = None
+            raise
+
+    @property
+    def index(self):
+        '''
+        Lookup tables over the results, built on first use and rebuilt once the results are replaced or their
+        categories or associations are replaced, added to or removed from.
+        Call invalidate() after changing data inside a category or association by hand.
+        '''
+        if self._index is None or not self._index.describes(self.result):
+            self._index = Index(self.result)
+        return self._index
+
+    def invalidate(self):
+        '''
+        Drop the index so that it is rebuilt from the current results.
+        '''
+        self._index = None
+
+    def flatten(self):
+        '''
+        Effective attributes of every asset, following extends chains.
+        Overridden attack steps replace inherited ones, +> appends to the inherited leads_to.
+        '''
+        with self._phase('flatten'):
+            index = self.index
+            return {name: index.flatten(name) for name in index.assets}
+
+    def validate(self, locate = True):
+        '''
+        Check the results for references to unknown assets and fields, bad inheritance, invalid multiplicities
+        and expressions that do not resolve, see demal.validate. Returns a list of Diagnostic, empty if all is well.
+        With locate, diagnostics give the file, line and column of the declaration at fault.
         '''
-        if self.i >= len(self.assets):
-            del self.i, self.assets
-            raise StopIteration
-        self.i += 1
-        return self.assets[self.i - 1]
+        from .validate import validate
+        with self._phase('validate'):
+            return validate(self, locate)
+
+    def diff(self, other):
+        '''
+        Changes from these results to another MalParser, result dictionary or saved hash tree, see demal.diff.
+        Returns a list of Change, empty if the models are the same.
+        '''
+        from .diff import diff
+        with self._phase('diff'):
+            return diff(self, other)
+
+    def compile(self):
+        '''
+        Compile the results into an AttackGraph of integer step IDs and adjacency arrays, see demal.graph.
+        '''
+        from .graph import AttackGraph
+        with self._phase('compile'):
+            return AttackGraph.compile(self)
+
+    def load(self, file = None):
+        '''
+        Read JSON output back into the results, checking it against the output schema, see demal.schema.
+        Uses orjson when installed, raises SyntaxError with the JSON path of every problem.
+        '''
+        from . import schema
+        with self._phase('read'):
+            data, name = schema.read(file or self.src)
+        with self._phase('decode', file=name, size=len(data)):
+            result = schema.decode(data, name)
+        with self._phase('validate', file=name):
+            schema.check(result, name)
+        self.result = result
+        self.stop = False
+
+    def save_snapshot(self, file):
+        '''
+        Write the results to a binary snapshot file or stream, which loads faster than JSON, see demal.snapshot.
+        Returns the number of bytes written.
+        '''
+        from .snapshot import save
+        with self._phase('snapshot'):
+            return save(self.result, file)
+
+    def load_snapshot(self, file, categories = None):
+        '''
+        Read a snapshot written by save_snapshot() into the results, with every category or only those named.
+        Raises ValueError if the file is not a snapshot or fails its checksums.
+        '''
+        from .snapshot import Snapshot
+        with self._phase('read'):
+            snapshot = Snapshot(file)
+        with self._phase('decode', file=snapshot.name, size=len(snapshot.data)):
+            self.result = snapshot.load(categories)
+        self.stop = False
+
+    def _phase(self, name, **fields):
+        '''
+        Time a phase of work when tracing.
+        '''
+        return NOTRACE if self.tracer is None else self.tracer.phase(name, **fields)
 
     def quit(self, msg='Exiting.'):
         '''
@@ -110,74 +1081,141 @@ class MalParser:
         self.stop = True
         return 1 if CLI else None
 
-    def dump(self, out = None, pretty = True):
+    def dump(self, out = None, pretty = True, flatten = False):
+        '''
+        Output a JSON file with the results, streamed in chunks as it is encoded.
+        Pretty output is sorted and indented by two spaces, otherwise it is sorted and compact.
+        With flatten the effective attributes of every asset are added in a "flattened" section.
+        '''
+        with self._phase('dump'):
+            return self._write(itertools.chain(self.encode(pretty is True, flatten), '\n'), out, '.json')
+
+    def encode(self, pretty = True, flatten = False):
         '''
-        Output a JSON file with the results.
+        Generate the JSON document in chunks.
+        Compact output is encoded one category or association at a time.
         '''
-        pretty = pretty is True
-        output = 'output.json'
+        result = dict(self.result, flattened=self.flatten()) if flatten else self.result
+        if pretty:
+            yield from json.JSONEncoder(sort_keys=True, indent=2).iterencode(result)
+            return
+        dumps = functools.partial(json.dumps, sort_keys=True, separators=(',', ':'))
+        yield '{'
+        for i, key in enumerate(sorted(result)):
+            value = result[key]
+            yield (',' if i else '') + dumps(key) + ':'
+            if type(value) is dict and value:
+                yield '{'
+                for j, k in enumerate(sorted(value)):
+                    yield (',' if j else '') + dumps(k) + ':' + dumps(value[k])
+                yield '}'
+            elif type(value) is list and value:
+                yield '['
+                for j, x in enumerate(value):
+                    yield (',' if j else '') + dumps(x)
+                yield ']'
+            else:
+                yield dumps(value)
+        yield '}'
+
+    def _write(self, chunks, out, ext):
+        '''
+        Write generated text to a stream, to the given file, or to a file named after the source.
+        Regular files are written under a temporary name and renamed once complete. Special files such as /dev/null,
+        symbolic links and files in a directory that cannot be written to are written in place.
+        Returns the number of bytes written to a file, or characters to a stream.
+        '''
+        output = 'output' + ext
         if type(out) is str and out:
             output = out
         elif hasattr(out, 'write'):
-            for i in str(self).splitlines():
-                out.write(i + '\n')
-            return
+            return self._stream(chunks, out)
         elif type(self.src) is str:
-            output = self.src + '.json'
-        with io.open(output, 'w', newline='\n') as f:
-            json.dump(self.result, f, sort_keys=pretty, indent=pretty*2)
-            f.write('\n')
+            output = self.src + ext
+        tmp, f = f'{output}.{os.getpid()}.tmp', None
+        if not os.path.lexists(output) or os.path.isfile(output) and not os.path.islink(output):
+            with contextlib.suppress(OSError):
+                f = io.open(tmp, 'w', newline='\n')
+        if f is None:
+            with io.open(output, 'w', newline='\n') as f:
+                size = self._stream(chunks, f)
+            if os.path.isfile(output):
+                size = os.path.getsize(output)
+        else:
+            try:
+                with f:
+                    self._stream(chunks, f)
+                size = os.path.getsize(tmp)
+                os.replace(tmp, output)
+            except BaseException:
+                with contextlib.suppress(IOError):
+                    os.remove(tmp)
+                raise
+
+        print(f'{size} bytes written to {output}')
+        return size
 
-        print(f'{len(str(self)) + 1} bytes written to {output}')
+    @staticmethod
+    def _stream(chunks, f, buffer = 2**16):
+        '''
+        Write chunks of text in batches of about 64 KiB, counting the characters written.
+        '''
+        size, batch, n = 0, [], 0
+        for chunk in chunks:
+            batch.append(chunk)
+            n += len(chunk)
+            if n >= buffer:
+                f.write(''.join(batch))
+                size, batch, n = size + n, [], 0
+        f.write(''.join(batch))
+        return size + n
 
     def dump_mal(self, out = None):
         '''
-        Generate a MAL file from the results dictionary.
+        Generate a MAL file from the results dictionary, streamed in chunks as it is written.
+        Returns the number of bytes written to a file (characters to a stream), a failed dump leaves no file behind.
         '''
+        # Prevent empty file
+        if not self.result:
+            return self.quit('Error: empty file.')
         try:
-            # Prevent empty file
-            if not self.result:
-                return self.quit('Error: empty file.')
+            with self._phase('dump_mal'):
+                return self._write(self.encode_mal(), out, '.mal')
+        except ValueError as e:
+            return self.quit(e)
 
-            # Temporary file-like object
-            f = io.StringIO()
-            f.write(f'// Output from demal v{__version__}\n')
+    def encode_mal(self):
+        '''
+        Generate the MAL source of the results in chunks, one asset or association block at a time.
+        Raises ValueError when the results cannot be written as MAL.
+        '''
+        try:
+            yield f'// Output from demal v{__version__}\n'
 
             # Read strings first to keep them up top.
-            for key, value in self.result.items():
-                if type(value) is str:
-                    f.write(f'\n#{key}: "{value}"')
-            f.write('\n')
+            yield ''.join(f'\n#{key}: {self._quote(value)}' for key, value in self.result.items() if type(value) is str) + '\n'
 
             # Then process the other objects.
             for key, value in self.result.items():
                 if key == 'categories' and type(value) is dict:
                     for cname, category in value.items():
-                        self._dump_category(f, cname, category)
+                        yield from self._dump_category(cname, category)
                 elif key == 'associations' and type(value) is list:
-                    self._dump_associations(f, value)
+                    yield self._dump_associations(value)
                 elif self.debug:
                     print(f'Unrecognized MAL pattern:', repr(key), ':', repr(value), file=sys.stderr, flush=True)
         except Exception:
-            return self.quit('Current JSON configuration incompatible with MAL syntax.')
-
-        # Output to file or terminal.
-        f.seek(0)
-        output = 'output.mal'
-        if type(out) is str and out:
-            output = out
-        elif hasattr(out, 'write'):
-            for i in f.read().splitlines():
-                out.write(i + '\n')
-            return
-        elif type(self.src) is str:
-            output = self.src + '.mal'
-        with io.open(output, 'w', newline='\n') as file:
-            f.seek(0)
-            file.write(f.read())
+            from .schema import validate
+            errors = validate(self.result)
+            raise ValueError(f'Current JSON configuration incompatible with MAL syntax: {errors[0]}' if errors else
+                             'Current JSON configuration incompatible with MAL syntax.') from None
 
-        f.seek(0)
-        print(f'{len(f.read()) + 1} bytes written to {output}')
+    @staticmethod
+    def _quote(value):
+        '''
+        Quote a string for MAL output, escaping what the lexer would otherwise unescape.
+        '''
+        return '"' + GRAMMAR.unsafe.sub(lambda m: '\\' + m.group(), str(value)) + '"'
 
     @staticmethod
     def _dump_meta(obj, indent_level = 1):
@@ -188,36 +1226,33 @@ class MalParser:
         indent = '  ' * indent_level
         if type(obj) is dict and 'meta' in obj and type(obj['meta']) is dict:
             for key, value in obj['meta'].items():
-                meta.append(f'{indent}{key}: "{value}"')
+                meta.append(f'{indent}{key}: {MalParser._quote(value)}')
         return '\n'.join(meta)
 
-    def _dump_category(self, f, cname, cat):
+    def _dump_category(self, cname, cat):
         '''
         Category helper for generating MAL files.
         '''
         meta = self._dump_meta(cat)
-        f.write(f'\ncategory {cname}')
-        f.write(f'\n{meta}\n{{\n' if meta else ' {\n')
+        yield f'\ncategory {cname}' + (f'\n{meta}\n{{\n' if meta else ' {\n')
         first = True
         for name, asset in cat['assets'].items():
-            if not first:
-                f.write('\n')
+            yield self._dump_asset(name, asset, first)
             first = False
-            self._dump_asset(f, name, asset)
-        f.write('}\n')
+        yield '}\n'
 
-    def _dump_asset(self, f, name, asset):
+    def _dump_asset(self, name, asset, first = True):
         '''
-        Asset helper for generating MAL files.
+        Asset helper for generating MAL files, returns the whole asset block.
         '''
+        f = [] if first else ['\n']
         meta = self._dump_meta(asset, 2)
         abstract = 'abstract ' if asset['abstract'] else ''
         extends = ' extends ' + asset['extends'] if asset['extends'] else ''
-        f.write(f'  {abstract}asset {name}{extends}')
-        f.write(f'\n{meta}\n  {{\n' if meta else ' {\n')
+        f.append(f'  {abstract}asset {name}{extends}')
+        f.append(f'\n{meta}\n  {{\n' if meta else ' {\n')
 
-        kinds = dict(zip('or and defense exists lacks'.split(), '| & # E !E'.split()))
-        sym = dict(zip('append leads_to require'.split(), '+> -> <-'.split()))
+        symbols, ops = GRAMMAR.symbols, GRAMMAR.ops
         for a_name, attr in asset['attributes'].items():
             # First line
             a = []
@@ -228,133 +1263,518 @@ class MalParser:
             if attr['tags']:
                 for tag in attr['tags']:
                     a.append('@' + tag)
-            f.write(f'    {kinds[attr["type"]]} {a_name}' + (' ' if a else '') + ' '.join(a))
+            f.append(f'    {symbols[attr["type"]]} {a_name}' + (' ' if a else '') + ' '.join(a))
 
             # Possible metadata
             meta = self._dump_meta(attr, 3)
-            f.write(f'\n{meta}\n' if meta else '\n')
+            f.append(f'\n{meta}\n' if meta else '\n')
 
             # Attributes
             for key in attr:
-                if key in sym:
-                    for i, expr in enumerate(attr[key].items()):
-                        k, v = expr
-                        expr = v if k.isdigit() else f'let {k} = {v}'
-                        if i == 0:
-                            f.write(f'{"":6}{sym[key]} {expr}')
-                        else:
-                            f.write(f',\n{"":9}{expr}')
-                    f.write('\n')
+                if key in ops:
+                    exprs = [v if k.isdigit() else f'let {k} = {v}' for k, v in attr[key].items()]
+                    f.append(f'{"":6}{ops[key]} ' + f',\n{"":9}'.join(exprs) + '\n' if exprs else '\n')
 
-        f.write('  }\n')
+        f.append('  }\n')
+        return ''.join(f)
 
-    def _dump_associations(self, f, associations):
+    def _dump_associations(self, associations):
         '''
-        Association helper for generating MAL files.
+        Association helper for generating MAL files, returns the whole associations block.
         '''
-        f.write('\nassociations {\n')
+        f = ['\nassociations {\n']
         for a in associations:
-            f.write(f'  {a["asset_l"]} [{a["field_l"]}] {a["mult_l"]} <-- {a["name"]} --> {a["mult_r"]} [{a["field_r"]}] {a["asset_r"]}')
+            f.append(f'  {a["asset_l"]} [{a["field_l"]}] {a["mult_l"]} <-- {a["name"]} --> {a["mult_r"]} [{a["field_r"]}] {a["asset_r"]}')
             meta = self._dump_meta(a, 2)
-            f.write(f'\n{meta}\n' if meta else '\n')
-        f.write('}\n')
+            f.append(f'\n{meta}\n' if meta else '\n')
+        f.append('}\n')
+        return ''.join(f)
+
+    def iterate(self, file, mapped = True):
+        '''
+        Tokenize a file or file-like object.
+        Files of at least mmap_size bytes are memory-mapped and scanned as UTF-8 bytes, unless mapped is False.
+        '''
+        name = getattr(file, 'name', file)
+        if mapped and self.mmap_size is not None and type(file) is str and os.path.getsize(file) >= max(self.mmap_size, 1):
+            phase = self._phase('map', file=name)
+            phase.__enter__()
+            try:
+                with open(file, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(data, 'madvise'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                code = Lexer(data, name, self.tracer)
+            except BaseException:
+                phase.__exit__(None, None, None)
+                raise
+            # Tokens are scanned as the parser reads them, the phase ends with the scan.
+            code.tokens = self._scanned(code.tokens, phase)
+            return code
+        file = file if hasattr(file, 'read') else open(file)
+        with file as f, self._phase('read', file=name):
+            return Lexer(f.read(), name, self.tracer)
 
-    def iterate(self, file):
+    @staticmethod
+    def _scanned(tokens, phase):
         '''
-        Iterate a file line by line.
+        Pass tokens through, ending a phase once they are all scanned or scanning stops.
         '''
         try:
-            file = file if hasattr(file, 'read') else open(file)
-            with file as f:
-                data = f.read()
-
-                # Remove comments.
-                # https://codegolf.stackexchange.com/a/48346/79525 :D
-                regex = r'("[^\n]*"(?!\\))|(//[^\n]*$|/(?!\\)\*[\s\S]*?\*(?!\\)/)'
-                for comment in re.findall(regex, data, re.MULTILINE):
-                    data = data.replace(comment[1], '')
-
-                # Yield non-empty lines.
-                for line in data.splitlines():
-                    if not self.stop and (L := line.strip()):
-                        if self.debug:
-                            print(w + inspect.stack()[1].function, z + 'got:' + r, repr(L) + z, file=sys.stderr, flush=True)
-                        yield L
+            yield from tokens
+        finally:
+            phase.__exit__(None, None, None)
+
+    def feed(self, chunk):
+        '''
+        Parse the next chunk of MAL source, text or UTF-8 bytes, as soon as top-level declarations complete.
+        Returns the declarations completed by the chunk, as result dictionaries that are also merged into the results.
+        '''
+        return self._feed(chunk, False)
+
+    def close(self):
+        '''
+        End the input given to feed(), reporting incomplete declarations.
+        '''
+        return self._feed('', True)
+
+    def _feed(self, chunk, final):
+        '''
+        Buffer a chunk and parse the declarations it completes, includes are followed in place.
+        '''
+        if self._input is None:
+            self._input, self.stop, self.included = Feed(), False, set()
+        feed, fragments = self._input, []
+        path = os.path.realpath(self.src) if type(self.src) is str else None
+        name = self.src if type(self.src) is str else getattr(self.src, 'name', '<stream>')
+
+        def include(tok, file):
+            '''
+            Parse the file a completed declaration includes, if any.
+            '''
+            if file is not None:
+                self.parse_file(self.resolve(file, path), (path,))
+
+        try:
+            feed.push(chunk, final)
+            spans = feed.cut(final)
+            for start, end, line in spans:
+                result, self.result = self.result, {}
+                try:
+                    with self._phase('parse', file=name, line=line):
+                        self.parse_statements(Lexer(feed.data, name, self.tracer, start, end, line), include)
+                finally:
+                    fragment, self.result = self.result, result
+                self.merge_fragment(fragment)
+                fragments.append(fragment)
+            if spans:
+                feed.trim(spans[-1][1])
+                self._index = None
         except BrokenPipeError:
             pass
-        except IOError:
-            self.quit(f'Error while opening {file}')
+        except IOError as e:
+            self._input = None
+            return self.quit(f'Error while opening {e.filename}')
+        except SyntaxError as e:
+            self._input = None
+            return self.quit(str(e))
+        if final:
+            self._input = None
+        return fragments
 
-    def parse(self, file = None):
+    def parse_stream(self, file, size = 2**16):
+        '''
+        Parse a file-like object chunk by chunk, generating declarations as they complete.
+        '''
+        while (chunk := file.read(size)):
+            fragments = self.feed(chunk)
+            if self.stop:
+                return
+            yield from fragments
+        fragments = self.close()
+        if not self.stop:
+            yield from fragments
+
+    async def parse_async(self, reader, size = 2**16):
+        '''
+        Parse from an async reader (such as asyncio.StreamReader) or an async iterable of chunks,
+        generating declarations as they complete.
+        '''
+        if hasattr(reader, 'read'):
+            async def chunks(read):
+                while (chunk := await read(size)):
+                    yield chunk
+            reader = chunks(reader.read)
+        async for chunk in reader:
+            fragments = self.feed(chunk)
+            if self.stop:
+                return
+            for fragment in fragments:
+                yield fragment
+        fragments = self.close()
+        for fragment in fragments if not self.stop else ():
+            yield fragment
+
+    def handle(self, handler, file = None):
+        '''
+        Parse a file calling the methods of a Handler for every event, without building the results.
+        Includes are passed to the handler rather than followed, raises SyntaxError on invalid input.
+        '''
+        collections.deque(self.statements(self.iterate(file or self.src), handler), 0)
+
+    def events(self, file = None):
+        '''
+        Generate the parse events of a file as tuples, e.g. ('asset', 'Host', None, False), without building the results.
+        Events are generated after each top-level declaration, stop iterating to stop parsing.
+        '''
+        events = []
+        for _ in self.statements(self.iterate(file or self.src), Events(events.append)):
+            yield from events
+            events.clear()
+
+    def parse(self, file = None, incremental = False):
         '''
         Parse individual files, recursively evaluating includes/imports.
+        Incremental parsing keeps the source and its blocks around for later calls to edit().
         '''
         self.stop = False
+        self.included = set()
+        self._index = None
         file = file if file else self.src
-        code = self.iterate(file)
+        try:
+            if incremental:
+                self.parse_source(self.iterate(file, False), os.path.realpath(file) if type(file) is str else None)
+            else:
+                self.parse_file(file)
+        except BrokenPipeError:
+            pass
+        except IOError as e:
+            return self.quit(f'Error while opening {e.filename or file}')
+        except SyntaxError as e:
+            return self.quit(str(e))
+
+    def parse_file(self, file, chain = ()):
+        '''
+        Parse a file and merge it into the results, evaluating its includes in place.
+        Each file is included once per parse, included files are parsed once per cache.
+        '''
+        path = os.path.realpath(file) if type(file) is str else None
+        if path in chain:
+            names = ' -> '.join(os.path.relpath(x) for x in chain[chain.index(path):] + (path,))
+            raise SyntaxError(f'Include cycle: {names}')
+        if path in self.included:
+            return
+        self.included.add(path)
+
+        # Only included files are cached, the root file is merged as it is.
+        fragment, key = None, None
+        if chain:
+            st = os.stat(path)
+            key = (path, st.st_mtime_ns, st.st_size)
+            fragment = self.cache.get(key)
+            if self.tracer is not None:
+                self.tracer.include(chain[-1], path, fragment is not None)
+        if fragment is None:
+            fragment = self.parse_fragment(file, path)
+            if key:
+                self.cache[key] = fragment
+
+        for part in fragment:
+            if type(part) is str:
+                self.parse_file(part, chain + (path,))
+            else:
+                self.merge_fragment(self._clone(part) if key else part)
+
+    def parse_fragment(self, file, path):
+        '''
+        Parse the top-level declarations of a single file without following includes.
+        Returns the declarations as a list of result dictionaries split by resolved include paths.
+        '''
+        result, fragment = self.result, [{}]
+        self.result = fragment[0]
 
-        # Regular expressions for the main declarations
-        r_define = re.compile(r'#(\w+):\s*"(.*)"')
-        r_include = re.compile(r'include "(.*)"')
-        r_category = re.compile(r'category \w+')
-        r_associations = re.compile(r'associations\s*\{$')
+        def split(tok, include):
+            '''
+            Start a new fragment after each include, keeping the file it names.
+            '''
+            if include is not None:
+                fragment.extend((self.resolve(include, path), {}))
+                self.result = fragment[-1]
 
-        # Parse each line
         try:
-            for line in code:
-                if (r := r_define.match(line)):
-                    self.result[r.group(1)] = r.group(2)
-                elif (r := r_include.match(line)):
-                    self.parse(r.group(1))
-                elif r_category.match(line):
-                    self.parse_category(code, line)
-                elif r_associations.match(line):
-                    self.parse_associations(code, line)
-                else:
-                    return self.quit(f'Improper syntax: {repr(line)}')
+            code = self.iterate(file)
+            with self._phase('parse', file=code.name):
+                self.parse_statements(code, split)
+        finally:
+            self.result = result
+        return fragment
+
+    def parse_statements(self, code, handle):
+        '''
+        Parse every top-level declaration of a token stream into the results.
+        After each one, handle receives its first token and the file it includes, if any.
+        '''
+        for tok, include in self.statements(code):
+            handle(tok, include)
+
+    def statements(self, code, handler = None):
+        '''
+        Parse the top-level declarations of a token stream one at a time, generating their first token and the file
+        they include, if any. Events go to the given handler, by default to the one building the results.
+        '''
+        try:
+            for tok in code:
+                previous, self.handler = self.handler, handler or self.handler
+                try:
+                    include = self.parse_statement(code, tok)
+                finally:
+                    self.handler = previous
+                yield tok, include
         except StopIteration:
-            if self.stop == False:
-                return self.quit(f'Incomplete script at:\n {repr(line)}')
+            raise SyntaxError(f'Incomplete script at:\n {repr(code.line(code.last))}') from None
+        except (SyntaxError, IOError):
+            raise
         except Exception as e:
-            return self.quit(f'Error at: {repr(line)}\nMessage: {e}')
+            raise SyntaxError(f'Error at: {repr(code.line(code.last))}\nMessage: {e}') from None
+
+    def parse_statement(self, code, tok):
+        '''
+        Parse a top-level declaration, returning the file name if it is an include.
+        '''
+        if tok[:2] == ('op', '#'):
+            key = code.expect('name').value
+            code.expect('op', ':')
+            self.handler.define(key, code.expect('string').value)
+        elif tok[:2] == ('name', 'include'):
+            include = code.expect('string').value
+            self.handler.include(include)
+            return include
+        elif tok[:2] == ('name', 'category'):
+            self.parse_category(code, tok)
+        elif tok[:2] == ('name', 'associations'):
+            self.parse_associations(code, tok)
+        else:
+            raise code.error(tok)
+
+    @staticmethod
+    def resolve(include, path):
+        '''
+        Resolve an include relative to the including file, or to the working directory.
+        '''
+        return os.path.join(os.path.dirname(path), include) if path else include
+
+    def parse_source(self, code, path = None):
+        '''
+        Parse a whole token stream into blocks that edit() can later update one at a time.
+        '''
+        self.source, self.name, self.path = code.data, code.name, path
+        self.blocks = None
+        with self._phase('parse', file=code.name):
+            self.blocks = self.parse_blocks(code)
+        self.rebuild()
+
+    def parse_blocks(self, code):
+        '''
+        Parse top-level declarations into separate blocks with their own results.
+        '''
+        result, blocks = self.result, []
+
+        def add(tok, include):
+            '''
+            Record a declaration as a block, with its own results unless it is an include.
+            '''
+            blocks.append(Block(tok.start, code.last.end, tok.line, code.last.line, None if include is not None else self.result, include))
+            self.result = {}
+
+        self.result = {}
+        try:
+            self.parse_statements(code, add)
+        finally:
+            self.result = result
+        return blocks
+
+    def rebuild(self):
+        '''
+        Merge all blocks into the results, resolving includes that are not resolved yet.
+        '''
+        self.result, self.included = {}, {self.path}
+        for block in self.blocks:
+            if block.include is not None:
+                if block.result is None:
+                    sub = MalParser(self.resolve(block.include, self.path), self.debug, self.cache, self.tracer)
+                    sub.included = set(self.included)
+                    sub.parse_file(sub.src, (self.path,))
+                    block.result, block.included = sub.result, sub.included
+                self.included = set(block.included)
+            self.merge_fragment(block.result)
+        self.providers = collections.Counter(x for block in self.blocks for x in block.provides())
 
-    def parse_header(self, code, line, cat=None):
+    def edit(self, start, end, text):
+        '''
+        Replace the source between two positions and re-parse only the top-level declarations it touches.
+        Positions are offsets or (line, column) pairs counted from 1, like token positions.
+        Requires a previous parse(incremental=True) and returns the same as parse().
+        '''
+        if getattr(self, 'source', None) is None:
+            raise SyntaxError('MalParser.edit() requires parse(incremental=True) first.')
+        a, b = self._offset(start), self._offset(end)
+        if not 0 <= a <= b <= len(self.source):
+            raise SyntaxError(f'Edit range {start}-{end} is outside of the source.')
+        old, blocks = self.source, self.blocks
+        self.source = source = old[:a] + text + old[b:]
+        self.stop = False
+        self._index = None
+        if blocks is None:
+            return self.reparse()
+
+        # Blocks touching the edit, or sharing a line with it, are parsed again along with the gaps around them.
+        i = self._search(blocks, lambda x: x.end >= a)
+        j = self._search(blocks, lambda x: x.start > b)
+        while i and '\n' not in old[blocks[i-1].end:a]:
+            i -= 1
+        while j < len(blocks) and '\n' not in old[b:blocks[j].start]:
+            j += 1
+        delta = len(text) - (b - a)
+        lo, line = (blocks[i-1].end, blocks[i-1].last) if i else (0, 1)
+        hi = blocks[j].start + delta if j < len(blocks) else len(source)
+        try:
+            new = self.parse_blocks(Lexer(source, self.name, self.tracer, lo, hi, line))
+        except SyntaxError:
+            return self.reparse()
+
+        lines = text.count('\n') - old.count('\n', a, b)
+        for block in blocks[j:]:
+            block.start, block.end, block.line, block.last = block.start + delta, block.end + delta, block.line + lines, block.last + lines
+        old = blocks[i:j]
+        blocks[i:j] = new
+
+        # Update the results in place when the same uniquely named declarations were re-parsed.
+        provides = [x for block in new for x in block.provides()]
+        if all(x.include is None for x in old + new) and provides == [x for block in old for x in block.provides()] \
+                and all(self.providers[x] == 1 for x in provides):
+            for block in new:
+                for key, value in block.result.items():
+                    if key == 'categories':
+                        self._own(self.result, 'categories').update(value)
+                    elif key == 'associations':
+                        self.result['associations'] = list(value)
+                    else:
+                        self.result[key] = value
+            return
+
+        # Otherwise merge every block again, resolving includes that may now differ.
+        if any(x.include is not None for x in old + new):
+            for block in blocks[i:]:
+                if block.include is not None:
+                    block.result = None
+        try:
+            self.rebuild()
+        except (SyntaxError, IOError) as e:
+            self.blocks = None
+            return self.quit(str(e))
+
+    def reparse(self):
+        '''
+        Parse the whole edited source again.
+        '''
+        try:
+            self.parse_source(Lexer(self.source, self.name, self.tracer), self.path)
+        except (SyntaxError, IOError) as e:
+            return self.quit(str(e))
+
+    def _offset(self, pos):
+        '''
+        Convert a (line, column) position to an offset in the source.
+        '''
+        if type(pos) is int:
+            return pos
+        line, col = pos
+        offset, n = 0, 1
+        if self.blocks and (i := self._search(self.blocks, lambda x: x.line >= line)):
+            offset, n = self.source.rfind('\n', 0, self.blocks[i-1].start) + 1, self.blocks[i-1].line
+        while n < line:
+            offset = self.source.index('\n', offset) + 1
+            n += 1
+        return offset + col - 1
+
+    @staticmethod
+    def _search(items, found):
+        '''
+        Binary search for the first item where found() becomes true.
+        '''
+        lo, hi = 0, len(items)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if found(items[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def merge_fragment(self, part):
+        '''
+        Merge declarations into the results the same way parsing them in place would.
+        '''
+        for key, value in part.items():
+            if key == 'categories':
+                self.result.setdefault(key, {})
+                self._own(self.result, key).update(value)
+            elif key == 'associations':
+                self.result.setdefault(key, [])
+                self._own(self.result, key).extend(value)
+            else:
+                self.result[key] = value
+
+    @staticmethod
+    def _clone(obj):
         '''
-        Parse category or asset section header.
+        Copy a parsed fragment, which only holds dicts, lists and scalars.
         '''
-        r_asset = re.compile(r'(abstract)?\s*[Aa]sset (\w+)( extends (\w+))?')
-        r_cat = re.compile(r'category (\w+)')
-        r_meta = re.compile(r'([\w ]+):\s*"(.*)"')
+        if type(obj) is dict:
+            return {k: MalParser._clone(v) for k, v in obj.items()}
+        if type(obj) is list:
+            return [MalParser._clone(x) for x in obj]
+        return obj
 
+    def parse_header(self, code, tok, asset = False):
+        '''
+        Parse category or asset section header, returning its name.
+        '''
         # Name and possible asset inheritance options
-        if (r := r_asset.match(line)):
-            abstract, name, _, extends = r.groups()
-            section = cat['assets'][name] = {
-                'meta': {},
-                'attributes': {},
-                'extends': extends,
-                'abstract': abstract is not None
-            }
-        elif (r := r_cat.match(line)):
-            if 'categories' not in self.result:
-                self.result['categories'] = {}
-            section = self.result['categories'][r.group(1)] = {
-                'meta': {},
-                'assets': {}
-            }
+        if not asset and tok[:2] == ('name', 'category'):
+            name = code.expect('name').value
+            self.handler.category(name)
+        elif asset and tok.kind == 'name':
+            abstract = tok.value == 'abstract'
+            if abstract:
+                tok = next(code)
+            if tok.kind != 'name' or tok.value not in ('asset', 'Asset'):
+                raise code.error(tok)
+            name, extends = code.expect('name').value, None
+            if (nxt := code.peek()) and nxt[:2] == ('name', 'extends'):
+                next(code)
+                extends = code.expect('name').value
+            self.handler.asset(name, extends, abstract)
         else:
-            self.quit(f'Improper syntax: {repr(line)}')
+            raise code.error(tok)
 
         # Metadata
-        if '{' not in line:
-            while '{' not in (line := next(code)):
-                if (r := r_meta.match(line)):
-                    section['meta'][r.group(1)] = r.group(2)
+        while (tok := next(code))[:2] != ('op', '{'):
+            self.parse_meta(code, tok)
+        return name
 
-        # Reference to the whole section
-        return section
+    def parse_meta(self, code, tok):
+        '''
+        Parse a metadata entry, e.g. user info: "text"
+        '''
+        words = [tok]
+        while tok.kind == 'name':
+            words.append(tok := next(code))
+        if len(words) < 2 or tok[:2] != ('op', ':'):
+            raise code.error(tok)
+        self.handler.meta(code.text(words[:-1]), code.expect('string').value)
 
-    def parse_asset(self, code, asset):
+    def parse_asset(self, code):
         '''
         Parse an asset body.
 
@@ -381,115 +1801,394 @@ class MalParser:
         @debug   (securiCAD only) show only while testing
         @trace   (securiCAD only) trace intermediary steps, e.g. userAccount.assume -> action.perform
         '''
-        r_attr = re.compile(r'([|&#E]{1}|[!E]{2})\s+(\w+)(\s+\[([\w(). ,]+)\])?')
-        r_cia = re.compile(r'{\s*([CIA])(,\s*([CIA])(,\s*([CIA]))?)?\s*}')
-        r_meta = re.compile(r'([\w ]+):\s*"(.*)"')
-        kinds = dict(zip('| & # E !E'.split(), 'or and defense exists lacks'.split()))
-        sym = dict(zip('+> -> <-'.split(), 'append leads_to require'.split()))
-        last_attr = None
-
-        while '}' not in (line := next(code)):
-            if (r := r_attr.match(line)) and r.group(1) in kinds:
-                kind, name, _, prob = r.groups()
-                cia = r_cia.search(line)
-                last_attr = asset[name] = {
-                    'meta': {},
-                    'type': kinds[kind],
-                    'probability': prob,
-                    'cia': sorted(set(cia.groups()[::2]), key='CIA'.find) if cia else None,
-                    'tags': [x[1:] for x in line.split() if x in ('@hidden', '@debug', '@trace')]
-                }
-            elif (r := r_meta.match(line)) and last_attr:
-                last_attr['meta'][r.group(1)] = r.group(2)
-            elif (pre := line.split()[0]) in sym:
-                field = last_attr[sym[pre]] = last_attr[sym[pre]] if sym[pre] in last_attr else {}
-                line = line[2 + (not line[0].isalpha()):]
-                self.parse_expression(code, line, field)
+        kinds, sym, handler = GRAMMAR.kinds, GRAMMAR.sym, self.handler
+        counts = None
+
+        while (tok := next(code))[:2] != ('op', '}'):
+            kind = tok.value
+            if tok[:2] == ('op', '!') and (nxt := code.peek()) and nxt[:2] == ('name', 'E'):
+                kind = '!' + next(code).value
+            if kind in kinds and (tok.kind == 'op' or not code.meta_ahead(tok)):
+                name = code.expect('name').value
+                prob, cia, tags = None, None, []
+                while (nxt := code.peek()) and nxt.kind == 'op' and nxt.value in ('[', '{', '@'):
+                    next(code)
+                    if nxt.value == '[':
+                        prob = code.text(code.until(nxt, ']')) or None
+                    elif nxt.value == '{':
+                        letters = [x for x in code.until(nxt, '}') if x.value != ',']
+                        for x in letters:
+                            if x.value not in GRAMMAR.cia:
+                                raise code.error(x)
+                        cia = sorted({x.value for x in letters}, key=GRAMMAR.cia.index) or None
+                    elif (tag := code.expect('name').value) in GRAMMAR.tags:
+                        tags.append(tag)
+                handler.attribute(name, kinds[kind], prob, cia, tags)
+                counts = {}
+            elif tok.kind == 'op' and tok.value in sym and counts is not None:
+                field = sym[tok.value]
+                counts[field] = self.parse_expression(code, tok, field, counts.get(field, 0))
+            elif tok.kind == 'name' and counts is not None:
+                self.parse_meta(code, tok)
             else:
-                self.quit(f'Improper syntax: {repr(line)}')
+                raise code.error(tok)
 
-    def parse_expression(self, code, line, field):
+    def parse_expression(self, code, tok, field, i = 0):
         '''
-        Parse asset expressions.
+        Parse asset expressions, one per line, with continuation lines ending in a comma.
+        Expressions are numbered from i, let variables are named, returns the next number.
+        Each distinct expression is checked once, into the syntax trees of self.expressions.
         '''
-        r_let = re.compile(r'let ([A-Za-z_]\w*)\s*=\s*"?([^"]+)"?')
-        m = [int(x) for x in field if x.isdigit()]
-        i = max(m) + 1 if m else 0
+        line = code.rest(tok) or code.rest(next(code), True)
         while 1:
-            if (r := r_let.match(line)):
-                name, value = r.groups()
+            comma = line[-1][:2] == ('op', ',')
+            if comma:
+                line.pop()
+            if len(line) > 3 and line[0][:2] == ('name', 'let') and line[1].kind == 'name' and line[2][:2] == ('op', '='):
+                name, line = line[1].value, line[3:]
             else:
-                name, value, i = (i, line, i+1)
-            field[str(name)] = value.rstrip(',')
-            if not line.endswith(','):
-                break
-            line = next(code)
+                name, i = str(i), i + 1
+            value = code.text(line)
+            self.expressions.parse(value, code, line)
+            self.handler.expression(field, name, value)
+            if not comma:
+                return i
+            line = code.rest(next(code), True)
 
-    def parse_category(self, code, line):
+    def parse_category(self, code, tok):
         '''
         Parse the category directive.
         '''
-        category = self.parse_header(code, line)
-        while '}' not in (line := next(code)):
-            asset = self.parse_header(code, line, category)
-            self.parse_asset(code, asset['attributes'])
+        category = self.parse_header(code, tok)
+        while (tok := next(code))[:2] != ('op', '}'):
+            asset = self.parse_header(code, tok, True)
+            self.parse_asset(code)
+            self.handler.asset_end(asset)
+        self.handler.category_end(category)
 
-    def parse_associations(self, code, line):
+    def parse_associations(self, code, tok):
         '''
         Parse the association directive.
         '''
-        r_association = re.compile(r'(\w+)\s+\[(\w+)\]\s+([\d*.]+)\s+<--\s*(\w+)\s*-->\s+([\d*.]+)\s+\[(\w+)\]\s+(\w+)')
-        r_meta = re.compile(r'([\w ]+):\s*"(.*)"')
+        code.expect('op', '{')
         last_link = None
 
-        while '}' not in (line := next(code)):
-            if (r := r_association.match(line)):
-                asset_l, field_l, mult_l, link, mult_r, field_r, asset_r = r.groups()
-                if 'associations' not in self.result:
-                    self.result['associations'] = []
-                self.result['associations'].append({
-                    'name': link,        'meta': {},
-                    'asset_l': asset_l,  'asset_r': asset_r,
-                    'field_l': field_l,  'field_r': field_r,
-                    'mult_l' : mult_l,   'mult_r' : mult_r
-                })
-                last_link = self.result['associations'][-1]
-            elif (r := r_meta.match(line)) and last_link:
-                last_link['meta'][r.group(1)] = r.group(2)
+        while (tok := next(code))[:2] != ('op', '}'):
+            if tok.kind == 'name' and (nxt := code.peek()) and nxt[:2] == ('op', '['):
+                asset_l = tok.value
+                code.expect('op', '[')
+                field_l = code.expect('name').value
+                code.expect('op', ']')
+                mult_l = code.multiplicity(tok, '<--')
+                link = code.expect('name').value
+                code.expect('op', '-->')
+                mult_r = code.multiplicity(tok, '[')
+                field_r = code.expect('name').value
+                code.expect('op', ']')
+                asset_r = code.expect('name').value
+                last_link = link
+                self.handler.association(link, asset_l, field_l, mult_l, mult_r, field_r, asset_r)
+            elif tok.kind == 'name' and last_link:
+                self.parse_meta(code, tok)
             else:
-                self.quit(f'Improper syntax: {repr(line)}')
+                raise code.error(tok)
 
 def cli(arg):
     '''
     Handle command line arguments.
     '''
     usage = f'''
-{w}Usage:{z} demal <{g}input{z}> [{c}output{z}] [-r|--reverse] [{y}debug{z}] [-v|--version]
+{w}Usage:{z} demal <{g}input{z}> [{c}output{z}] [-r|--reverse] [-c|--compact] [-f|--flatten] [{y}debug{z}] [--trace {b}file{z}] [-v|--version] [--cache {b}dir{z}] [--cache-stats]
+       demal <{g}input{z}>... [-o|--output-dir {c}dir{z}] [-j|--jobs {b}n{z}] [-r|--reverse] [-c|--compact] [-f|--flatten] [--cache {b}dir{z}] [--cache-stats]
+       demal --check[=json] <{g}input{z}>... [-j|--jobs {b}n{z}]
+       demal --diff[=json] <{g}old{z}> <{g}new{z}> [--cache {b}dir{z}]
+       demal --serve [{b}socket{z}]
+       demal --connect {b}socket{z} <{g}input{z}> [{c}output{z}] [-r|--reverse] [-c|--compact] [-f|--flatten]
 
 {w}Read from stdin when {g}input {w}is {r}- {w}and write to stdout when {c}output {w}is {r}-
 
 {w}By default{z} .mal {w}or{z} .json {w}is appended to the output filename, depending on the source, else{z} output.mal {w}or{z} output.json {w}is used.
 
-Append {y}debug {w}to print parser trace messages.{z}
+Append {y}debug {w}to print parser trace messages, use{z} --compact {w}for JSON without whitespace.
+Add{z} --flatten {w}to include the effective attack steps of every asset, inherited ones included.
+Add{z} --trace {b}file{w} to record phase timings, lines read per parse method and includes as JSON lines.
+
+{w}Convert many files at once when given an output directory, a directory, a glob or more than two inputs.
+Directories are searched for{z} .mal {w}(or{z} .json{w}) files, {b}n{w} worker processes are used (default: all cores).
+
+{w}Reuse parse results from a cache {b}dir{w} (or{z} DEMAL_CACHE{w}) of at most{z} DEMAL_CACHE_SIZE {w}MB (default 256).
+Add{z} --cache-stats {w}to print its hit rate and size.
+
+{w}Check models for unknown assets and fields, bad inheritance, invalid multiplicities and unresolved expressions
+with{z} --check{w}, printing{z} file:line:column: severity: message [code] {w}lines, or JSON lines with{z} --check=json{w}.
+
+{w}Compare two models, MAL or JSON output, with{z} --diff{w}, printing{z} + {w}(added){z} - {w}(removed) or{z} ~ {w}(modified) and a path
+such as{z} System.Host.access.leads_to {w}per line, or JSON lines with{z} --diff=json{w}. Exits with 1 when they differ, 2 on errors.
+Hashes of unchanged files are reused from the cache.
+
+{w}Serve conversions as JSON-RPC on a Unix {b}socket{w}, or on stdin/stdout without one, keeping includes parsed between requests.
+Convert through a server with{z} --connect {b}socket{w} (or{z} DEMAL_SERVER{w}, falling back to converting here), the output is the same.{z}
 '''
     if '-v' in arg or '--version' in arg:
         print(__version__)
         sys.exit(0)
     if len(arg) < 2 or '-h' in arg or '--help' in arg:
         sys.exit(usage)
-    elif arg[1] == '-':
-        file = sys.stdin
-    else:
-        file = arg[1]
-    out = None
-    if len(arg) > 2:
-        if arg[2] == '-':
-            out = sys.stdout
-        elif arg[2] in ('debug', '-r', '--reverse'):
-            pass
+    args = types.SimpleNamespace(file=None, out=None, debug=False, reverse=False, compact=False, flatten=False, inputs=[], output_dir=None,
+                                 jobs=None, cache=os.getenv('DEMAL_CACHE'), cache_stats=False, trace=None, serve=False, connect=None, check=None,
+                                 diff=None)
+    options = iter(arg[1:])
+    for x in options:
+        if x == 'debug':
+            args.debug = True
+        elif x in ('-r', '--reverse'):
+            args.reverse = True
+        elif x in ('-c', '--compact'):
+            args.compact = True
+        elif x in ('-f', '--flatten'):
+            args.flatten = True
+        elif x in ('-o', '--output-dir'):
+            args.output_dir = next(options, None) or sys.exit(usage)
+        elif x in ('-j', '--jobs'):
+            args.jobs = next(options, '')
+            if not args.jobs.isdigit() or int(args.jobs) < 1:
+                sys.exit(usage)
+            args.jobs = int(args.jobs)
+        elif x == '--cache':
+            args.cache = next(options, None) or sys.exit(usage)
+        elif x.startswith('--cache='):
+            args.cache = x[8:]
+        elif x == '--cache-stats':
+            args.cache_stats = True
+        elif x == '--trace':
+            args.trace = next(options, None) or sys.exit(usage)
+        elif x == '--serve':
+            args.serve = True
+        elif x == '--check' or x in ('--check=text', '--check=json'):
+            args.check = x[8:] or 'text'
+        elif x == '--diff' or x in ('--diff=text', '--diff=json'):
+            args.diff = x[7:] or 'text'
+        elif x == '--connect':
+            args.connect = next(options, None) or sys.exit(usage)
+        else:
+            args.inputs.append(x)
+    positional = args.inputs
+    if args.serve:
+        if len(positional) > 1:
+            sys.exit(usage)
+        args.batch, args.socket = False, positional[0] if positional else None
+        return args
+    if args.check:
+        if not positional:
+            sys.exit(usage)
+        if '-' in positional:
+            sys.exit('Error: --check reads files, not stdin.')
+        args.batch = False
+        return args
+    if args.diff:
+        if len(positional) != 2:
+            sys.exit(usage)
+        if '-' in positional:
+            sys.exit('Error: --diff reads files, not stdin.')
+        args.batch = False
+        return args
+    if not positional and (args.reverse or args.output_dir or not args.cache_stats):
+        sys.exit(usage)
+    if args.cache_stats and not args.cache:
+        sys.exit('Error: --cache-stats requires --cache or DEMAL_CACHE.')
+    args.batch = bool(args.output_dir) or len(positional) > 2 or any(os.path.isdir(x) or glob.has_magic(x) for x in positional)
+    if args.batch:
+        if '-' in positional:
+            sys.exit('Error: stdin cannot be used when converting many files.')
+        if args.trace:
+            sys.exit('Error: --trace records a single conversion.')
+        if args.connect:
+            sys.exit('Error: --connect converts a single file.')
+        return args
+    if positional:
+        args.file = sys.stdin if positional[0] == '-' else positional[0]
+    if len(positional) > 1:
+        args.out = sys.stdout if positional[1] == '-' else positional[1]
+    return args
+
+def convert(file, out, debug = False, cache = None, reverse = False, pretty = True, flatten = False, trace = None):
+    '''
+    Convert a MAL file to JSON, or a JSON file to MAL in reverse, reusing and filling the cache if given.
+    JSON is indented unless pretty is False, in which case it is compact, flatten adds resolved inheritance.
+    The conversion is recorded by the given Tracer, or printed to stderr in debug mode, then the tracer is closed.
+    Returns 1 when the conversion failed.
+    '''
+    if file is not sys.stdin and not os.path.isfile(file):
+        print(f'Error while opening {file}', file=sys.stderr)
+        return 1
+    mal = MalParser(file, debug=debug, trace=trace)
+    try:
+        return _convert(mal, file, out, cache, reverse, pretty, flatten)
+    finally:
+        if mal.tracer is not None:
+            mal.tracer.close()
+
+def _convert(mal, file, out, cache, reverse, pretty, flatten):
+    '''
+    Run a conversion with a parser created for it, see convert().
+    '''
+    if reverse:
+        try:
+            mal.load(sys.stdin.buffer if file is sys.stdin else file)
+        except SyntaxError as e:
+            return mal.quit(e) or 1
+        mal.dump_mal(out=out)
+        return 1 if mal.stop else None
+    source = file
+    if cache:
+        if file is sys.stdin:
+            data, base = sys.stdin.read(), '.'
+            source = io.StringIO(data)
         else:
-            out = arg[2]
-    return file, out, 'debug' in arg, any(x in arg[2:] for x in ('-r', '--reverse'))
+            with open(file, 'rb') as f:
+                data, base = f.read(), os.path.dirname(file)
+        key = cache.key(data, ('' if pretty else 'compact') + (' flatten' if flatten else ''))
+        if (text := cache.get(key, base)) is not None:
+            mal._write((text,), out, '.json')
+            return
+    if source is sys.stdin:
+        collections.deque(mal.parse_stream(source), 0)
+    elif mal.parse(source):
+        return 1
+    if mal.stop:
+        return 1
+    if flatten:
+        try:
+            mal.flatten()
+        except SyntaxError as e:
+            return mal.quit(e) or 1
+    if not cache:
+        mal.dump(out, pretty, flatten)
+        return
+    text = ''.join(mal.encode(pretty, flatten)) + '\n'
+    mal._write((text,), out, '.json')
+    root = os.path.realpath(file) if file is not sys.stdin else None
+    cache.put(key, text, [x for x in mal.included if x not in (None, root)], base)
+
+def collect(inputs, ext):
+    '''
+    Expand files, directories and globs into (file, output name) pairs, in a stable order.
+    Files found in a directory keep their path relative to it.
+    '''
+    files = []
+    for x in inputs:
+        if os.path.isdir(x):
+            for root, dirs, names in os.walk(x):
+                dirs.sort()
+                files += [(os.path.join(root, n), os.path.relpath(os.path.join(root, n), x)) for n in sorted(names) if n.endswith(ext)]
+        elif glob.has_magic(x):
+            files += [(f, os.path.basename(f)) for f in sorted(glob.glob(x, recursive=True)) if os.path.isfile(f)]
+        else:
+            files.append((x, os.path.basename(x)))
+    return files
+
+def _convert_task(task):
+    '''
+    Convert one file of a batch, capturing its messages so they can be printed in order.
+    '''
+    global CLI
+    CLI = True
+    file, out, debug, reverse, pretty, flatten, cache_dir = task
+    cache = None
+    if cache_dir:
+        from .cache import ResultCache
+        cache = ResultCache(cache_dir)
+        cache.counters = dict.fromkeys(cache.counters, 0)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            error = convert(file, out, debug, cache, reverse, pretty, flatten)
+        except Exception as e:
+            print(f'Error while converting {file}: {e}', file=sys.stderr)
+            error = 1
+    return bool(error), stdout.getvalue(), stderr.getvalue(), cache.counters if cache else None
+
+def batch(args, cache = None):
+    '''
+    Convert many files concurrently with a process pool, reporting results in input order.
+    Returns the number of files that failed.
+    '''
+    import concurrent.futures
+    files = collect(args.inputs, '.json' if args.reverse else '.mal')
+    ext = '.mal' if args.reverse else '.json'
+    tasks, outputs = [], set()
+    for file, name in files:
+        out = None
+        if args.output_dir:
+            out = os.path.join(args.output_dir, name + ext)
+            if out in outputs:
+                sys.exit(f'Error: more than one input would be written to {out}')
+            outputs.add(out)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+        tasks.append((file, out, args.debug, args.reverse, not args.compact, args.flatten, cache.root if cache else None))
+    if not tasks:
+        sys.exit('Error: no input files found.')
+
+    jobs = min(args.jobs or os.cpu_count() or 1, len(tasks))
+    failed = 0
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+            results = pool.map(_convert_task, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+        else:
+            results = map(_convert_task, tasks)
+        for error, stdout, stderr, counters in results:
+            failed += error
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            if counters:
+                for k, v in counters.items():
+                    cache.counters[k] += v
+    if failed:
+        print(f'{failed} of {len(tasks)} files failed.', file=sys.stderr)
+    return failed
+
+def compare(args, cache = None):
+    '''
+    Print the changes between the two models given to --diff.
+    Returns 1 when they differ and 2 when either cannot be read, like diff.
+    '''
+    from .diff import tree_of, diff, report
+    try:
+        old, new = (tree_of(x, cache) for x in args.inputs)
+    except IOError as e:
+        print(f'Error while opening {e.filename}', file=sys.stderr)
+        return 2
+    except SyntaxError as e:
+        print(e, file=sys.stderr)
+        return 2
+    counts = report(diff(old, new), args.diff)
+    if args.diff == 'text':
+        print(f"{counts['added']} added, {counts['removed']} removed, {counts['modified']} modified.", file=sys.stderr)
+    return 1 if counts else 0
+
+def remote(server, args, required = True):
+    '''
+    Convert through a server, or here when it cannot be reached and is not required.
+    Only a failed connection falls back, nothing has been read or sent by then.
+    '''
+    from .server import Client, convert as send
+    try:
+        client = Client(server)
+    except OSError as e:
+        if required:
+            sys.exit(f'Error: cannot reach the server on {server}: {e.strerror or e}')
+        return convert(args.file, args.out, args.debug, None, args.reverse, not args.compact, args.flatten)
+    with client:
+        return send(client, args.file, args.out, args.reverse, not args.compact, args.flatten)
+
+def _discard_stdout():
+    '''
+    Send anything left for stdout to the null device once its reader is gone, so that exiting does not fail
+    flushing it.
+    '''
+    with contextlib.suppress(OSError):
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 def main():
     '''
@@ -497,23 +2196,55 @@ def main():
     '''
     global CLI
     CLI = True
-    file, out, debug, to_mal = cli(sys.argv)
-    if file is not sys.stdin and not os.path.isfile(file):
-        sys.exit(f'Error while opening {file}')
-    if to_mal:
-        mal = MalParser(file)
-        file = file if file is sys.stdin else open(file)
-        with file as f:
-            mal.result = json.load(f)
-        error = mal.dump_mal(out=out)
-        if error:
+    args = cli(sys.argv)
+    if args.check:
+        from .validate import validate_files, report
+        files = [file for file, _ in collect(args.inputs, '.mal')]
+        try:
+            errors, warnings = report(validate_files(files, args.jobs), args.check)
+        except BrokenPipeError:
+            # Diagnostics were left unread, e.g. by head, so the check cannot be said to pass.
+            _discard_stdout()
             sys.exit(1)
-        return
-    mal = MalParser(file, debug=debug)
-    error = mal.parse()
+        if args.check == 'text':
+            print(f'{errors} errors, {warnings} warnings in {len(files)} files.', file=sys.stderr)
+        sys.exit(1 if errors else 0)
+    cache = None
+    if args.cache and not args.reverse:
+        from .cache import ResultCache
+        cache = ResultCache(args.cache)
+    trace = None
+    if args.trace:
+        from .trace import Tracer, JsonSink
+        trace = Tracer(JsonSink(args.trace))
+    if args.serve:
+        from .server import Server
+        try:
+            return Server().serve(args.socket)
+        except OSError as e:
+            sys.exit(f'Error: {e}')
+    server = args.connect or os.getenv('DEMAL_SERVER')
+    try:
+        if args.diff:
+            error = compare(args, cache)
+        elif args.batch:
+            error = batch(args, cache)
+        elif args.file is None:
+            error = False
+        elif server and not (args.debug or cache or trace):
+            error = remote(server, args, required=bool(args.connect))
+        else:
+            error = convert(args.file, args.out, args.debug, cache, args.reverse, not args.compact, args.flatten, trace)
+    except BrokenPipeError:
+        # The reader of the output stopped early, e.g. head, which is not an error of the conversion.
+        error = _discard_stdout()
+    finally:
+        if cache:
+            cache.close()
+            if args.cache_stats:
+                print(cache.report(), file=sys.stderr)
     if error:
-        sys.exit(1)
-    mal.dump(out=out, pretty=True)
+        sys.exit(error if args.diff else 1)
 
 if __name__ == '__main__':
     try:
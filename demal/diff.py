@@ -0,0 +1,192 @@
+'''
+demal.diff
+----------
+Structural differences between two models, found through Merkle trees of content hashes so that identical
+categories, assets, attack steps and associations are skipped without looking inside them.
+'''
+
+import os, json, hashlib, functools, collections
+
+from .demal import MalParser
+
+SYMBOLS = {'added': '+', 'removed': '-', 'modified': '~'}
+
+# Levels of the results that only hold named children, left out of paths: System.Host.access rather than
+# categories.System.assets.Host.attributes.access.
+CONTAINERS = {(0, 'categories'), (2, 'assets'), (4, 'attributes')}
+
+class Change(collections.namedtuple('Change', 'kind path')):
+    '''
+    An element added, removed or modified between two models, at a path such as System.Host.access.leads_to.
+    Associations are under associations, named as in MAL without multiplicities.
+    '''
+    __slots__ = ()
+
+    def __str__(self):
+        '''
+        The change as a line of a diff: +, - or ~ and the path.
+        '''
+        return f'{SYMBOLS[self.kind]} {self.path}'
+
+# Canonical JSON of values compared as a whole.
+_encode = json.JSONEncoder(sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode
+
+@functools.lru_cache(maxsize=2**16)
+def _digest(text):
+    '''
+    Hex digest of a text, cached since most fields repeat, e.g. empty meta and tags or the same attack step type.
+    '''
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def _leaf(value):
+    '''
+    Digest of a value compared as a whole.
+    '''
+    if type(value) is str:
+        return _digest('s' + value)
+    # None, booleans and empty containers, whose repr cannot be mistaken for the JSON of another value.
+    return _digest(repr(value) if not value or value is True else _encode(value))
+
+def _node(children):
+    '''
+    Tree node over named children, its digest independent of their order.
+    '''
+    data = ''.join([f'{name}\0{child if type(child) is str else child[0]}\0' for name, child in sorted(children.items())])
+    return [hashlib.blake2b(data.encode(), digest_size=16).hexdigest(), children]
+
+def _expand(value, depth):
+    '''
+    Tree of a value in the results: dictionaries down to the fields of attack steps are nodes, the rest are leaves.
+    '''
+    if type(value) is not dict or depth > 5:
+        return _leaf(value)
+    return _node({k: _expand(v, depth + 1) for k, v in value.items()})
+
+def _label(link):
+    '''
+    Name of an association, as it is written in MAL.
+    '''
+    return f"{link.get('asset_l')} [{link.get('field_l')}] <-- {link.get('name')} --> [{link.get('field_r')}] {link.get('asset_r')}"
+
+def hash_tree(result):
+    '''
+    Merkle tree of a result dictionary, as nested lists that save as JSON: a leaf is the hex digest of its value,
+    a node is [digest, {name: child}] with a digest over its children's names and digests.
+    Nodes go down to each category, asset, attack step and association, their fields are leaves.
+    '''
+    children = {}
+    for key, value in result.items():
+        if key == 'categories' and type(value) is dict:
+            children[key] = _node({name: _expand(category, 1) for name, category in value.items()})
+        elif key == 'associations' and type(value) is list:
+            links, seen = {}, collections.Counter()
+            for link in value:
+                label = _label(link) if type(link) is dict else repr(link)
+                seen[label] += 1
+                links[label if seen[label] == 1 else f'{label} #{seen[label]}'] = _expand(link, 5)
+            children[key] = _node(links)
+        else:
+            children[key] = _leaf(value)
+    return _node(children)
+
+def diff(old, new):
+    '''
+    Changes from one model to another, each given as a MalParser, a result dictionary or a hash tree.
+    Only nodes whose digests differ are visited, so the time taken grows with the changes rather than the models.
+    Added and removed subtrees are reported once, at their root.
+    '''
+    changes = []
+    _compare(_tree(old), _tree(new), [], changes)
+    return changes
+
+def _tree(model):
+    '''
+    Hash tree of a MalParser or a result dictionary, a hash tree being returned as is.
+    '''
+    if isinstance(model, MalParser):
+        model = model.result
+    return hash_tree(model) if type(model) is dict else model
+
+def _compare(old, new, keys, changes):
+    '''
+    Append to changes the differences between two subtrees at the keys given, descending only where digests differ.
+    A subtree replaced by a leaf or the other way round is a single modification.
+    '''
+    if (old if type(old) is str else old[0]) == (new if type(new) is str else new[0]):
+        return
+    if type(old) is str or type(new) is str:
+        changes.append(Change('modified', _path(keys)))
+        return
+    a, b = old[1], new[1]
+    for name in sorted(a.keys() | b.keys()):
+        keys.append(name)
+        if name not in b:
+            changes.append(Change('removed', _path(keys)))
+        elif name not in a:
+            changes.append(Change('added', _path(keys)))
+        else:
+            _compare(a[name], b[name], keys, changes)
+        keys.pop()
+
+def _path(keys):
+    '''
+    Dotted path of a list of keys, without the container levels inside categories.
+    '''
+    if keys[0] != 'categories':
+        return '.'.join(keys)
+    return '.'.join(k for i, k in enumerate(keys) if (i, k) not in CONTAINERS)
+
+def save_tree(tree, file):
+    '''
+    Write a hash tree as JSON to a file or stream, for diffs against it in later runs.
+    '''
+    text = json.dumps(tree, separators=(',', ':'))
+    if type(file) is str:
+        with open(file, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        file.write(text)
+
+def load_tree(file):
+    '''
+    Read a hash tree written by save_tree() from a file or stream.
+    '''
+    if type(file) is str:
+        with open(file, encoding='utf-8') as f:
+            return json.load(f)
+    return json.load(file)
+
+def tree_of(file, cache = None):
+    '''
+    Hash tree of a MAL file, or of JSON output when the file ends in .json.
+    With a ResultCache, trees are reused for as long as the file and its includes are unchanged.
+    Raises SyntaxError if the file cannot be parsed and IOError if it cannot be read.
+    '''
+    mal = MalParser(file)
+    if cache:
+        with open(file, 'rb') as f:
+            data = f.read()
+        key, base = cache.key(data, 'hashes'), os.path.dirname(file)
+        if (text := cache.get(key, base)) is not None:
+            return json.loads(text)
+    if file.endswith('.json'):
+        mal.load(file)
+    else:
+        mal.parse_file(file)
+        mal.stop = False
+    tree = hash_tree(mal.result)
+    if cache:
+        root = os.path.realpath(file)
+        cache.put(key, json.dumps(tree, separators=(',', ':')), [x for x in mal.included if x not in (None, root)], base)
+    return tree
+
+def report(changes, form = 'text', out = None):
+    '''
+    Print changes as +, - or ~ and a path per line, or JSON lines with form='json'.
+    Returns the number of changes of each kind.
+    '''
+    counts = collections.Counter()
+    for x in changes:
+        counts[x.kind] += 1
+        print(json.dumps(x._asdict()) if form == 'json' else x, file=out, flush=True)
+    return counts
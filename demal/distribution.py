@@ -0,0 +1,284 @@
+'''
+demal.distribution
+------------------
+Probability distributions of attack steps parsed into typed objects, and a sampler that draws from
+every step at once, vectorized with NumPy when it is installed.
+'''
+
+import re, math, array, random, functools, collections
+
+# Parameters of each family, in the order they are written in MAL.
+FAMILIES = {
+    'Bernoulli': ('probability',),
+    'Binomial': ('trials', 'probability'),
+    'Exponential': ('rate',),
+    'Gamma': ('shape', 'scale'),
+    'LogNormal': ('mean', 'sigma'),
+    'Pareto': ('minimum', 'shape'),
+    'TruncatedNormal': ('mean', 'variance'),
+    'Uniform': ('low', 'high'),
+    'Infinity': (),
+    'Zero': ()
+}
+
+# Parameters that must be greater than zero.
+POSITIVE = {'rate', 'shape', 'scale', 'sigma', 'minimum', 'variance'}
+
+TEXT = re.compile(r'\s*([A-Za-z]\w*)\s*(?:\((.*)\))?\s*\Z', re.S)
+NUMBER = re.compile(r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*\Z')
+
+# Rounds of rejection sampling before a TruncatedNormal draw gives up, each accepts with a probability over 1/2.
+RETRIES = 64
+
+class Distribution(collections.namedtuple('Distribution', 'family params')):
+    '''
+    A valid distribution such as Exponential(0.02): its family, a key of FAMILIES, and its parameters as floats.
+    Samples are times to compromise, Bernoulli gives 1 with its probability and 0 otherwise,
+    TruncatedNormal is truncated to non-negative values.
+    '''
+    __slots__ = ()
+
+    def __str__(self):
+        '''
+        The distribution as it is written in MAL, whole numbers without a decimal point.
+        '''
+        if not self.params:
+            return self.family
+        return f"{self.family}({', '.join(str(int(x)) if x.is_integer() else repr(x) for x in self.params)})"
+
+    def sample(self, rnd = random):
+        '''
+        Draw one sample with a random.Random, or the random module.
+        '''
+        return self.draw(rnd)()
+
+    def draw(self, rnd = random):
+        '''
+        A function of no arguments drawing a sample each time it is called, with a random.Random or the random module.
+        '''
+        family, params = self.family, self.params
+        if family == 'Bernoulli':
+            return lambda: 1.0 if rnd.random() < params[0] else 0.0
+        if family == 'Binomial':
+            return lambda: float(sum(rnd.random() < params[1] for _ in range(int(params[0]))))
+        if family == 'Exponential':
+            return functools.partial(rnd.expovariate, *params)
+        if family == 'Gamma':
+            return functools.partial(rnd.gammavariate, *params)
+        if family == 'LogNormal':
+            return functools.partial(rnd.lognormvariate, *params)
+        if family == 'Pareto':
+            return lambda: params[0] * rnd.paretovariate(params[1])
+        if family == 'TruncatedNormal':
+            return functools.partial(_truncated, rnd, params[0], math.sqrt(params[1]))
+        if family == 'Uniform':
+            return functools.partial(rnd.uniform, *params)
+        return functools.partial(float, 'inf' if family == 'Infinity' else 0)
+
+def _truncated(rnd, mean, sigma):
+    '''
+    A normal sample truncated to non-negative values. With a negative mean, Robert's exponential proposal is used
+    for the tail beyond zero, so that even a mean many standard deviations below zero needs about one round.
+    '''
+    bound = -mean / sigma
+    rate = (bound + math.sqrt(bound * bound + 4)) / 2
+    for _ in range(RETRIES):
+        if bound <= 0:
+            if (z := rnd.gauss(0, 1)) >= bound:
+                return mean + sigma * z
+        elif rnd.random() <= math.exp(-((z := bound + rnd.expovariate(rate)) - rate) ** 2 / 2):
+            return max(mean + sigma * z, 0.0)
+    raise ValueError(f'TruncatedNormal({mean}, {sigma * sigma}) rejected {RETRIES} draws in a row')
+
+def _truncated_vectorized(np, rng, mean, sigma, size):
+    '''
+    NumPy samples of normal distributions truncated to non-negative values, with means and sigmas broadcast
+    over the columns, drawn as in _truncated and only redrawing those rejected.
+    '''
+    bound = np.broadcast_to(-mean / sigma, size).ravel()
+    rate = (bound + np.sqrt(bound * bound + 4)) / 2
+    z = np.empty(bound.size)
+    pending = np.arange(bound.size)
+    for _ in range(RETRIES):
+        if not len(pending):
+            break
+        b, r = bound[pending], rate[pending]
+        tail = b > 0
+        candidate = np.where(tail, b + rng.exponential(1 / r), rng.standard_normal(len(pending)))
+        accept = np.where(tail, rng.random(len(pending)) <= np.exp(-(candidate - r) ** 2 / 2), candidate >= b)
+        z[pending[accept]] = candidate[accept]
+        pending = pending[~accept]
+    if len(pending):
+        raise ValueError(f'TruncatedNormal rejected {RETRIES} draws in a row')
+    return np.maximum(mean + sigma * z.reshape(size), 0.0)
+
+def parse(text):
+    '''
+    Parse the text of a distribution, raises ValueError if the family is unknown or its parameters are invalid.
+    '''
+    if not (m := TEXT.match(text)) or m[1] not in FAMILIES:
+        raise ValueError(f'Unknown distribution {text!r}')
+    family, names = m[1], FAMILIES[m[1]]
+    values = m[2].split(',') if m[2] is not None and m[2].strip() else []
+    if len(values) != len(names):
+        raise ValueError(f"{family} takes {len(names)} parameters ({', '.join(names) or 'none'}), not {len(values)}: {text!r}")
+    for value in values:
+        if not NUMBER.match(value):
+            raise ValueError(f'{family} parameter {value.strip()!r} is not a number: {text!r}')
+    params = tuple(float(x) for x in values)
+    for name, x in zip(names, params):
+        if name in POSITIVE and not x > 0:
+            raise ValueError(f'{family} {name} must be greater than 0: {text!r}')
+        if name == 'probability' and not 0 <= x <= 1:
+            raise ValueError(f'{family} probability must be between 0 and 1: {text!r}')
+        if name == 'trials' and not x.is_integer():
+            raise ValueError(f'{family} trials must be a whole number: {text!r}')
+    if family == 'Uniform' and params[0] > params[1]:
+        raise ValueError(f'Uniform low must not be greater than high: {text!r}')
+    return Distribution(family, params)
+
+class Distributions:
+    '''
+    The distributions of one model: each distinct text is parsed once, and so are its errors.
+    '''
+
+    def __init__(self):
+        '''
+        Start with no texts: parsed maps each valid text to its Distribution, errors each invalid one to its message.
+        '''
+        self.parsed = {}
+        self.errors = {}
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Distributions object: {len(self.parsed)} valid, {len(self.errors)} invalid>'
+
+    def __len__(self):
+        '''
+        Number of distinct texts parsed, valid or not.
+        '''
+        return len(self.parsed) + len(self.errors)
+
+    def parse(self, text):
+        '''
+        The Distribution of a text, raises ValueError if it is invalid.
+        '''
+        if (dist := self.parsed.get(text)) is not None:
+            return dist
+        if text in self.errors:
+            raise ValueError(self.errors[text])
+        try:
+            dist = self.parsed[text] = parse(text)
+        except ValueError as e:
+            self.errors[text] = str(e)
+            raise
+        return dist
+
+class Sampler:
+    '''
+    Draw samples for many attack steps at once. Their distributions are kept in columns:
+    family holds the index in FAMILIES of each step's family (-1 for steps without one), a and b its parameters.
+    '''
+
+    def __init__(self, distributions):
+        '''
+        Gather a sequence of Distribution, None for steps without one, into columns.
+        '''
+        self.family = array.array('b')
+        self.a = array.array('d')
+        self.b = array.array('d')
+        codes = {name: i for i, name in enumerate(FAMILIES)}
+        for dist in distributions:
+            a, b = (dist.params + (0.0, 0.0))[:2] if dist else (0.0, 0.0)
+            self.family.append(codes[dist.family] if dist else -1)
+            self.a.append(a)
+            self.b.append(b)
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Sampler object: {len(self)} steps>'
+
+    def __len__(self):
+        '''
+        Number of attack steps, with or without a distribution.
+        '''
+        return len(self.family)
+
+    @classmethod
+    def from_graph(cls, graph, distributions = None):
+        '''
+        Sampler of every step of an AttackGraph, in step ID order, parsing each distinct distribution once.
+        Raises ValueError naming a step whose distribution is invalid.
+        '''
+        table = distributions if distributions is not None else Distributions()
+        dists = []
+        for i, text in enumerate(graph.dists):
+            try:
+                dists.append(table.parse(text))
+            except ValueError as e:
+                raise ValueError(f'{graph.steps[graph.dist.index(i)]}: {e}') from None
+        return cls(dists[i] if i >= 0 else None for i in graph.dist)
+
+    def distributions(self):
+        '''
+        The Distribution of each step, None for steps without one.
+        '''
+        names = list(FAMILIES)
+        return [Distribution(names[f], (a, b)[:len(FAMILIES[names[f]])]) if f >= 0 else None
+                for f, a, b in zip(self.family, self.a, self.b)]
+
+    def sample(self, n, seed = None, vectorize = None):
+        '''
+        Draw n samples of every step: a NumPy array of n rows and a column per step, or, without NumPy or with
+        vectorize=False, a list of n array('d') rows. Steps without a distribution are 0.
+        The same seed gives the same samples, for as long as the same backend is used.
+        '''
+        if vectorize is not False:
+            try:
+                import numpy
+            except ImportError:
+                if vectorize:
+                    raise
+            else:
+                return self._vectorized(numpy, n, seed)
+        rnd = random.Random(seed)
+        draws = [float if d is None else d.draw(rnd) for d in self.distributions()]
+        return [array.array('d', [f() for f in draws]) for _ in range(n)]
+
+    def _vectorized(self, np, n, seed):
+        '''
+        One NumPy call per family, drawing n samples of all its steps with their parameters broadcast over the columns.
+        '''
+        rng = np.random.default_rng(seed)
+        family, params_a, params_b = np.array(self.family, dtype=np.int8), np.array(self.a), np.array(self.b)
+        out = np.zeros((n, len(family)))
+        for code, name in enumerate(FAMILIES):
+            columns = np.flatnonzero(family == code)
+            if not len(columns):
+                continue
+            a, b, size = params_a[columns], params_b[columns], (n, len(columns))
+            if name == 'Bernoulli':
+                x = rng.random(size) < a
+            elif name == 'Binomial':
+                x = rng.binomial(a.astype(np.int64), b, size)
+            elif name == 'Exponential':
+                x = rng.exponential(1 / a, size)
+            elif name == 'Gamma':
+                x = rng.gamma(a, b, size)
+            elif name == 'LogNormal':
+                x = rng.lognormal(a, b, size)
+            elif name == 'Pareto':
+                # NumPy draws the Lomax distribution, shifted by one it is Pareto with minimum 1.
+                x = a * (rng.pareto(b, size) + 1)
+            elif name == 'TruncatedNormal':
+                x = _truncated_vectorized(np, rng, a, np.sqrt(b), size)
+            elif name == 'Uniform':
+                x = rng.uniform(a, b, size)
+            else:
+                x = math.inf if name == 'Infinity' else 0.0
+            out[:, columns] = x
+        return out
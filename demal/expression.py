@@ -0,0 +1,215 @@
+'''
+demal.expression
+----------------
+Attack step expressions parsed once into immutable, interned syntax trees that print back as MAL.
+'''
+
+from .demal import Lexer
+
+# Set operators between asset expressions, the lowest precedence.
+SETS = {'\\/': 'union', '/\\': 'intersection', '-': 'difference'}
+OPERATORS = {v: k for k, v in SETS.items()}
+
+# How tightly each kind of node binds, operands binding less tightly are printed in parentheses.
+PRECEDENCE = dict(dict.fromkeys(SETS.values(), 1), path=2, star=3, type=3, field=3, let=3, group=3)
+
+class Node(tuple):
+    '''
+    An expression node: its kind followed by its operands, e.g. ('path', ('field', 'hosts'), ('field', 'access')).
+    Kinds: field, let (a variable called as v()), path (a.b), star (a*), type (a[T]), group ((a)), union, intersection, difference.
+    Nodes made by one Expressions table are interned, equal subexpressions are the same object.
+    '''
+    __slots__ = ()
+
+    @property
+    def kind(self):
+        '''
+        The kind of node, its first item.
+        '''
+        return self[0]
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Node {self[0]}: {self.to_source()}>'
+
+    def to_source(self):
+        '''
+        MAL source of the expression with canonical spacing and only the parentheses it needs,
+        which parses back to an equal node.
+        '''
+        kind = self[0]
+        if kind == 'field':
+            return self[1]
+        if kind == 'let':
+            return self[1] + '()'
+        if kind == 'group':
+            return f'({self[1].to_source()})'
+        if kind == 'star':
+            return self._operand(self[1], 3) + '*'
+        if kind == 'type':
+            return f'{self._operand(self[1], 3)}[{self[2]}]'
+        if kind == 'path':
+            return f'{self._operand(self[1], 2)}.{self._operand(self[2], 3)}'
+        return f'{self._operand(self[1], 1)} {OPERATORS[kind]} {self._operand(self[2], 2)}'
+
+    @staticmethod
+    def _operand(node, precedence):
+        '''
+        Source of an operand, in parentheses if it binds less tightly than its position needs.
+        '''
+        source = node.to_source()
+        return source if PRECEDENCE[node[0]] >= precedence else f'({source})'
+
+class Expressions:
+    '''
+    The expressions of one parse: each distinct text is parsed once, and equal subexpressions share one node.
+    '''
+
+    def __init__(self):
+        '''
+        Start with no nodes: nodes maps each kind and its operands to the interned node, parsed each text to its nodes.
+        '''
+        self.nodes = {}
+        self.parsed = {}
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Expressions object: {len(self.parsed)} texts, {len(self.nodes)} nodes>'
+
+    def __len__(self):
+        '''
+        Number of distinct texts parsed.
+        '''
+        return len(self.parsed)
+
+    def node(self, *items):
+        '''
+        The interned node of a kind and operands.
+        Operands that are nodes are already interned, so they are keyed by identity rather than hashed again,
+        which would cost the size of the subtree at every level of a deep expression.
+        The table keeps them alive, so their ids are not reused.
+        '''
+        key = tuple(id(x) if type(x) is Node else x for x in items)
+        if (node := self.nodes.get(key)) is None:
+            node = self.nodes[key] = Node(items)
+        return node
+
+    def parse(self, text, code = None, tokens = None):
+        '''
+        Parse comma-separated expressions into a tuple of nodes, once per distinct text.
+        Pass the tokens of the text and their Lexer to report errors at their position in the source.
+        Raises SyntaxError on invalid expressions.
+        '''
+        if (nodes := self.parsed.get(text)) is not None:
+            return nodes
+        if tokens is None:
+            code = Lexer(text, repr(text))
+            tokens = list(code)
+        cursor = _Cursor(tokens, code)
+        nodes = [self._set(cursor)]
+        while (tok := cursor.peek()) and tok[:2] == ('op', ','):
+            next(cursor)
+            nodes.append(self._set(cursor))
+        if (tok := cursor.peek()) is not None:
+            raise code.error(tok)
+        nodes = self.parsed[text] = tuple(nodes)
+        return nodes
+
+    def _set(self, code):
+        '''
+        Set operators, left to right.
+        '''
+        node = self._path(code)
+        while (tok := code.peek()) and tok.kind == 'op' and tok.value in SETS:
+            next(code)
+            node = self.node(SETS[tok.value], node, self._path(code))
+        return node
+
+    def _path(self, code):
+        '''
+        Field navigation with dots, left to right.
+        '''
+        node = self._step(code)
+        while (tok := code.peek()) and tok[:2] == ('op', '.'):
+            next(code)
+            node = self.node('path', node, self._step(code))
+        return node
+
+    def _step(self, code):
+        '''
+        A field, let variable or parenthesised expression, followed by any number of * and [Type].
+        '''
+        tok = next(code)
+        if tok[:2] == ('op', '('):
+            node = self.node('group', self._set(code))
+            code.expect('op', ')')
+        elif tok.kind == 'name':
+            node = self.node('field', tok.value)
+            if (nxt := code.peek()) and nxt[:2] == ('op', '(') and (nxt := code.peek(1)) and nxt[:2] == ('op', ')'):
+                next(code), next(code)
+                node = self.node('let', tok.value)
+        else:
+            raise code.error(tok)
+        while (tok := code.peek()) and tok.kind == 'op' and tok.value in ('*', '['):
+            next(code)
+            if tok.value == '*':
+                node = self.node('star', node)
+            else:
+                node = self.node('type', node, code.expect('name').value)
+                code.expect('op', ']')
+        return node
+
+class _Cursor:
+    '''
+    Read a list of tokens with the lookahead of a Lexer, errors point into the Lexer's source.
+    A missing token is reported at the last one.
+    '''
+
+    def __init__(self, tokens, code):
+        '''
+        Start at the first of the tokens, code being the Lexer they came from.
+        '''
+        self.tokens = tokens
+        self.code = code
+        self.i = 0
+
+    def __next__(self):
+        '''
+        The next token, raises SyntaxError if there are none left.
+        '''
+        if self.i >= len(self.tokens):
+            raise SyntaxError(f'Incomplete expression in {self.code.name} at line {self.tokens[-1].line}: '
+                              f'{self.code.line(self.tokens[-1])!r}' if self.tokens else f'Empty expression in {self.code.name}')
+        self.i += 1
+        return self.tokens[self.i - 1]
+
+    def peek(self, n = 0):
+        '''
+        The token n places ahead without consuming it, None past the end.
+        '''
+        return self.tokens[self.i + n] if self.i + n < len(self.tokens) else None
+
+    def expect(self, kind, value = None):
+        '''
+        Consume the next token, raises SyntaxError unless it has the kind and, if given, the value.
+        '''
+        tok = next(self)
+        if tok.kind != kind or value is not None and tok.value != value:
+            raise self.error(tok)
+        return tok
+
+    def error(self, tok):
+        '''
+        The SyntaxError for a token, pointing at it in the Lexer's source.
+        '''
+        return self.code.error(tok)
+
+def to_source(nodes):
+    '''
+    MAL source of a node or a tuple of nodes, separated by commas.
+    '''
+    return nodes.to_source() if type(nodes) is Node else ', '.join(x.to_source() for x in nodes)
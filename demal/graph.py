@@ -0,0 +1,284 @@
+'''
+demal.graph
+-----------
+Compiled attack graph: attack step expressions resolved against association fields into integer-indexed arrays.
+'''
+
+import sys, json, array, struct, contextlib
+
+from .expression import Expressions
+
+# Attack step types in column order, as stored in the kind column.
+KINDS = ('or', 'and', 'defense', 'exists', 'lacks')
+
+MAGIC = b'DEMALG1\0'
+
+class AttackGraph:
+    '''
+    Attack steps of every asset type as integer IDs, with leads_to edges and requirements in CSR form:
+    the successors of step i are targets[offsets[i]:offsets[i+1]], its required assets are
+    requires[req_offsets[i]:req_offsets[i+1]] (asset IDs). The asset, kind and dist columns hold,
+    for each step, its asset ID, its index in KINDS and its index in dists (-1 when unset).
+    '''
+
+    def __init__(self):
+        '''
+        Create an empty graph, see compile() and load().
+        '''
+        self.steps = []
+        self.assets = []
+        self.dists = []
+        self.ids = {}
+        self.asset = array.array('i')
+        self.kind = array.array('b')
+        self.dist = array.array('i')
+        self.offsets = array.array('i', (0,))
+        self.targets = array.array('i')
+        self.req_offsets = array.array('i', (0,))
+        self.requires = array.array('i')
+        self.unresolved = []
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<AttackGraph object: {len(self.steps)} steps, {len(self.targets)} edges>'
+
+    def __len__(self):
+        '''
+        Number of attack steps.
+        '''
+        return len(self.steps)
+
+    def successors(self, step):
+        '''
+        Step IDs reached from a step, given by ID or 'Asset.step', as a view that does not copy the array.
+        '''
+        i = self.ids[step] if type(step) is str else step
+        return memoryview(self.targets)[self.offsets[i]:self.offsets[i + 1]]
+
+    def required(self, step):
+        '''
+        Asset IDs required by an exists or lacks step, given by ID or 'Asset.step'.
+        '''
+        i = self.ids[step] if type(step) is str else step
+        return memoryview(self.requires)[self.req_offsets[i]:self.req_offsets[i + 1]]
+
+    @classmethod
+    def compile(cls, mal):
+        '''
+        Build the graph of a parsed MalParser, following inheritance and association fields.
+        Expressions that cannot be resolved are listed in unresolved as (step, expression, reason).
+        '''
+        return _Compiler(mal.index, mal.expressions).run(cls())
+
+    def to_numpy(self):
+        '''
+        The integer columns as NumPy arrays sharing memory with the graph, requires numpy.
+        '''
+        import numpy
+        return {k: numpy.frombuffer(getattr(self, k), dtype=getattr(self, k).typecode)
+                for k in ('asset', 'kind', 'dist', 'offsets', 'targets', 'req_offsets', 'requires')}
+
+    def sampler(self, distributions = None):
+        '''
+        A demal.distribution.Sampler of the probability distributions of every step, to draw many samples at once.
+        Pass a demal.distribution.Distributions table to reuse the texts it parsed. Raises ValueError on invalid distributions.
+        '''
+        from .distribution import Sampler
+        return Sampler.from_graph(self, distributions)
+
+    def save(self, file):
+        '''
+        Write the graph to a binary file or stream: a JSON header with the string tables, then each array little-endian.
+        '''
+        columns = ('asset', 'kind', 'dist', 'offsets', 'targets', 'req_offsets', 'requires')
+        header = json.dumps({'steps': self.steps, 'assets': self.assets, 'dists': self.dists,
+                             'columns': [(k, getattr(self, k).typecode, len(getattr(self, k))) for k in columns]}).encode()
+        with (open(file, 'wb') if type(file) is str else contextlib.nullcontext(file)) as f:
+            f.write(MAGIC + struct.pack('<I', len(header)) + header)
+            for k in columns:
+                data = getattr(self, k)
+                if sys.byteorder == 'big':
+                    data = array.array(data.typecode, data)
+                    data.byteswap()
+                f.write(data.tobytes())
+
+    @classmethod
+    def load(cls, file):
+        '''
+        Read a graph written by save() from a binary file or stream.
+        '''
+        self = cls()
+        with (open(file, 'rb') if type(file) is str else contextlib.nullcontext(file)) as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('Not a demal attack graph')
+            header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]))
+            for k, typecode, n in header['columns']:
+                data = array.array(typecode)
+                data.frombytes(f.read(n * data.itemsize))
+                if len(data) != n:
+                    raise ValueError('Truncated attack graph')
+                if sys.byteorder == 'big':
+                    data.byteswap()
+                setattr(self, k, data)
+        self.steps, self.assets, self.dists = header['steps'], header['assets'], header['dists']
+        self.ids = {name: i for i, name in enumerate(self.steps)}
+        return self
+
+class _Compiler:
+    '''
+    Resolve the attack step expressions of an index into graph arrays, one asset type at a time.
+    '''
+
+    def __init__(self, index, expressions = None):
+        '''
+        Compile against the given Index, reusing the expressions already parsed into an Expressions table.
+        '''
+        self.index = index
+        self.expressions = Expressions() if expressions is None else expressions
+        self.lets = {}
+
+    def run(self, graph):
+        '''
+        Fill a graph with every step, then its edges and requirements.
+        '''
+        index = self.index
+        flat = {name: index.flatten(name) for name in index.assets}
+        graph.assets = list(flat)
+        assets = {name: i for i, name in enumerate(graph.assets)}
+        dists = {}
+        for name, steps in flat.items():
+            for step, attr in steps.items():
+                graph.ids[f'{name}.{step}'] = len(graph.steps)
+                graph.steps.append(f'{name}.{step}')
+                graph.asset.append(assets[name])
+                kind = attr.get('type') if type(attr) is dict else None
+                graph.kind.append(KINDS.index(kind) if kind in KINDS else -1)
+                prob = attr.get('probability') if type(attr) is dict else None
+                graph.dist.append(-1 if prob is None else dists.setdefault(prob, len(dists)))
+        graph.dists = list(dists)
+
+        for name, steps in flat.items():
+            for step, attr in steps.items():
+                source = f'{name}.{step}'
+                attr = attr if type(attr) is dict else {}
+                graph.targets.extend(self.resolve(graph, source, attr.get('leads_to'),
+                                                  lambda node: (graph.ids[x] for x in self.steps(name, node))))
+                graph.offsets.append(len(graph.targets))
+                graph.requires.extend(self.resolve(graph, source, attr.get('require'),
+                                                   lambda node: (assets[x] for x in self.evaluate(node, {name}))))
+                graph.req_offsets.append(len(graph.requires))
+        return graph
+
+    def resolve(self, graph, source, field, each):
+        '''
+        Sorted IDs given by each for the expressions of a leads_to or require field, skipping let bindings.
+        Expressions that fail to parse or resolve are recorded in the graph.
+        '''
+        found = set()
+        for key, text in (field.items() if type(field) is dict else ()):
+            if not key.isdigit():
+                continue
+            try:
+                nodes = self.parse(text)
+            except SyntaxError as e:
+                graph.unresolved.append((source, text, str(e)))
+                continue
+            for node in nodes:
+                try:
+                    found.update(each(node))
+                except LookupError as e:
+                    graph.unresolved.append((source, text, str(e)))
+        return sorted(found)
+
+    def parse(self, text):
+        '''
+        Parse an expression once per distinct text.
+        '''
+        return self.expressions.parse(text)
+
+    def steps(self, asset, node):
+        '''
+        Names of the attack steps an expression leads to, on the asset types it reaches and their subtypes.
+        '''
+        if node[0] == 'field':
+            types, step = {asset}, node[1]
+        elif node[0] == 'path' and node[2][0] == 'field':
+            types, step = self.evaluate(node[1], {asset}), node[2][1]
+        else:
+            raise LookupError('not an attack step reference')
+        found = []
+        for name in types:
+            for sub in [name] + self.index.descendants(name):
+                if step in (self.index.flatten(sub) or ()):
+                    found.append(f'{sub}.{step}')
+        if not found:
+            raise LookupError(f"no attack step '{step}' on {', '.join(sorted(types)) or 'any asset'}")
+        return found
+
+    def evaluate(self, node, types):
+        '''
+        Asset types reached by an expression from a set of asset types.
+        '''
+        op = node[0]
+        if op == 'field':
+            return self.follow(types, node[1])
+        if op == 'let':
+            return self.let(types, node[1])
+        if op == 'group':
+            return self.evaluate(node[1], types)
+        if op == 'path':
+            return self.evaluate(node[2], self.evaluate(node[1], types))
+        if op == 'star':
+            # Repeat until nothing new is reached, types reached on the way may lack the field.
+            found = frontier = self.evaluate(node[1], types)
+            while frontier:
+                reached = set()
+                for name in frontier:
+                    try:
+                        reached |= self.evaluate(node[1], {name})
+                    except LookupError:
+                        pass
+                frontier = reached - found
+                found = found | frontier
+            return found
+        if op == 'type':
+            if node[2] not in self.index.assets:
+                raise LookupError(f"unknown asset '{node[2]}'")
+            reached = self.evaluate(node[1], types)
+            return {node[2]} if any(node[2] == x or x in self.index.ancestors(node[2]) for x in reached) else set()
+        left, right = self.evaluate(node[1], types), self.evaluate(node[2], types)
+        # Types cannot be subtracted without instances, a difference keeps the left side.
+        return left | right if op == 'union' else left & right if op == 'intersection' else left
+
+    def follow(self, types, field):
+        '''
+        Asset types reached through a field, declared on the types or their ancestors, or a let variable.
+        '''
+        found = set()
+        for name in types:
+            for owner in [name] + self.index.ancestors(name):
+                if (link := self.index.field(owner, field)):
+                    found.add(link[1])
+                    break
+            else:
+                found |= self.let({name}, field)
+        return found
+
+    def let(self, types, var):
+        '''
+        Asset types reached by a let variable bound in an attack step of each asset type.
+        '''
+        found = set()
+        for name in types:
+            key = (name, var)
+            if key not in self.lets:
+                expr = next((f[var] for a in (self.index.flatten(name) or {}).values() if type(a) is dict
+                             for f in (a.get('leads_to'), a.get('require')) if type(f) is dict and var in f), None)
+                if expr is None:
+                    raise LookupError(f"unknown field or variable '{var}' on {name}")
+                self.lets[key] = set()
+                self.lets[key] = {x for node in self.parse(expr) for x in self.evaluate(node, {name})}
+            found |= self.lets[key]
+        return found
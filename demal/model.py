@@ -0,0 +1,290 @@
+'''
+demal.model
+-----------
+Compact object model of parse results, convertible to and from the result dictionary.
+'''
+
+import sys, types
+
+# Shared by every object without metadata, read-only so that it cannot be changed through one of them.
+EMPTY = types.MappingProxyType({})
+
+def _intern(value):
+    '''
+    Intern a string, other values are returned as they are.
+    '''
+    return sys.intern(value) if type(value) is str else value
+
+def _meta(meta, path):
+    '''
+    Interned metadata, the shared empty mapping when there is none.
+    '''
+    if type(meta) is not dict:
+        raise SyntaxError(f'Unsupported metadata at {path}')
+    return {sys.intern(k): _intern(v) for k, v in meta.items()} if meta else EMPTY
+
+def _extra(data, known):
+    '''
+    Keys outside the schema, kept so that conversion is lossless, None when there are none.
+    '''
+    return {k: v for k, v in data.items() if k not in known} or None
+
+def _expressions(field):
+    '''
+    Interned expressions, a tuple unless keys other than 0, 1, 2... are used.
+    '''
+    if all(k == str(i) for i, k in enumerate(field)):
+        return tuple(map(_intern, field.values()))
+    return {sys.intern(k): _intern(v) for k, v in field.items()}
+
+def _check(data, keys, path):
+    '''
+    Ensure a dictionary has the keys of the schema.
+    '''
+    if type(data) is not dict or not all(k in data for k in keys):
+        raise SyntaxError(f'Unsupported structure at {path}, expected keys: {", ".join(keys)}')
+
+class Attribute:
+    '''
+    An attack step or defense, expressions are kept in order as (field, expressions) pairs.
+    Expressions numbered from 0 are a tuple, those with let variables keep their keys in a dictionary.
+    '''
+    __slots__ = ('meta', 'type', 'probability', 'cia', 'tags', 'exprs', 'extra')
+    KEYS = ('meta', 'type', 'probability', 'cia', 'tags')
+    FIELDS = frozenset(('leads_to', 'require', 'append'))
+
+    def __init__(self, type, probability = None, cia = None, tags = (), meta = EMPTY, exprs = (), extra = None):
+        '''
+        An attribute of the given type (or, and, defense, exists or lacks) with its (field, expressions) pairs,
+        extra holding any keys of its dictionary that are not modelled here.
+        '''
+        self.type = type
+        self.probability = probability
+        self.cia = cia
+        self.tags = tags
+        self.meta = meta
+        self.exprs = exprs
+        self.extra = extra
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Attribute object: {self.type}>'
+
+    @classmethod
+    def from_dict(cls, data, path = ''):
+        '''
+        Build from an attribute dictionary.
+        '''
+        _check(data, cls.KEYS, path)
+        exprs = tuple((sys.intern(k), _expressions(v)) for k, v in data.items() if k in cls.FIELDS and type(v) is dict)
+        cia, tags = data['cia'], data['tags']
+        return cls(_intern(data['type']), _intern(data['probability']),
+                   tuple(map(_intern, cia)) if type(cia) is list else cia,
+                   tuple(map(_intern, tags)) if type(tags) is list else tags,
+                   _meta(data['meta'], path), exprs,
+                   _extra(data, frozenset(cls.KEYS).union(k for k, _ in exprs)))
+
+    def to_dict(self):
+        '''
+        The attribute dictionary it was built from.
+        '''
+        data = {
+            'meta': dict(self.meta),
+            'type': self.type,
+            'probability': self.probability,
+            'cia': list(self.cia) if type(self.cia) is tuple else self.cia,
+            'tags': list(self.tags) if type(self.tags) is tuple else self.tags
+        }
+        for key, exprs in self.exprs:
+            data[key] = dict(exprs) if type(exprs) is dict else {str(i): x for i, x in enumerate(exprs)}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+class Asset:
+    '''
+    An asset and its attributes by name.
+    '''
+    __slots__ = ('meta', 'attributes', 'extends', 'abstract', 'extra')
+    KEYS = ('meta', 'attributes', 'extends', 'abstract')
+
+    def __init__(self, attributes, extends = None, abstract = False, meta = EMPTY, extra = None):
+        '''
+        An asset with its attributes by name, extending another asset by name if given.
+        '''
+        self.attributes = attributes
+        self.extends = extends
+        self.abstract = abstract
+        self.meta = meta
+        self.extra = extra
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Asset object: {len(self.attributes)} attributes>'
+
+    @classmethod
+    def from_dict(cls, data, path = ''):
+        '''
+        Build from an asset dictionary.
+        '''
+        _check(data, cls.KEYS, path)
+        if type(data['attributes']) is not dict:
+            raise SyntaxError(f'Unsupported attributes at {path}')
+        attributes = {sys.intern(k): Attribute.from_dict(v, f'{path}.attributes.{k}') for k, v in data['attributes'].items()}
+        return cls(attributes, _intern(data['extends']), data['abstract'], _meta(data['meta'], path), _extra(data, frozenset(cls.KEYS)))
+
+    def to_dict(self):
+        '''
+        The asset dictionary it was built from.
+        '''
+        data = {
+            'meta': dict(self.meta),
+            'attributes': {k: v.to_dict() for k, v in self.attributes.items()},
+            'extends': self.extends,
+            'abstract': self.abstract
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+class Category:
+    '''
+    A category and its assets by name.
+    '''
+    __slots__ = ('meta', 'assets', 'extra')
+    KEYS = ('meta', 'assets')
+
+    def __init__(self, assets, meta = EMPTY, extra = None):
+        '''
+        A category with its assets by name.
+        '''
+        self.assets = assets
+        self.meta = meta
+        self.extra = extra
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Category object: {len(self.assets)} assets>'
+
+    @classmethod
+    def from_dict(cls, data, path = ''):
+        '''
+        Build from a category dictionary.
+        '''
+        _check(data, cls.KEYS, path)
+        if type(data['assets']) is not dict:
+            raise SyntaxError(f'Unsupported assets at {path}')
+        assets = {sys.intern(k): Asset.from_dict(v, f'{path}.assets.{k}') for k, v in data['assets'].items()}
+        return cls(assets, _meta(data['meta'], path), _extra(data, frozenset(cls.KEYS)))
+
+    def to_dict(self):
+        '''
+        The category dictionary it was built from.
+        '''
+        data = {'meta': dict(self.meta), 'assets': {k: v.to_dict() for k, v in self.assets.items()}}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+class Association:
+    '''
+    An association between two assets.
+    '''
+    __slots__ = ('name', 'meta', 'asset_l', 'asset_r', 'field_l', 'field_r', 'mult_l', 'mult_r', 'extra')
+    KEYS = ('name', 'meta', 'asset_l', 'asset_r', 'field_l', 'field_r', 'mult_l', 'mult_r')
+
+    def __init__(self, name, asset_l, field_l, mult_l, mult_r, field_r, asset_r, meta = EMPTY, extra = None):
+        '''
+        An association, its arguments in the order they are written in MAL.
+        '''
+        self.name = name
+        self.asset_l, self.field_l, self.mult_l = asset_l, field_l, mult_l
+        self.asset_r, self.field_r, self.mult_r = asset_r, field_r, mult_r
+        self.meta = meta
+        self.extra = extra
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Association object: {self.asset_l} [{self.field_l}] <-- {self.name} --> [{self.field_r}] {self.asset_r}>'
+
+    @classmethod
+    def from_dict(cls, data, path = ''):
+        '''
+        Build from an association dictionary.
+        '''
+        _check(data, cls.KEYS, path)
+        return cls(*(_intern(data[k]) for k in ('name', 'asset_l', 'field_l', 'mult_l', 'mult_r', 'field_r', 'asset_r')),
+                   _meta(data['meta'], path), _extra(data, frozenset(cls.KEYS)))
+
+    def to_dict(self):
+        '''
+        The association dictionary it was built from.
+        '''
+        data = {
+            'name': self.name,          'meta': dict(self.meta),
+            'asset_l': self.asset_l,    'asset_r': self.asset_r,
+            'field_l': self.field_l,    'field_r': self.field_r,
+            'mult_l' : self.mult_l,     'mult_r' : self.mult_r
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+class Model:
+    '''
+    Parse results as objects: #defines, categories by name and a tuple of associations, None when absent.
+    Convert with Model.from_dict(mal.result) and back with model.to_dict() for dump() and dump_mal().
+    '''
+    __slots__ = ('defines', 'categories', 'associations', 'extra')
+
+    def __init__(self, defines = EMPTY, categories = None, associations = None, extra = None):
+        '''
+        A model from its #defines, categories by name and tuple of associations, extra holding any other top-level keys.
+        '''
+        self.defines = defines
+        self.categories = categories
+        self.associations = associations
+        self.extra = extra
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Model object: {len(self.categories or ())} categories, {len(self.associations or ())} associations>'
+
+    @classmethod
+    def from_dict(cls, result):
+        '''
+        Build from a result dictionary, raises SyntaxError on structures that the parser does not produce.
+        '''
+        defines = {sys.intern(k): sys.intern(v) for k, v in result.items() if type(v) is str}
+        categories, associations = result.get('categories'), result.get('associations')
+        if categories is not None and type(categories) is not dict or associations is not None and type(associations) is not list:
+            raise SyntaxError('Unsupported categories or associations')
+        return cls(
+            defines or EMPTY,
+            None if categories is None else {sys.intern(k): Category.from_dict(v, f'categories.{k}') for k, v in categories.items()},
+            None if associations is None else tuple(Association.from_dict(v, f'associations.{i}') for i, v in enumerate(associations)),
+            {k: v for k, v in result.items() if type(v) is not str and k not in ('categories', 'associations')} or None
+        )
+
+    def to_dict(self):
+        '''
+        The result dictionary it was built from.
+        '''
+        result = dict(self.defines)
+        if self.categories is not None:
+            result['categories'] = {k: v.to_dict() for k, v in self.categories.items()}
+        if self.associations is not None:
+            result['associations'] = [x.to_dict() for x in self.associations]
+        if self.extra:
+            result.update(self.extra)
+        return result
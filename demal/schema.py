@@ -0,0 +1,221 @@
+'''
+demal.schema
+------------
+Load JSON output back for conversion to MAL, checking it against the output schema with JSON paths in errors.
+'''
+
+import re, json
+
+from .demal import GRAMMAR
+
+# Names written as they are into MAL, and let variable or expression keys.
+NAME = re.compile(r'[^\W\d]\w*\Z')
+KEY = re.compile(r'(?:\d+|[^\W\d]\w*)\Z')
+
+# Attack step types, and the expression fields an attack step may have.
+TYPES = frozenset(GRAMMAR.kinds.values())
+FIELDS = frozenset(GRAMMAR.sym.values())
+
+# Keys of every attack step, in output order.
+ATTRIBUTE = ('meta', 'type', 'probability', 'cia', 'tags')
+REQUIRED = frozenset(ATTRIBUTE)
+
+# JSON names of the types a document decodes to.
+NAMES = {dict: 'an object', list: 'an array', str: 'a string', bool: 'a boolean', int: 'a number', float: 'a number', type(None): 'null'}
+
+# Errors listed before the rest are only counted.
+LIMIT = 20
+
+def backend():
+    '''
+    Name and loads function of the fastest JSON library available: orjson if installed, otherwise json.
+    '''
+    try:
+        import orjson
+        return 'orjson', orjson.loads
+    except ImportError:
+        return 'json', json.loads
+
+def load(file):
+    '''
+    Read a JSON document from a file or binary/text stream and validate it, raises SyntaxError listing what is wrong.
+    This takes two passes, decoding then validate(), as orjson has no hooks to check values while it builds them.
+    '''
+    data, name = read(file)
+    result = decode(data, name)
+    check(result, name)
+    return result
+
+def read(file):
+    '''
+    The content of a file or stream, and its name.
+    '''
+    if hasattr(file, 'read'):
+        return file.read(), getattr(file, 'name', '<stream>')
+    with open(file, 'rb') as f:
+        return f.read(), file
+
+def decode(data, name = '<string>'):
+    '''
+    Decode a JSON document with the fastest backend, raises SyntaxError if it is not valid JSON.
+    '''
+    try:
+        return backend()[1](data)
+    except ValueError as e:
+        raise SyntaxError(f'Invalid JSON in {name}: {e}') from None
+
+def check(result, name = '<string>'):
+    '''
+    Validate decoded results, raises SyntaxError listing what is wrong.
+    '''
+    if (errors := validate(result)):
+        more = f'\n  ... and {len(errors) - LIMIT} more' if len(errors) > LIMIT else ''
+        raise SyntaxError(f'Invalid demal JSON in {name}:\n  ' + '\n  '.join(errors[:LIMIT]) + more)
+
+def validate(result):
+    '''
+    Check a decoded result dictionary in a single walk, returning a list of errors such as
+    "$.categories.System.assets.Host.attributes.access.type: expected one of ..., got 'xor'".
+    Top-level keys other than #defines, categories and associations are left alone.
+    '''
+    errors = []
+    if type(result) is not dict:
+        return [f'$: expected an object, got {_kind(result)}']
+    for key, value in result.items():
+        if key == 'categories':
+            if _check(errors, value, dict, '$.categories'):
+                for name, category in value.items():
+                    _category(errors, category, _path('$.categories', name), name)
+        elif key == 'associations':
+            if _check(errors, value, list, '$.associations'):
+                for i, link in enumerate(value):
+                    _association(errors, link, f'$.associations[{i}]')
+        elif type(value) is str and not NAME.match(key):
+            errors.append(f'{_path("$", key)}: invalid #define name')
+    return errors
+
+def _category(errors, category, path, name):
+    '''
+    A category and its assets.
+    '''
+    if not NAME.match(name):
+        errors.append(f'{path}: invalid category name')
+    if _object(errors, category, ('meta', 'assets'), path) and _check(errors, category['assets'], dict, path + '.assets'):
+        _meta(errors, category['meta'], path)
+        for name, asset in category['assets'].items():
+            _asset(errors, asset, _path(path + '.assets', name), name)
+
+def _asset(errors, asset, path, name):
+    '''
+    An asset and its attributes.
+    '''
+    if not NAME.match(name):
+        errors.append(f'{path}: invalid asset name')
+    if not _object(errors, asset, ('meta', 'attributes', 'extends', 'abstract'), path):
+        return
+    _meta(errors, asset['meta'], path)
+    if asset['extends'] is not None and (type(asset['extends']) is not str or not NAME.match(asset['extends'])):
+        errors.append(f'{path}.extends: expected an asset name or null, got {_kind(asset["extends"])}')
+    _check(errors, asset['abstract'], bool, path + '.abstract')
+    if _check(errors, asset['attributes'], dict, path + '.attributes'):
+        for name, attr in asset['attributes'].items():
+            if not _valid(attr, name):
+                _attribute(errors, attr, _path(path + '.attributes', name), name)
+
+def _valid(attr, name):
+    '''
+    Quick check of an attack step, without building JSON paths, those are only needed to report errors.
+    '''
+    if type(attr) is not dict or not NAME.match(name) or not attr.keys() >= REQUIRED or attr['type'] not in TYPES:
+        return False
+    meta, probability, cia, tags = attr['meta'], attr['probability'], attr['cia'], attr['tags']
+    if type(meta) is not dict or meta and not all(type(x) is str for x in meta.values()):
+        return False
+    if probability is not None and type(probability) is not str:
+        return False
+    if cia is not None and (type(cia) is not list or not all(x in GRAMMAR.cia for x in cia)):
+        return False
+    if type(tags) is not list or tags and not all(type(x) is str and NAME.match(x) for x in tags):
+        return False
+    for field in FIELDS.intersection(attr):
+        if type(exprs := attr[field]) is not dict:
+            return False
+        for key, expr in exprs.items():
+            if type(expr) is not str or not KEY.match(key):
+                return False
+    return True
+
+def _attribute(errors, attr, path, name):
+    '''
+    An attack step or defense and its expressions.
+    '''
+    if not NAME.match(name):
+        errors.append(f'{path}: invalid attack step name')
+    if not _object(errors, attr, ATTRIBUTE, path):
+        return
+    _meta(errors, attr['meta'], path)
+    if attr['type'] not in TYPES:
+        errors.append(f'{path}.type: expected one of {", ".join(sorted(TYPES))}, got {_kind(attr["type"])}')
+    if attr['probability'] is not None:
+        _check(errors, attr['probability'], str, path + '.probability')
+    if (cia := attr['cia']) is not None and (type(cia) is not list or not all(x in GRAMMAR.cia for x in cia)):
+        errors.append(f'{path}.cia: expected null or a list of C, I, A, got {_kind(cia)}')
+    if type(tags := attr['tags']) is not list or not all(type(x) is str and NAME.match(x) for x in tags):
+        errors.append(f'{path}.tags: expected a list of names, got {_kind(tags)}')
+    for field in FIELDS.intersection(attr):
+        if _check(errors, exprs := attr[field], dict, f'{path}.{field}'):
+            for key, expr in exprs.items():
+                if not KEY.match(key):
+                    errors.append(f'{_path(path + "." + field, key)}: expected a number or let variable as key')
+                _check(errors, expr, str, _path(path + '.' + field, key))
+
+def _association(errors, link, path):
+    '''
+    An association between two assets.
+    '''
+    keys = ('name', 'meta', 'asset_l', 'asset_r', 'field_l', 'field_r', 'mult_l', 'mult_r')
+    if _object(errors, link, keys, path):
+        _meta(errors, link['meta'], path)
+        for key in keys:
+            if key != 'meta':
+                _check(errors, link[key], str, f'{path}.{key}')
+
+def _meta(errors, meta, path):
+    '''
+    Metadata of any declaration: names mapped to strings.
+    '''
+    if _check(errors, meta, dict, path + '.meta'):
+        for key, value in meta.items():
+            _check(errors, value, str, _path(path + '.meta', key))
+
+def _object(errors, data, keys, path):
+    '''
+    Check that data is an object with the given keys, True if so.
+    '''
+    if not _check(errors, data, dict, path):
+        return False
+    if (missing := [k for k in keys if k not in data]):
+        errors.append(f'{path}: missing {", ".join(missing)}')
+        return False
+    return True
+
+def _check(errors, value, kind, path):
+    '''
+    Check the type of a value, True if it matches.
+    '''
+    if type(value) is kind:
+        return True
+    errors.append(f'{path}: expected {NAMES[kind]}, got {_kind(value)}')
+    return False
+
+def _kind(value):
+    '''
+    JSON name of a value's type, or its representation for strings.
+    '''
+    return repr(value) if type(value) is str else NAMES.get(type(value), type(value).__name__)
+
+def _path(path, key):
+    '''
+    Extend a JSON path by an object key, bracketed unless it is a name.
+    '''
+    return f'{path}.{key}' if NAME.match(key) else f'{path}[{json.dumps(key)}]'
@@ -0,0 +1,401 @@
+'''
+demal.server
+------------
+Long-running conversion server answering JSON-RPC requests on a Unix socket or stdin/stdout,
+with a client that converts through it exactly like the command-line tool.
+'''
+
+import io, os, sys, json, socket, threading, contextlib, collections, socketserver, concurrent.futures
+
+from .demal import MalParser, __version__
+
+# JSON-RPC 2.0 error codes, the last one is used for conversions that fail.
+PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS, INTERNAL_ERROR, FAILED = -32700, -32600, -32601, -32602, -32603, -32000
+
+class Fragments(dict):
+    '''
+    Parsed includes shared by every request, keeping only the latest version of each file.
+    '''
+
+    def __init__(self):
+        '''
+        Start empty, latest mapping each file name to the key of its current version.
+        '''
+        super().__init__()
+        self.lock = threading.Lock()
+        self.latest = {}
+
+    def __setitem__(self, key, value):
+        '''
+        Store a fragment keyed by file name and version, dropping the previous version of the file.
+        '''
+        with self.lock:
+            if (old := self.latest.get(key[0])) not in (None, key):
+                self.pop(old, None)
+            self.latest[key[0]] = key
+            super().__setitem__(key, value)
+
+class _Parser(MalParser):
+    '''
+    Parser keeping its error for the reply rather than printing it, includes of a stream resolve against base.
+    '''
+
+    def __init__(self, file, cache, base):
+        '''
+        Parse a file or stream with the server's shared cache, base being the directory of the request.
+        '''
+        super().__init__(file, cache=cache)
+        self.base = base
+        self.error = None
+
+    def quit(self, msg='Exiting.'):
+        '''
+        Stop parsing and keep the message as the error of the request, rather than printing it and exiting.
+        '''
+        self.stop = True
+        self.error = str(msg)
+
+    def resolve(self, include, path):
+        '''
+        Path of an include, relative to the including file or, for a stream, to the request's directory.
+        '''
+        return os.path.join(os.path.dirname(path) if path else self.base, include)
+
+class Server:
+    '''
+    Answer parse, dump and dump_mal requests, one JSON-RPC 2.0 message per line.
+    The grammar stays compiled and included files stay parsed between requests, which run concurrently.
+
+    Requests name a file, relative to cwd, or pass its content as source. Methods:
+      parse     {file|source, cwd}                   -> results dictionary
+      dump      {file|source, cwd, pretty, flatten}  -> {"text": JSON output}
+      dump_mal  {file|source|result, cwd}            -> {"text": MAL output}
+      stats     {}                                   -> version, request counts, cached includes
+      shutdown  {}                                   -> true, then stops serving
+    '''
+
+    def __init__(self, workers = None):
+        '''
+        Create a server, workers is the number of requests on stdin handled at once (default: all cores).
+        '''
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = Fragments()
+        self.counters = collections.Counter()
+        # Requests on a socket are handled in threads of their own, each counting them.
+        self.lock = threading.Lock()
+        self.methods = {'parse': self.parse, 'dump': self.dump, 'dump_mal': self.dump_mal, 'stats': self.stats, 'shutdown': self.shutdown}
+        self.done = threading.Event()
+        self._server = None
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Server object: {self.counters["requests"]} requests, {len(self.cache)} cached includes>'
+
+    def handle(self, line):
+        '''
+        Answer one request line, returning the response line, or None for notifications.
+        '''
+        with self.lock:
+            self.counters['requests'] += 1
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return self._reply(None, error=(PARSE_ERROR, 'Parse error'))
+        if type(message) is not dict or type(message.get('method')) is not str:
+            return self._reply(message.get('id') if type(message) is dict else None, error=(INVALID_REQUEST, 'Invalid request'))
+        ident, params = message.get('id'), message.get('params', {})
+        if (method := self.methods.get(message['method'])) is None:
+            error = (METHOD_NOT_FOUND, f'Method not found: {message["method"]}')
+        elif type(params) is not dict:
+            error = (INVALID_PARAMS, 'Invalid params: expected an object')
+        else:
+            try:
+                result = method(params)
+                return None if 'id' not in message else self._reply(ident, result)
+            except TypeError as e:
+                error = (INVALID_PARAMS, f'Invalid params: {e}')
+            except SyntaxError as e:
+                error = (FAILED, str(e))
+            except Exception as e:
+                error = (INTERNAL_ERROR, f'{type(e).__name__}: {e}')
+        with self.lock:
+            self.counters['errors'] += 1
+        return None if 'id' not in message else self._reply(ident, error=error)
+
+    @staticmethod
+    def _reply(ident, result = None, error = None):
+        '''
+        Response line for a request id.
+        '''
+        reply = {'jsonrpc': '2.0', 'id': ident}
+        if error:
+            reply['error'] = {'code': error[0], 'message': error[1]}
+        else:
+            reply['result'] = result
+        return json.dumps(reply) + '\n'
+
+    def parse(self, params):
+        '''
+        Parse a MAL file or source, returning the results.
+        '''
+        return self._parse(params).result
+
+    def dump(self, params):
+        '''
+        The JSON output of a MAL file or source, as the command-line tool writes it.
+        '''
+        pretty, flatten = _param(params, 'pretty', bool, True), _param(params, 'flatten', bool, False)
+        mal = self._parse(params)
+        return {'text': ''.join(mal.encode(pretty, flatten)) + '\n'}
+
+    def dump_mal(self, params):
+        '''
+        The MAL output of a JSON file, source or results dictionary, as the command-line tool writes it.
+        '''
+        if 'result' in params:
+            from .schema import check
+            mal = _Parser(None, None, None)
+            check(params['result'], '<request>')
+            mal.result = params['result']
+        else:
+            name, path, source, cwd = _input(params)
+            mal = _Parser(path, None, cwd)
+            try:
+                if source is None:
+                    mal.load(path)
+                else:
+                    data = io.BytesIO(source.encode())
+                    data.name = '<stdin>'
+                    mal.load(data)
+            except SyntaxError as e:
+                raise SyntaxError(_rename(str(e), path, name)) from None
+        if not mal.result:
+            raise SyntaxError('Error: empty file.')
+        try:
+            return {'text': ''.join(mal.encode_mal())}
+        except ValueError as e:
+            raise SyntaxError(str(e)) from None
+
+    def stats(self, params):
+        '''
+        Version, request and error counts, and the number of included files kept parsed.
+        '''
+        with self.lock:
+            requests, errors = self.counters['requests'], self.counters['errors']
+        return {'version': __version__, 'requests': requests, 'errors': errors, 'cached': len(self.cache)}
+
+    def shutdown(self, params):
+        '''
+        Stop serving once the current requests are answered.
+        '''
+        self.done.set()
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+        return True
+
+    def _parse(self, params):
+        '''
+        Parse the input of a request with the shared include cache, raises SyntaxError with the message the command-line tool prints.
+        '''
+        name, path, source, cwd = _input(params)
+        if source is None:
+            mal = _Parser(path, self.cache, cwd)
+            mal.parse()
+        else:
+            stream = io.StringIO()
+            stream.name = '<stdin>'
+            mal = _Parser(stream, self.cache, cwd)
+            mal.feed(source)
+            if not mal.stop:
+                mal.close()
+        if mal.stop:
+            raise SyntaxError(_rename(mal.error, path, name))
+        return mal
+
+    def serve(self, path = None):
+        '''
+        Serve on a Unix socket until shut down, or on stdin/stdout when no path is given.
+        '''
+        return self.serve_socket(path) if path else self.serve_stdio()
+
+    def serve_stdio(self, stdin = None, stdout = None):
+        '''
+        Read requests from stdin and write responses to stdout as they complete, in any order.
+        Serves until the end of input, or the line after a shutdown request.
+        '''
+        stdin, stdout = stdin or sys.stdin, stdout or sys.stdout
+        lock = threading.Lock()
+
+        def answer(line):
+            '''
+            Handle a request line in a worker thread, writing its reply whole.
+            '''
+            if (reply := self.handle(line)) is not None:
+                with lock:
+                    stdout.write(reply)
+                    stdout.flush()
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for line in stdin:
+                if self.done.is_set():
+                    break
+                if line.strip():
+                    pool.submit(answer, line)
+
+    def serve_socket(self, path):
+        '''
+        Accept connections on a Unix socket readable only by the current user, each handled in its own thread.
+        A stale socket file is replaced, one with a live server behind it raises OSError.
+        '''
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError('Unix sockets are not supported on this platform, serve on stdin/stdout instead.')
+        if os.path.exists(path):
+            with socket.socket(socket.AF_UNIX) as s:
+                try:
+                    s.connect(path)
+                except OSError:
+                    os.remove(path)
+                else:
+                    raise OSError(f'A server is already listening on {path}')
+        server = self
+
+        class Connection(socketserver.StreamRequestHandler):
+            '''
+            A client connection, served by its own thread.
+            '''
+
+            def handle(self):
+                '''
+                Answer each request line of a connection in turn, until the client closes it.
+                '''
+                for line in self.rfile:
+                    if line.strip() and (reply := server.handle(line)) is not None:
+                        self.wfile.write(reply.encode())
+                        self.wfile.flush()
+
+        mask = os.umask(0o177)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(path, Connection)
+        finally:
+            os.umask(mask)
+        self._server.daemon_threads = True
+        try:
+            with self._server:
+                self._server.serve_forever()
+        finally:
+            self._server = None
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+class Client:
+    '''
+    Connection to a server on a Unix socket, use as a context manager.
+    '''
+
+    def __init__(self, path, timeout = None):
+        '''
+        Connect to the server, raises OSError if it cannot be reached.
+        '''
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError('Unix sockets are not supported on this platform.')
+        self.socket = socket.socket(socket.AF_UNIX)
+        try:
+            self.socket.settimeout(timeout)
+            self.socket.connect(path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile('rwb')
+        self.ids = 0
+
+    def __enter__(self):
+        '''
+        The connected client itself.
+        '''
+        return self
+
+    def __exit__(self, *exc):
+        '''
+        Close the connection, whether or not the block raised.
+        '''
+        self.close()
+
+    def call(self, method, **params):
+        '''
+        Send a request and wait for its result.
+        Raises SyntaxError with the message of a failed conversion, and ValueError for other errors.
+        '''
+        self.ids += 1
+        self.file.write(json.dumps({'jsonrpc': '2.0', 'id': self.ids, 'method': method, 'params': params}).encode() + b'\n')
+        self.file.flush()
+        if not (line := self.file.readline()):
+            raise ConnectionError('The server closed the connection.')
+        reply = json.loads(line)
+        if 'error' in reply:
+            error = reply['error']
+            raise (SyntaxError if error['code'] == FAILED else ValueError)(error['message'])
+        return reply['result']
+
+    def close(self):
+        '''
+        Close the connection to the server, it cannot be used after.
+        '''
+        self.file.close()
+        self.socket.close()
+
+def convert(client, file, out, reverse = False, pretty = True, flatten = False):
+    '''
+    Convert a file through a connected Client, writing the same output and messages as demal.convert().
+    Returns 1 when the conversion failed, including when the connection is lost once the input was sent.
+    '''
+    if file is not sys.stdin and not os.path.isfile(file):
+        print(f'Error while opening {file}', file=sys.stderr)
+        return 1
+    params = {'cwd': os.getcwd()}
+    if file is sys.stdin:
+        params['source'] = sys.stdin.read()
+    else:
+        params['file'] = file
+    if not reverse:
+        params.update(pretty=pretty, flatten=flatten)
+    try:
+        text = client.call('dump_mal' if reverse else 'dump', **params)['text']
+    except SyntaxError as e:
+        print(e, file=sys.stderr, flush=True)
+        return 1
+    except (OSError, ValueError) as e:
+        print(f'Error: the server failed to convert {file}: {e}', file=sys.stderr, flush=True)
+        return 1
+    MalParser(file)._write((text,), out, '.mal' if reverse else '.json')
+
+def _input(params):
+    '''
+    Name, path, source and working directory of a request, raises TypeError if they are missing or of the wrong type.
+    '''
+    cwd = _param(params, 'cwd', str, os.getcwd())
+    name, source = _param(params, 'file', str, None), _param(params, 'source', str, None)
+    if (name is None) == (source is None):
+        raise TypeError('expected either file or source')
+    if source is not None:
+        return '<stdin>', None, source, cwd
+    path = os.path.join(cwd, name)
+    if not os.path.isfile(path):
+        raise SyntaxError(f'Error while opening {name}')
+    return name, path, None, cwd
+
+def _param(params, key, kind, default):
+    '''
+    A request parameter of the given type, or its default when absent.
+    '''
+    value = params.get(key, default)
+    if value is not default and type(value) is not kind:
+        raise TypeError(f'{key} must be {kind.__name__}')
+    return value
+
+def _rename(message, path, name):
+    '''
+    Name the input in a message as the client did, rather than by its path on the server.
+    '''
+    return message.replace(path, name) if path and path != name else message
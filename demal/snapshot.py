@@ -0,0 +1,188 @@
+'''
+demal.snapshot
+--------------
+Binary snapshots of parse results that load faster than JSON, one category at a time if need be.
+With 16000 synthetic assets (tests/bench-snapshot.py) a full load is about 1.3x as fast as json.load
+on compact JSON and 2.7x as fast as MalParser.load(), while a single category is about 4.5x as fast.
+'''
+
+import io, json, zlib, struct, pickle, contextlib
+
+MAGIC = b'DEMALS1\0'
+
+# The length and CRC-32 before the header and each section.
+SECTION = struct.Struct('<II')
+
+class _Pickler(pickle.Pickler):
+    '''
+    Pickle strings as indexes into the string table, adding those not in it yet.
+    '''
+
+    def __init__(self, file, strings):
+        '''
+        Pickle into a binary stream, strings mapping each string seen so far to its index.
+        '''
+        super().__init__(file, 4)
+        self.strings = strings
+
+    def persistent_id(self, obj):
+        '''
+        The index of a string in the string table, None to pickle anything else as usual.
+        '''
+        if type(obj) is str:
+            if (i := self.strings.get(obj)) is None:
+                i = self.strings[obj] = len(self.strings)
+            return i
+        return None
+
+class _Unpickler(pickle.Unpickler):
+    '''
+    Unpickle built-in containers whose strings are in the string table, anything else is refused.
+    '''
+
+    def find_class(self, module, name):
+        '''
+        Refuse every class, a snapshot only holds built-in containers and scalars.
+        '''
+        raise pickle.UnpicklingError(f'Unexpected object in demal snapshot: {module}.{name}')
+
+def save(result, file):
+    '''
+    Write a result dictionary to a binary file or stream, returning the number of bytes written: a JSON header
+    with the key order and section offsets, then the string table, top-level values, associations and each category.
+    '''
+    strings, sections = {}, []
+
+    def section(value):
+        '''
+        Pickle a value as the next section, returning its number.
+        '''
+        buffer = io.BytesIO()
+        _Pickler(buffer, strings).dump(value)
+        sections.append(buffer.getvalue())
+        return len(sections) - 1
+
+    categories = result.get('categories')
+    categories = categories if type(categories) is dict else {}
+    root = section({k: v for k, v in result.items() if k not in ('categories', 'associations')})
+    links = section(result['associations']) if 'associations' in result else None
+    names = [(name, section(category)) for name, category in categories.items()]
+    table = json.dumps(list(strings), ensure_ascii=False).encode()
+    sections.insert(0, table)
+
+    # Offsets from the end of the header.
+    offsets, position = [], 0
+    for data in sections:
+        offsets.append(position)
+        position += SECTION.size + len(data)
+    header = json.dumps({'keys': list(result), 'sections': offsets, 'strings': 0, 'root': root + 1,
+                         'associations': None if links is None else links + 1,
+                         'categories': [(name, i + 1) for name, i in names]}, ensure_ascii=False).encode()
+
+    with (open(file, 'wb') if type(file) is str else contextlib.nullcontext(file)) as f:
+        f.write(MAGIC + SECTION.pack(len(header), zlib.crc32(header)) + header)
+        for data in sections:
+            f.write(SECTION.pack(len(data), zlib.crc32(data)) + data)
+    return len(MAGIC) + SECTION.size + len(header) + position
+
+class Snapshot:
+    '''
+    A snapshot read into memory, decoding sections on demand: load() gives the whole result,
+    category() a single category. Raises ValueError if the file is not a snapshot or is corrupt.
+    '''
+
+    def __init__(self, file):
+        '''
+        Read a snapshot from a binary file or stream, checking its header and string table.
+        '''
+        with (open(file, 'rb') if type(file) is str else contextlib.nullcontext(file)) as f:
+            self.data = f.read()
+        self.name = file if type(file) is str else getattr(file, 'name', '<stream>')
+        if self.data[:len(MAGIC)] != MAGIC:
+            if self.data[:len(MAGIC) - 2] == MAGIC[:-2]:
+                raise ValueError(f'Unsupported demal snapshot version in {self.name}')
+            raise ValueError(f'Not a demal snapshot: {self.name}')
+        header = self._read(len(MAGIC), 'header')
+        self.header = json.loads(header)
+        start = len(MAGIC) + SECTION.size + len(header)
+        self.sections = [x + start for x in self.header['sections']]
+        # Each distinct string is one object, shared by every section decoded.
+        self.strings = json.loads(self._section(self.header['strings'], 'string table'))
+        self.categories = dict(self.header['categories'])
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f"<Snapshot object: '{self.name}', {len(self.categories)} categories, {len(self.strings)} strings>"
+
+    def load(self, categories = None):
+        '''
+        The result dictionary, with every category or only those named.
+        '''
+        root = self._decode(self.header['root'], 'top-level values')
+        result = {}
+        for key in self.header['keys']:
+            if key == 'categories':
+                names = self.categories if categories is None else [x for x in self.categories if x in categories]
+                result[key] = {name: self.category(name) for name in names}
+            elif key == 'associations':
+                result[key] = self.associations()
+            elif type(root) is dict and key in root:
+                result[key] = root[key]
+            else:
+                raise ValueError(f'Corrupt demal snapshot: top-level values lack {key!r} in {self.name}')
+        return result
+
+    def category(self, name):
+        '''
+        A single category dictionary, decoded from its own section, raises KeyError if there is no such category.
+        '''
+        return self._decode(self.categories[name], f'category {name}')
+
+    def associations(self):
+        '''
+        The associations list, empty if the result has none.
+        '''
+        i = self.header['associations']
+        return [] if i is None else self._decode(i, 'associations')
+
+    def _read(self, offset, what):
+        '''
+        Data of the length-prefixed section at an offset, once its checksum matches.
+        '''
+        if offset + SECTION.size > len(self.data):
+            raise ValueError(f'Truncated demal snapshot: {self.name}')
+        size, crc = SECTION.unpack_from(self.data, offset)
+        data = self.data[offset + SECTION.size:offset + SECTION.size + size]
+        if len(data) != size:
+            raise ValueError(f'Truncated demal snapshot: {self.name}')
+        if zlib.crc32(data) != crc:
+            raise ValueError(f'Corrupt demal snapshot: {what} fails its checksum in {self.name}')
+        return data
+
+    def _section(self, i, what):
+        '''
+        Data of a section by number, named by what in errors.
+        '''
+        return self._read(self.sections[i], what)
+
+    def _decode(self, i, what):
+        '''
+        Unpickle a section, its strings taken from the string table.
+        '''
+        unpickler = _Unpickler(io.BytesIO(self._section(i, what)))
+        unpickler.persistent_load = self._string
+        try:
+            return unpickler.load()
+        except Exception as e:
+            # Crafted data that passes the checksum can make the unpickler fail in many ways, none of them a class lookup.
+            raise ValueError(f'Corrupt demal snapshot: {what} in {self.name}: {e!r}') from None
+
+    def _string(self, pid):
+        '''
+        The string at an index into the string table, for the unpickler.
+        '''
+        if type(pid) is not int or not 0 <= pid < len(self.strings):
+            raise pickle.UnpicklingError(f'bad string index {pid!r}')
+        return self.strings[pid]
@@ -0,0 +1,163 @@
+'''
+demal.trace
+-----------
+Structured tracing of conversions: source lines read per parse method, phase timings and include fan-out.
+'''
+
+import sys, json, time, contextlib, collections
+
+from .demal import r, c, w, z
+
+class Tracer:
+    '''
+    Record trace events and pass each one to a sink, any callable taking an event dictionary.
+    Use as MalParser(file, trace=Tracer(sink)), parsers without a tracer do no tracing work at all.
+    '''
+
+    def __init__(self, sink = None, lines = True):
+        '''
+        Trace into the given sink, an in-memory list by default. Without lines, only their counts are kept.
+        '''
+        self.sink = MemorySink() if sink is None else sink
+        self.lines = lines
+        self.phases = collections.defaultdict(lambda: [0, 0.0])
+        self.methods = collections.Counter()
+        self.includes = collections.defaultdict(list)
+
+    def __repr__(self):
+        '''
+        Object representation.
+        '''
+        return f'<Tracer object: {sum(self.methods.values())} lines, {len(self.phases)} phases>'
+
+    def emit(self, event, **fields):
+        '''
+        Send an event to the sink.
+        '''
+        self.sink(dict(event=event, **fields))
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        '''
+        Time a phase of work, such as read, parse, dump or validate.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            total = self.phases[name]
+            total[0] += 1
+            total[1] += seconds
+            self.emit('phase', name=name, seconds=seconds, **fields)
+
+    def include(self, file, included, cached = False):
+        '''
+        Record a file including another.
+        '''
+        self.includes[file].append(included)
+        self.emit('include', file=file, include=included, cached=cached)
+
+    def line(self, code, tok):
+        '''
+        Record a source line of a Lexer as its first token is consumed, with the parse method consuming it.
+        '''
+        # Frames of the callers of the Lexer's __next__, up to the first parse method.
+        frame = sys._getframe(2)
+        while frame is not None and not frame.f_code.co_name.startswith('parse'):
+            frame = frame.f_back
+        method = 'parse' if frame is None else frame.f_code.co_name
+        self.methods[method] += 1
+        if self.lines:
+            self.emit('line', file=code.name, line=tok.line, method=method, text=code.line(tok))
+
+    def summary(self):
+        '''
+        Totals so far: count and seconds per phase, lines per parse method, and files included by each file.
+        '''
+        return {
+            'phases': {k: {'count': n, 'seconds': s} for k, (n, s) in self.phases.items()},
+            'methods': dict(self.methods.most_common()),
+            'includes': {k: list(v) for k, v in self.includes.items()}
+        }
+
+    def close(self):
+        '''
+        Send the summary to the sink, then close the sink if it can be.
+        '''
+        self.emit('summary', **self.summary())
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+
+class MemorySink(list):
+    '''
+    Keep events in a list.
+    '''
+
+    def __call__(self, event):
+        '''
+        Append an event dictionary to the list.
+        '''
+        self.append(event)
+
+class JsonSink:
+    '''
+    Write events as JSON lines to a file or stream.
+    '''
+
+    def __init__(self, file):
+        '''
+        Open a file for writing, or write to a stream without closing it.
+        '''
+        self.owned = not hasattr(file, 'write')
+        self.file = open(file, 'w', encoding='utf-8', newline='\n') if self.owned else file
+
+    def __call__(self, event):
+        '''
+        Write an event dictionary as one line of JSON.
+        '''
+        self.file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        '''
+        Close the file if the sink opened it, otherwise only flush the stream.
+        '''
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+class StderrSink:
+    '''
+    Print events for people reading a terminal, the sink used by debug mode.
+    '''
+
+    def __init__(self, file = None):
+        '''
+        Print to the given stream, standard error by default.
+        '''
+        self.file = file
+
+    def __call__(self, event):
+        '''
+        Print an event: lines read, phase timings, includes and the summary each have their own format.
+        '''
+        kind, f = event['event'], self.file or sys.stderr
+        if kind == 'line':
+            print(w + event['method'], z + 'got:' + r, repr(event['text']) + z, file=f, flush=True)
+        elif kind == 'phase':
+            where = ' '.join(f'{k}={v}' for k, v in event.items() if k not in ('event', 'name', 'seconds'))
+            print(f'{c}{event["name"]}{z} {event["seconds"] * 1000:.3f} ms {where}'.rstrip(), file=f, flush=True)
+        elif kind == 'include':
+            print(f'{c}include{z} {event["file"]} -> {event["include"]}' + (' (cached)' if event['cached'] else ''), file=f, flush=True)
+        elif kind == 'summary':
+            lines = [f'{w}Phases:{z}']
+            lines += [f'  {k:<12} {v["count"]:>6} x {v["seconds"] * 1000:10.3f} ms' for k, v in event['phases'].items()]
+            lines.append(f'{w}Lines per parse method:{z}')
+            lines += [f'  {k:<20} {n:>8}' for k, n in event['methods'].items()]
+            if event['includes']:
+                lines.append(f'{w}Includes:{z}')
+                lines += [f'  {k} -> {len(v)}: {", ".join(v)}' for k, v in event['includes'].items()]
+            print('\n'.join(lines), file=f, flush=True)
+        else:
+            print(kind, {k: v for k, v in event.items() if k != 'event'}, file=f, flush=True)
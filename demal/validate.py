@@ -0,0 +1,267 @@
+'''
+demal.validate
+--------------
+Semantic checks of a whole model: asset references, inheritance, multiplicities, probability distributions
+and attack step expressions, reported as diagnostics with the position of the declaration at fault.
+'''
+
+import os, re, json, contextlib, collections, concurrent.futures
+
+from .demal import MalParser, Handler
+
+class Diagnostic(collections.namedtuple('Diagnostic', 'file line column severity code message')):
+    '''
+    A problem found in a model, at a 1-based line and column of a file when it could be located.
+    Severity is error or warning, code names the check, e.g. unknown-asset.
+    '''
+    __slots__ = ()
+
+    def __str__(self):
+        '''
+        The diagnostic as a file:line:column: severity: message [code] line, with 0 for an unknown position.
+        '''
+        return f'{self.file}:{self.line or 0}:{self.column or 0}: {self.severity}: {self.message} [{self.code}]'
+
+# Association multiplicities: a number or *, or a range of them.
+MULTIPLICITY = re.compile(r'(\d+|\*)(?:\.\.(\d+|\*))?\Z')
+
+# Where parse errors say they happened.
+POSITION = re.compile(r' in (.+?) at line (\d+)(?:, column (\d+))?')
+
+def validate(mal, locate = True):
+    '''
+    Check the results of a parsed MalParser, returning a list of Diagnostic sorted by position.
+    Every check is a single pass over the index of the results. With locate, the sources are scanned
+    for positions once there is something to report.
+    '''
+    found = []
+    index = mal.index
+    _assets(index, found)
+    _inheritance(index, found)
+    _associations(index, found)
+    _distributions(index, found)
+    _expressions(mal, index, found)
+    if not found:
+        return []
+    positions = _locate(mal) if locate else {}
+    name = mal.src if type(mal.src) is str else getattr(mal.src, 'name', '<stream>')
+    diagnostics = [Diagnostic(*positions.get(key, (name, None, None)), severity, code, message) for key, severity, code, message in found]
+    return sorted(diagnostics, key=lambda x: (x.file != name, x.file, x.line or 0, x.column or 0))
+
+def _assets(index, found):
+    '''
+    Assets declared more than once, only the first declaration is used.
+    '''
+    seen = collections.Counter()
+    for qualified in index.names:
+        name = qualified.split('.', 1)[1]
+        if seen[name]:
+            found.append((('asset', name, seen[name]), 'warning', 'duplicate-asset', f"Asset '{name}' is declared more than once, {qualified} is ignored"))
+        seen[name] += 1
+
+def _inheritance(index, found):
+    '''
+    Assets extending unknown assets, and inheritance cycles, each reported once.
+    '''
+    done = set()
+    for name in index.parents:
+        chain, asset = [], name
+        while asset in index.parents and asset not in done and asset not in chain:
+            chain.append(asset)
+            asset = index.parents[asset]
+        if asset in chain:
+            cycle = chain[chain.index(asset):]
+            found.append((('asset', min(cycle), 0), 'error', 'inheritance-cycle', 'Inheritance cycle: ' + ' -> '.join(cycle + [asset])))
+        elif asset not in index.assets and chain:
+            found.append((('asset', chain[-1], 0), 'error', 'unknown-parent', f"Asset '{chain[-1]}' extends unknown asset '{asset}'"))
+        done.update(chain)
+
+def _associations(index, found):
+    '''
+    Associations between unknown assets, with invalid multiplicities, or naming a field twice on an asset.
+    '''
+    fields, seen = {}, collections.Counter()
+    for link in index.result.get('associations') or ():
+        key = ('association', link['name'], link['asset_l'], link['field_l'], link['mult_l'], link['mult_r'], link['field_r'], link['asset_r'])
+        seen[key] += 1
+        key += (seen[key] - 1,)
+        for asset in dict.fromkeys((link['asset_l'], link['asset_r'])):
+            if asset not in index.assets:
+                found.append((key, 'error', 'unknown-asset', f"Association {link['name']} refers to unknown asset '{asset}'"))
+        for side in ('mult_l', 'mult_r'):
+            if not (m := MULTIPLICITY.match(link[side])) or m[1] == '*' and m[2] or m[2] and m[2] != '*' and int(m[1]) > int(m[2]):
+                found.append((key, 'error', 'invalid-multiplicity', f"Association {link['name']} has invalid multiplicity '{link[side]}'"))
+        for asset, field in dict.fromkeys(((link['asset_l'], link['field_r']), (link['asset_r'], link['field_l']))):
+            if (asset, field) in fields and fields[asset, field] != key:
+                found.append((key, 'error', 'duplicate-field', f"Field '{field}' of asset '{asset}' is also defined by association {fields[asset, field][1]}"))
+            fields.setdefault((asset, field), key)
+
+def _distributions(index, found):
+    '''
+    Probability distributions of unknown families or with invalid parameters, each distinct text parsed once.
+    '''
+    from .distribution import Distributions
+    table = Distributions()
+    for asset, data in index.assets.items():
+        attributes = data.get('attributes')
+        for step, attr in (attributes.items() if type(attributes) is dict else ()):
+            if type(attr) is dict and type(text := attr.get('probability')) is str:
+                try:
+                    table.parse(text)
+                except ValueError as e:
+                    found.append((('step', asset, step, 0), 'error', 'invalid-distribution', f'{asset}.{step}: {e}'))
+
+def _expressions(mal, index, found):
+    '''
+    Attack step expressions that do not resolve through association fields to attack steps (or assets for requirements).
+    Each asset's own expressions are resolved once, from that asset.
+    '''
+    from .graph import _Compiler
+    compiler = _Compiler(index, mal.expressions)
+    for asset, data in index.assets.items():
+        attributes = data.get('attributes')
+        for step, attr in (attributes.items() if type(attributes) is dict else ()):
+            for field in ('leads_to', 'append', 'require'):
+                for key, text in (attr.get(field) if type(attr) is dict and type(attr.get(field)) is dict else {}).items():
+                    where = ('expression', asset, step, field, key, 0)
+                    try:
+                        nodes = compiler.parse(text)
+                    except SyntaxError as e:
+                        found.append((where, 'error', 'syntax', f'{asset}.{step}: {e}'))
+                        continue
+                    try:
+                        for node in nodes:
+                            if field == 'require' or not key.isdigit():
+                                compiler.evaluate(node, {asset})
+                            else:
+                                compiler.steps(asset, node)
+                    except LookupError as e:
+                        found.append((where, 'error', 'unresolved', f'{asset}.{step}: cannot resolve {text!r}: {e}'))
+                    except SyntaxError:
+                        # Inheritance cycles and unknown parents, reported on their own.
+                        pass
+
+class _Locator(Handler):
+    '''
+    Record the file, line and column of each declaration, by the keys diagnostics are reported with.
+    Keys end with the number of earlier declarations with the same key.
+    '''
+
+    def __init__(self, positions):
+        '''
+        Record into the given dictionary, set code to the Lexer of each file before reading it.
+        '''
+        self.positions = positions
+        self.counts = collections.Counter()
+        self.code = None
+        self.current = None
+        self.step = None
+
+    def _at(self, key):
+        '''
+        Record a key at the first token on the line of the last token read, numbering repeats of it.
+        '''
+        code, tok = self.code, self.code.last
+        data = code.data
+        start = data.rfind('\n' if code.chars else b'\n', 0, tok.start) + 1
+        prefix = data[start:tok.start] if code.chars else data[start:tok.start].decode('utf-8', 'replace')
+        self.counts[key] += 1
+        self.positions[key + (self.counts[key] - 1,)] = (code.name, tok.line, len(prefix) - len(prefix.lstrip()) + 1)
+
+    def category(self, name):
+        '''
+        Locate a category.
+        '''
+        self._at(('category', name))
+
+    def asset(self, name, extends, abstract):
+        '''
+        Locate an asset, the owner of the attack steps that follow.
+        '''
+        self.current = name
+        self._at(('asset', name))
+
+    def attribute(self, name, kind, probability, cia, tags):
+        '''
+        Locate an attack step of the current asset, the owner of the expressions that follow.
+        '''
+        self.step = name
+        self._at(('step', self.current, name))
+
+    def expression(self, field, key, value):
+        '''
+        Locate an expression of the current attack step, by field and key.
+        '''
+        self._at(('expression', self.current, self.step, field, key))
+
+    def association(self, *link):
+        '''
+        Locate an association, keyed by its name, assets, fields and multiplicities.
+        '''
+        self._at(('association',) + link)
+
+def _locate(mal):
+    '''
+    Positions of the declarations in a parser's source file and the files it includes, each file scanned once.
+    '''
+    positions = {}
+    if type(mal.src) is not str:
+        return positions
+    queue, seen, locator = [mal.src], set(), _Locator(positions)
+    while queue:
+        file = queue.pop(0)
+        if (path := os.path.realpath(file)) in seen:
+            continue
+        seen.add(path)
+        parser = MalParser(file)
+        try:
+            locator.code = code = parser.iterate(file)
+            queue += [parser.resolve(x, path) for _, x in parser.statements(code, locator) if x is not None]
+        except (SyntaxError, IOError):
+            pass
+    return positions
+
+def validate_file(file):
+    '''
+    Parse and check a file, returning its diagnostics, a parse error is one too.
+    '''
+    mal = MalParser(file)
+    try:
+        mal.parse_file(file)
+        mal.stop = False
+    except IOError as e:
+        return [Diagnostic(file, None, None, 'error', 'io', f'Error while opening {e.filename or file}')]
+    except SyntaxError as e:
+        where = POSITION.search(str(e))
+        line, column = (int(where[2]), int(where[3]) if where[3] else None) if where else (None, None)
+        return [Diagnostic(where[1] if where else file, line, column, 'error', 'syntax', str(e))]
+    return validate(mal)
+
+def validate_files(files, jobs = None):
+    '''
+    Check many files with a process pool, generating (file, diagnostics) in the order given.
+    Diagnostics of files included by several of them are only generated once.
+    '''
+    files = list(files)
+    jobs = min(jobs or os.cpu_count() or 1, len(files) or 1)
+    reported = set()
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+            results = pool.map(validate_file, files, chunksize=max(1, len(files) // (jobs * 4)))
+        else:
+            results = map(validate_file, files)
+        for file, diagnostics in zip(files, results):
+            yield file, [x for x in diagnostics if not (x in reported or reported.add(x))]
+
+def report(results, form = 'text', out = None):
+    '''
+    Print diagnostics as file:line:column: severity: message [code] lines, or JSON lines with form='json'.
+    Returns the number of errors and of warnings.
+    '''
+    counts = collections.Counter()
+    for file, diagnostics in results:
+        for x in diagnostics:
+            counts[x.severity] += 1
+            print(json.dumps(x._asdict()) if form == 'json' else x, file=out, flush=True)
+    return counts['error'], counts['warning']
@@ -0,0 +1,37 @@
+import io, re, sys, time, demal
+from corpus import generate
+
+# Microbenchmark: per-asset cost of MalParser.parse on a synthetic corpus.py spec, and the regular expressions
+# compiled or looked up while parsing, none since the shared GRAMMAR tables are compiled once at import.
+# python bench-grammar.py [assets]
+
+ASSETS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+PER_CATEGORY = 500
+REPEAT = 3
+
+data = generate(categories=max(ASSETS // PER_CATEGORY, 1), assets=min(ASSETS, PER_CATEGORY), associations=ASSETS // 2)['main.mal']
+print(f'Synthetic spec: {ASSETS} assets, {len(data)} bytes')
+
+# Every re function given a pattern goes through re._compile, cached or not.
+compiles = 0
+compile = re._compile
+def counting(*args, **kwargs):
+    global compiles
+    compiles += 1
+    return compile(*args, **kwargs)
+
+times = []
+for _ in range(REPEAT):
+    m = demal.MalParser('bench')
+    re._compile = counting
+    try:
+        start = time.perf_counter()
+        m.parse(io.StringIO(data))
+        times.append(time.perf_counter() - start)
+    finally:
+        re._compile = compile
+    assert sum(len(x['assets']) for x in m['categories'].values()) == ASSETS, 'Parse failed'
+parse = min(times)
+
+print(f'Parse:            {parse:.3f}s  {parse / ASSETS * 1e6:.2f} us/asset')
+print(f'Regex compiles:   {compiles // REPEAT} per parse')
@@ -0,0 +1,36 @@
+import gc, io, sys, json, time, tracemalloc, demal
+from corpus import generate
+
+# Memory benchmark: the result dictionary against the __slots__ object model, both built from the same JSON
+# so that neither shares strings with the other. The spec is the synthetic one of corpus.py.
+# python bench-model.py [assets]
+
+ASSETS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+PER_CATEGORY = 500
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+data = generate(categories=max(ASSETS // PER_CATEGORY, 1), assets=min(ASSETS, PER_CATEGORY), associations=ASSETS // 2)['main.mal']
+m = demal.MalParser('bench')
+m.parse(io.StringIO(data))
+assert sum(len(x['assets']) for x in m['categories'].values()) == ASSETS, 'Parse failed'
+text = json.dumps(m.result)
+print(f'Synthetic spec: {ASSETS} assets, {len(data)} bytes of MAL, {len(text)} bytes of JSON')
+
+result, dict_size = measure(lambda: json.loads(text))
+del result
+model, model_size = measure(lambda: demal.Model.from_dict(json.loads(text)))
+start = time.perf_counter()
+assert model.to_dict() == m.result, 'Conversion is not lossless'
+back = time.perf_counter() - start
+
+print(f'Result dictionary: {dict_size / 2**20:7.1f} MB  {dict_size / len(data):.1f} bytes per source byte')
+print(f'Object model:      {model_size / 2**20:7.1f} MB  {model_size / len(data):.1f} bytes per source byte ({dict_size / model_size:.1f}x smaller)')
+print(f'Back to a dictionary: {back:.3f}s')
@@ -0,0 +1,31 @@
+import io, sys, time, demal
+from corpus import generate
+from demal.distribution import parse
+
+# Sampling speed: parsing each distribution text for every sample, as simulators did, against the Sampler
+# in Python and, when installed, with NumPy. python bench-sampler.py [assets per category] [samples]
+
+ASSETS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+SAMPLES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+def timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+m = demal.MalParser('main.mal')
+m.parse(io.StringIO(generate(categories=4, assets=ASSETS)['main.mal']))
+graph = m.compile()
+sampler = graph.sampler()
+texts = [graph.dists[i] if i >= 0 else None for i in graph.dist]
+print(f'Synthetic spec: {len(graph)} attack steps, {len(graph.dists)} distinct distributions, {SAMPLES} samples of each')
+
+baseline = timed(lambda: [[parse(x).sample() if x else 0.0 for x in texts] for _ in range(SAMPLES)])
+rows = [('Parsing every sample', baseline), ('Sampler, Python', timed(lambda: sampler.sample(SAMPLES, seed=0, vectorize=False)))]
+try:
+    sampler.sample(1, vectorize=True)  # imports NumPy before timing, as a simulator would have it loaded already
+    rows.append(('Sampler, NumPy', timed(lambda: sampler.sample(SAMPLES, seed=0, vectorize=True))))
+except ImportError:
+    print('NumPy is not installed, skipping the vectorized sampler.')
+for name, seconds in rows:
+    print(f'{name:22} {seconds * 1000:9.1f} ms  {len(graph) * SAMPLES / seconds / 1e6:7.2f} M samples/s  {baseline / seconds:6.1f}x')
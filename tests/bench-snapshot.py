@@ -0,0 +1,49 @@
+import gc, io, os, sys, json, time, tempfile, demal
+from corpus import generate
+
+# Load time and size of a binary snapshot against the JSON output of the same synthetic spec.
+# python bench-snapshot.py [assets per category]
+
+ASSETS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+REPEAT = 5
+
+def best(run):
+    # Without the garbage collector, as timeit does, so that collections of earlier results are not counted.
+    times = []
+    for _ in range(REPEAT):
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        gc.enable()
+    return min(times)
+
+files = generate(categories=8, assets=ASSETS, associations=ASSETS * 8)
+m = demal.MalParser('main.mal')
+m.parse(io.StringIO(files['main.mal']))
+first = next(iter(m.result['categories']))
+
+with tempfile.TemporaryDirectory() as root:
+    paths = {x: os.path.join(root, x) for x in ('pretty.json', 'compact.json', 'main.snapshot')}
+    with open(paths['pretty.json'], 'w') as f:
+        m.dump(f)
+    with open(paths['compact.json'], 'w') as f:
+        m.dump(f, pretty=False)
+    m.save_snapshot(paths['main.snapshot'])
+    print(f'Synthetic spec: {ASSETS * 8} assets, {len(files["main.mal"])} bytes of MAL')
+
+    def load(path, categories = None):
+        loaded = demal.MalParser(path)
+        (loaded.load_snapshot(path, categories) if path.endswith('.snapshot') else loaded.load(path))
+        return loaded.result
+
+    assert load(paths['main.snapshot']) == load(paths['compact.json']) == m.result, 'Snapshot is not lossless'
+    json_time = best(lambda: json.load(open(paths['compact.json'])))
+    rows = [('JSON, indented', paths['pretty.json'], best(lambda: json.load(open(paths['pretty.json'])))),
+            ('JSON, compact', paths['compact.json'], json_time),
+            ('JSON, checked by load()', paths['compact.json'], best(lambda: load(paths['compact.json']))),
+            ('Snapshot', paths['main.snapshot'], best(lambda: load(paths['main.snapshot']))),
+            ('Snapshot, one category', paths['main.snapshot'], best(lambda: load(paths['main.snapshot'], [first])))]
+    for name, path, seconds in rows:
+        print(f'{name:24} {os.path.getsize(path) / 2**20:7.2f} MB  {seconds * 1000:8.1f} ms  {json_time / seconds:5.1f}x')
@@ -0,0 +1,120 @@
+import io, os, sys, json, time, platform, argparse, tempfile, subprocess, contextlib, demal, corpus
+
+# Benchmark suite: parse, dump, dump_mal, merging and the command-line tool on a synthetic corpus.
+# Each benchmark runs in its own process so that its peak RSS is its own. Results are saved as JSON,
+# pass an earlier file with --compare to see the change, e.g.
+#   python bench-suite.py --assets 500 --output new.json --compare old.json
+
+BENCHMARKS = ('parse', 'dump', 'dump_mal', 'add', 'cli', 'cli_reverse')
+
+def peak_rss():
+    '''
+    Peak resident set size of this process and its finished children in MB, None where unsupported.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    return max(resource.getrusage(x).ru_maxrss for x in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / scale
+
+def best(call, repeat):
+    '''
+    Fastest of several runs, in seconds.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def parsed(file):
+    m = demal.MalParser(file)
+    m.parse()
+    return m
+
+def run(name, root, repeat):
+    '''
+    Time one benchmark on the corpus in root/spec (and root/other to merge with), returning seconds and the bytes it processed.
+    '''
+    size = lambda path: sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+    main, sources = os.path.join(root, 'spec', 'main.mal'), size(os.path.join(root, 'spec'))
+    out = os.path.join(root, 'out')
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    if name == 'parse':
+        return best(lambda: parsed(main), repeat), sources
+    if name == 'dump':
+        m = parsed(main)
+        with quiet:
+            return best(lambda: m.dump(out + '.json'), repeat), os.path.getsize(out + '.json')
+    if name == 'dump_mal':
+        m = parsed(main)
+        with quiet:
+            return best(lambda: m.dump_mal(out + '.mal'), repeat), os.path.getsize(out + '.mal')
+    if name == 'add':
+        m, other = parsed(main), parsed(os.path.join(root, 'other', 'main.mal'))
+        return best(lambda: m + other, repeat), sources + size(os.path.join(root, 'other'))
+    if name == 'cli':
+        command = ['demal', main, out + '.json']
+        return best(lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL), repeat), sources
+    if name == 'cli_reverse':
+        subprocess.run(['demal', main, out + '.json'], check=True, stdout=subprocess.DEVNULL)
+        command = ['demal', out + '.json', out + '.mal', '-r']
+        return best(lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL), repeat), os.path.getsize(out + '.json')
+    raise ValueError(f'Unknown benchmark: {name}')
+
+def report(results, previous = None):
+    '''
+    Print a table of results, with the change in throughput from a previous run if given.
+    '''
+    old = {x['name']: x for x in previous['benchmarks']} if previous else {}
+    print(f'{"benchmark":<12} {"seconds":>9} {"MB/s":>8} {"peak RSS MB":>12}' + ('   change' if old else ''))
+    for x in results['benchmarks']:
+        rss = f'{x["peak_rss_mb"]:12.1f}' if x['peak_rss_mb'] is not None else f'{"-":>12}'
+        line = f'{x["name"]:<12} {x["seconds"]:9.4f} {x["mb_per_s"]:8.2f} {rss}'
+        if x['name'] in old:
+            line += f' {x["mb_per_s"] / old[x["name"]]["mb_per_s"] - 1:+8.1%}'
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark demal on a synthetic corpus.')
+    for key, value in corpus.DEFAULTS.items():
+        parser.add_argument('--' + key, type=type(value), default=value, help='corpus parameter')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the fastest is kept')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--output', default='bench-results.json', help='where to save the results')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: run a single benchmark and hand back its numbers.
+    if args.run:
+        seconds, size = run(args.run, args.root, args.repeat)
+        print(json.dumps({'name': args.run, 'seconds': seconds, 'bytes': size, 'mb_per_s': size / seconds / 2**20, 'peak_rss_mb': peak_rss()}))
+        return
+
+    params = {k: getattr(args, k) for k in corpus.DEFAULTS}
+    results = {'demal': demal.demal.__version__, 'python': platform.python_version(), 'platform': platform.platform(),
+               'corpus': params, 'repeat': args.repeat, 'benchmarks': []}
+    with tempfile.TemporaryDirectory() as root:
+        main = corpus.write(os.path.join(root, 'spec'), **params)
+        corpus.write(os.path.join(root, 'other'), **dict(params, seed=params['seed'] + 1))
+        print(f'Corpus: {os.path.getsize(main)} bytes in main.mal, {params}\n')
+        for name in args.only:
+            child = subprocess.run([sys.executable, __file__, '--run', name, '--root', root, '--repeat', str(args.repeat)],
+                                   check=True, stdout=subprocess.PIPE, universal_newlines=True)
+            results['benchmarks'].append(json.loads(child.stdout.splitlines()[-1]))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    report(results, previous)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nSaved to {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import os, random, argparse
+
+# Deterministic generator of synthetic MAL specifications for benchmarks: the same parameters and seed
+# always give the same files. Import generate() or write(), or run: python corpus.py <dir> [--assets 200 ...]
+
+DEFAULTS = dict(seed=0, categories=4, assets=50, attributes=5, associations=100, comments=0.1, includes=0, expression=3)
+
+KINDS = ('|', '&', '#', 'E', '!E')
+DISTRIBUTIONS = ('Exponential(0.1)', 'Bernoulli(0.5)', 'Gamma(1.0, 2.0)', 'LogNormal(1, 3)', 'Uniform(0, 10)', 'Infinity', 'Zero')
+METAS = ('user info', 'developer info', 'modeler info')
+MULTS = ('1', '*', '0..1', '1..*')
+
+def generate(seed = 0, categories = 4, assets = 50, attributes = 5, associations = 100, comments = 0.1, includes = 0, expression = 3):
+    '''
+    Source of a synthetic specification as {file name: MAL text}, main.mal first.
+    categories and assets (per category) are spread over main.mal and a chain of includes files deep,
+    attributes are per asset, comments is the chance of a comment after any line,
+    expression is the number of dotted segments in each attack step expression.
+    '''
+    rnd = random.Random(seed)
+    names = [[f'Asset{c}_{a}' for a in range(assets)] for c in range(categories)]
+    every = [x for category in names for x in category]
+    steps = [f'step{i}' for i in range(attributes)]
+    fields = {x: [] for x in every}
+    links = []
+    for i in range(associations if every else 0):
+        left, right = rnd.choice(every), rnd.choice(every)
+        field_l, field_r = f'l{i}', f'r{i}'
+        fields[right].append((field_l, left))
+        fields[left].append((field_r, right))
+        links.append(f'  {left} [{field_l}] {rnd.choice(MULTS)} <-- Link{i % 50} --> {rnd.choice(MULTS)} [{field_r}] {right}')
+        if rnd.random() < 0.2:
+            links.append(f'    {rnd.choice(METAS)}: "link {i}"')
+
+    def expr(asset):
+        # Follow association fields where there are some, end on an attack step.
+        path = []
+        for _ in range(expression - 1):
+            if not fields[asset]:
+                break
+            field, asset = rnd.choice(fields[asset])
+            path.append(field)
+        return '.'.join(path + [rnd.choice(steps)])
+
+    def comment(lines):
+        if rnd.random() < comments:
+            lines.append(rnd.choice(('  // generated comment', '  /* block\n     comment */', '// note: "quoted" {braces}')))
+
+    def asset(lines, name, previous):
+        lines.append(f'  {"abstract " if rnd.random() < 0.1 else ""}asset {name}' +
+                     (f' extends {previous}' if previous and rnd.random() < 0.3 else '') + ' {')
+        comment(lines)
+        for step in steps:
+            kind = rnd.choice(KINDS)
+            extra = []
+            if kind in '|&' and rnd.random() < 0.5:
+                extra.append(f'[{rnd.choice(DISTRIBUTIONS)}]')
+            if rnd.random() < 0.2:
+                extra.append('{' + ','.join(sorted(rnd.sample('CIA', rnd.randint(1, 3)), key='CIA'.index)) + '}')
+            if rnd.random() < 0.1:
+                extra.append('@' + rnd.choice(('hidden', 'debug', 'trace')))
+            lines.append(f'    {kind} {step}' + (' ' if extra else '') + ' '.join(extra))
+            if rnd.random() < 0.2:
+                lines.append(f'      {rnd.choice(METAS)}: "about {step}"')
+            if kind in ('E', '!E'):
+                if fields[name]:
+                    lines.append(f'      <- {rnd.choice(fields[name])[0]}')
+            else:
+                exprs = [expr(name) for _ in range(rnd.randint(1, 3))]
+                if rnd.random() < 0.1 and fields[name]:
+                    exprs.insert(0, f'let v = {rnd.choice(fields[name])[0]}')
+                lines.append(f'      {"+>" if previous and rnd.random() < 0.05 else "->"} ' + ',\n         '.join(exprs))
+            comment(lines)
+        lines.append('  }')
+
+    files = [f'part{i}.mal' for i in range(includes)]
+    sources = {}
+    for i, file in enumerate(['main.mal'] + files):
+        lines = [f'// Synthetic specification, seed {seed}']
+        if i == 0:
+            lines += [f'#id: "synthetic{seed}"', '#version: "1.0.0"']
+        if i < len(files):
+            lines.append(f'include "{files[i]}"')
+        for c in range(i, categories, includes + 1):
+            lines.append(f'\ncategory Category{c}' + (f'\n  {rnd.choice(METAS)}: "category {c}"\n{{' if rnd.random() < 0.5 else ' {'))
+            previous = None
+            for name in names[c]:
+                asset(lines, name, previous)
+                previous = name
+            lines.append('}')
+            comment(lines)
+        if i == 0 and links:
+            lines += ['\nassociations {'] + links + ['}']
+        sources[file] = '\n'.join(lines) + '\n'
+    return sources
+
+def write(root, **params):
+    '''
+    Write a synthetic specification into a directory, returning the path of main.mal.
+    '''
+    os.makedirs(root, exist_ok=True)
+    for name, text in generate(**params).items():
+        with open(os.path.join(root, name), 'w', newline='\n') as f:
+            f.write(text)
+    return os.path.join(root, 'main.mal')
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic MAL specification.')
+    parser.add_argument('root', help='output directory, main.mal is written there with any included files')
+    for key, value in DEFAULTS.items():
+        parser.add_argument('--' + key, type=type(value), default=value)
+    args = vars(parser.parse_args())
+    main = write(args.pop('root'), **args)
+    print(f'{main}: {os.path.getsize(main)} bytes')
+
+if __name__ == '__main__':
+    main()
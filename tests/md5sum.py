@@ -1,9 +1,13 @@
-import io, sys, time, hashlib
+import io, os, sys, time, hashlib
 
 def fs(files):
     for file in files:
-        try:
+        # Outputs appear complete, once renamed into place, so wait for the file rather than a fixed time.
+        for _ in range(100):
             time.sleep(0.1)
+            if os.path.exists(file):
+                break
+        try:
             with io.open(file, 'rb') as f:
                 md5 = hashlib.md5(f.read())
                 print(md5.hexdigest())
@@ -0,0 +1,39 @@
+import io, os, sys, tempfile, demal
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        cache = demal.ResultCache(os.path.join(root, 'cache'), limit=2**20)
+        lib = os.path.join(root, 'lib.mal')
+        with io.open(lib, 'w') as f:
+            f.write('category L {\n}\n')
+
+        print('Entries are keyed by source and validated against included files.')
+        key = cache.key('include "lib.mal"\n')
+        assert cache.get(key, root) is None
+        cache.put(key, '{}\n', [lib], root)
+        assert cache.get(key, root) == '{}\n'
+        assert cache.key('include "lib.mal"\n') == key != cache.key('include "lib.mal"\n\n')
+        with io.open(lib, 'w') as f:
+            f.write('category L2 {\n}\n')
+        assert cache.get(key, root) is None
+
+        print('Least recently used entries are evicted first.')
+        keys = [cache.key(str(i)) for i in range(3)]
+        for i, k in enumerate(keys):
+            cache.put(k, '1234567890\n', base=root)
+            os.utime(os.path.join(cache.root, k + '.json'), (i, i))
+        cache.limit = 20
+        cache.put(keys[0], '1234567890\n', base=root)
+        assert [cache.get(k) is not None for k in keys] == [True, False, False], cache.stats()
+
+        print('Statistics persist between runs.')
+        stats = cache.stats()
+        cache.close()
+        again = demal.ResultCache(cache.root)
+        assert again.stats()['hits'] == stats['hits'] and stats['evictions'] == 2, stats
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
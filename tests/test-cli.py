@@ -1,4 +1,4 @@
-import io, os, sys, json, demal, hashlib
+import io, os, sys, json, demal, shutil, hashlib, tempfile
 
 def run(cmds):
     for cmd, md5, rem in cmds:
@@ -9,6 +9,18 @@ def run(cmds):
         assert p == md5, f'Expected {md5} but found {repr(p)}'
 
 def main():
+    # Convert in a scratch directory, the commands overwrite and remove the reference outputs other tests read.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        for name in ('test1.mal', 'test2.mal', 'md5sum.py'):
+            shutil.copy(name, root)
+        os.chdir(root)
+        try:
+            convert()
+        finally:
+            os.chdir(cwd)
+
+def convert():
     # Program to use to echo files
     view = 'type' if '\\' in os.popen('whoami').read() else 'cat'
 
@@ -46,6 +58,24 @@ def main():
         ]
         run(cmds)
 
+    # Many files at once, both directions
+    print('\nTesting: batch conversion')
+    with tempfile.TemporaryDirectory() as out:
+        md5 = lambda x: hashlib.md5(io.open(x, 'rb').read()).hexdigest()
+        p = os.popen(f'demal test1.mal test2.mal -o {out} -j 2')
+        p.read()
+        assert p.close() is None, 'Batch conversion failed'
+        for file in ('test1.mal', 'test2.mal'):
+            m = demal.MalParser(file)
+            m.parse()
+            assert md5(os.path.join(out, file + '.json')) == hashlib.md5(f'{m}\n'.encode()).hexdigest()
+        p = os.popen(f'demal {out} -r -o {out}')
+        p.read()
+        assert p.close() is None, 'Batch reverse conversion failed'
+        assert sorted(os.listdir(out)) == ['test1.mal.json', 'test1.mal.json.mal', 'test2.mal.json', 'test2.mal.json.mal']
+        p = os.popen(f'demal test1.mal {out} missing.mal -o {out} 2>&1')
+        assert 'Error while opening missing.mal' in p.read() and p.close() is not None, 'Missing file not reported'
+
 try:
     main()
     print('\nPassed\n')
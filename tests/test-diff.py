@@ -0,0 +1,72 @@
+import io, os, sys, json, copy, tempfile, subprocess, demal
+from demal.diff import Change, hash_tree, diff, save_tree, load_tree, tree_of
+
+def main():
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    result = m.result
+
+    print('Identical models have the same root hash, whatever their key order.')
+    reordered = json.loads(json.dumps(result, sort_keys=True))
+    assert hash_tree(result)[0] == hash_tree(reordered)[0]
+    assert m.diff(reordered) == [] and diff(result, m) == []
+
+    print('Changes are reported at the deepest element that differs.')
+    changed = copy.deepcopy(result)
+    host = changed['categories']['System']['assets']['Host']
+    host['attributes']['authenticate']['leads_to'] = {'0': 'connect'}
+    host['attributes']['patched'] = dict(host['attributes']['access'], type='defense')
+    del host['attributes']['connect']
+    host['extends'] = 'Machine'
+    changed['associations'][1]['mult_r'] = '1'
+    changed['associations'].pop()
+    changed['version'] = '2.0.0'
+    assert m.diff(changed) == [
+        Change('modified', 'associations.Host [host] <-- Credentials --> [passwords] Password.mult_r'),
+        Change('removed', 'associations.User [user] <-- Credentials --> [passwords] Password'),
+        Change('modified', 'System.Host.authenticate.leads_to'),
+        Change('removed', 'System.Host.connect'),
+        Change('added', 'System.Host.patched'),
+        Change('modified', 'System.Host.extends'),
+        Change('modified', 'version'),
+    ], m.diff(changed)
+    assert str(m.diff(changed)[2]) == '~ System.Host.authenticate.leads_to'
+    assert [x.kind for x in diff(changed, result)] == ['modified', 'added', 'modified', 'added', 'removed', 'modified', 'modified']
+
+    print('Unchanged subtrees are not visited.')
+    old, new = hash_tree(result), hash_tree(changed)
+    for name in ('Password', 'User', 'Network'):
+        assert old[1]['categories'][1]['System'][1]['assets'][1][name] == new[1]['categories'][1]['System'][1]['assets'][1][name]
+    del old[1]['categories'][1]['System'][1]['assets'][1]['User'][1]['attributes']
+    assert diff(old, new) == diff(result, changed)
+
+    print('Hash trees are saved for later runs, and cached with the results.')
+    with tempfile.TemporaryDirectory() as root:
+        stream = io.StringIO()
+        save_tree(hash_tree(result), stream)
+        stream.seek(0)
+        baseline = load_tree(stream)
+        assert baseline == hash_tree(result) and diff(baseline, changed) == m.diff(changed)
+        cache = demal.cache.ResultCache(os.path.join(root, 'cache'))
+        assert tree_of('test1.mal', cache) == tree_of('test1.mal.json') == baseline
+        assert tree_of('test1.mal', cache) == baseline and cache.counters['hits'] == 1
+
+        print('demal --diff prints them and fails when models differ.')
+        with open(os.path.join(root, 'changed.json'), 'w') as f:
+            json.dump(changed, f)
+        run = lambda *args: subprocess.run(['demal', *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        p = run('--diff', 'test1.mal', 'test1.mal.json')
+        assert p.returncode == 0 and p.stdout == '' and p.stderr == '0 added, 0 removed, 0 modified.\n', p
+        p = run('--diff', 'test1.mal', f.name)
+        assert p.returncode == 1 and p.stdout.splitlines() == [str(x) for x in m.diff(changed)], p.stdout
+        assert p.stderr == '1 added, 2 removed, 4 modified.\n', p.stderr
+        p = run('--diff=json', 'test1.mal', f.name)
+        assert p.returncode == 1 and json.loads(p.stdout.splitlines()[3]) == {'kind': 'removed', 'path': 'System.Host.connect'}
+        p = run('--diff', 'test1.mal', os.path.join(root, 'missing.mal'))
+        assert p.returncode == 2 and p.stderr.startswith('Error while opening'), p
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
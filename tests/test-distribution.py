@@ -0,0 +1,94 @@
+import sys, math, importlib.util, demal
+from demal.distribution import FAMILIES, Distributions, Sampler, parse
+
+def mean(values):
+    return sum(values) / len(values)
+
+def main():
+    print('Every documented family parses into a typed distribution.')
+    for text in ('Bernoulli(0.7)', 'Binomial(10, 0.6)', 'Exponential(0.02)', 'Gamma(0.1, 0.2)', 'LogNormal(1, 3)',
+                 'Pareto(1.5, 2)', 'TruncatedNormal(1.2, 1.3)', 'Uniform(0, 10)', 'Infinity', 'Zero'):
+        dist = parse(text)
+        assert dist.family in FAMILIES and len(dist.params) == len(FAMILIES[dist.family]) and str(dist) == text, dist
+    assert parse(' Gamma( 1 ,2.5e-1 ) ') == demal.Distribution('Gamma', (1.0, 0.25))
+
+    print('Unknown families and invalid parameters are errors.')
+    for text, message in (('Normal(1.1, 2.0)', "Unknown distribution 'Normal(1.1, 2.0)'"),
+                          ('Exponential()', "Exponential takes 1 parameters (rate), not 0: 'Exponential()'"),
+                          ('Exponential(x)', "Exponential parameter 'x' is not a number: 'Exponential(x)'"),
+                          ('Pareto(1.0, 0)', "Pareto shape must be greater than 0: 'Pareto(1.0, 0)'"),
+                          ('Bernoulli(1.5)', "Bernoulli probability must be between 0 and 1: 'Bernoulli(1.5)'"),
+                          ('Binomial(0.5, 0.6)', "Binomial trials must be a whole number: 'Binomial(0.5, 0.6)'"),
+                          ('Uniform(3, 1)', "Uniform low must not be greater than high: 'Uniform(3, 1)'")):
+        try:
+            parse(text)
+            assert False, text
+        except ValueError as e:
+            assert str(e) == message, e
+
+    print('Each distinct text is parsed once, its errors too, and validate() reports them.')
+    table = Distributions()
+    assert table.parse('Exponential(0.1)') is table.parse('Exponential(0.1)')
+    for _ in range(2):
+        try:
+            table.parse('Zero(1)')
+        except ValueError:
+            pass
+    assert len(table) == 2 and list(table.errors) == ['Zero(1)']
+    m = demal.MalParser('test2.mal')
+    m.parse()
+    found = [(x.line, x.code, x.message) for x in m.validate() if x.code == 'invalid-distribution']
+    assert found == [(33, 'invalid-distribution', "A2.At2: Binomial trials must be a whole number: 'Binomial(0.5, 0.6)'"),
+                     (38, 'invalid-distribution', "A2.At7: Unknown distribution 'Normal(1.1, 2.0)'"),
+                     (39, 'invalid-distribution', "A2.At8: Pareto shape must be greater than 0: 'Pareto(1.0, 0)'")], found
+
+    print('Samplers gather the distributions of a graph into columns.')
+    try:
+        m.compile().sampler(table)
+        assert False, 'Invalid distribution sampled'
+    except ValueError as e:
+        assert str(e) == "A2.At2: Binomial trials must be a whole number: 'Binomial(0.5, 0.6)'", e
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    graph = m.compile()
+    sampler = graph.sampler()
+    assert len(sampler) == len(graph) and list(sampler.family).count(-1) == len(graph) - 2
+    assert sampler.distributions()[graph.ids['Host.guessedPassword']] == parse('Exponential(0.02)')
+
+    print('Without NumPy, rows are drawn in Python, the same for the same seed.')
+    rows = sampler.sample(3, seed=7, vectorize=False)
+    assert len(rows) == 3 and all(len(x) == len(graph) for x in rows)
+    assert rows == sampler.sample(3, seed=7, vectorize=False) != sampler.sample(3, seed=8, vectorize=False)
+    assert all(x[graph.ids['Host.access']] == 0 and x[graph.ids['Host.guessedPassword']] > 0 for x in rows)
+
+    print('Samples follow their distributions.')
+    dists = [parse(x) for x in ('Exponential(0.5)', 'Bernoulli(0.7)', 'Uniform(2, 4)', 'Pareto(1, 3)', 'TruncatedNormal(0, 1)',
+                                'Binomial(10, 0.3)', 'Gamma(2, 3)', 'LogNormal(0, 0.5)', 'Infinity', 'Zero')] + [None]
+    expected = [2, 0.7, 3, 1.5, math.sqrt(2 / math.pi), 3, 6, math.exp(0.125), math.inf, 0, 0]
+    sampler = Sampler(dists)
+    backends = [False] + ([True] if importlib.util.find_spec('numpy') else [])
+    if len(backends) == 1:
+        print('NumPy is not installed, only the Python sampler is tested.')
+    for vectorize in backends:
+        samples = sampler.sample(20000, seed=1, vectorize=vectorize)
+        columns = list(zip(*samples))
+        for column, value in zip(columns, expected):
+            assert value in (math.inf, 0) and set(column) == {value} or abs(mean(column) - value) < value * 0.05, (vectorize, value, mean(column))
+        assert min(columns[3]) >= 1 and min(columns[4]) >= 0 and set(columns[1]) == {0, 1}
+        if vectorize:
+            assert samples.shape == (20000, len(dists))
+            assert (sampler.sample(5, seed=3) == sampler.sample(5, seed=3)).all()
+
+    print('Normal distributions truncated far from their mean are sampled too.')
+    for text, expected in (('TruncatedNormal(-50, 1)', 0.02), ('TruncatedNormal(-3, 4)', 0.877), ('TruncatedNormal(2, 0.25)', 2)):
+        sampler = Sampler([parse(text)])
+        for vectorize in backends:
+            column = [x[0] for x in sampler.sample(20000, seed=1, vectorize=vectorize)]
+            assert min(column) >= 0, (text, vectorize)
+            assert abs(mean(column) - expected) < expected * 0.05, (text, vectorize, mean(column))
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
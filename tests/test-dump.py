@@ -0,0 +1,89 @@
+import io, os, sys, tempfile, threading, tracemalloc, demal
+
+class Sink:
+    '''
+    Stream that only counts what it is given.
+    '''
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+
+def quiet(call, *args):
+    stdout, stderr, sys.stdout, sys.stderr = sys.stdout, sys.stderr, io.StringIO(), io.StringIO()
+    try:
+        return call(*args)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        print('Files and streams get the same bytes as the reference output.')
+        for name in ('test1.mal.json', 'test2.mal.json'):
+            with open(name + '.mal', 'rb') as f:
+                expected = f.read().replace(b'v2.1.0', f'v{demal.demal.__version__}'.encode())
+            m = demal.MalParser(name)
+            m.load()
+            out = os.path.join(tmp, 'out.mal')
+            size = quiet(m.dump_mal, out)
+            with open(out, 'rb') as f:
+                assert f.read() == expected and size == len(expected), name
+            s = io.StringIO()
+            assert m.dump_mal(s) == len(expected) and s.getvalue().encode() == expected, name
+
+        print('A failed dump leaves an existing file as it was, and no temporary file.')
+        m.result['categories']['C2']['assets']['A1']['attributes']['At1']['type'] = 'xor'
+        assert quiet(m.dump_mal, out) is None and m.stop
+        with open(out, 'rb') as f:
+            assert f.read() == expected
+        assert os.listdir(tmp) == ['out.mal']
+
+        print('Symbolic links, special files and read-only directories are written in place.')
+        m = demal.MalParser('test1.mal')
+        m.parse()
+        expected = ''.join(m.encode()) + '\n'
+        target, link = os.path.join(tmp, 'target.json'), os.path.join(tmp, 'link.json')
+        open(target, 'w').close()
+        os.symlink('target.json', link)
+        quiet(m.dump, link)
+        with open(target) as f:
+            assert os.path.islink(link) and f.read() == expected
+        if hasattr(os, 'mkfifo'):
+            fifo = os.path.join(tmp, 'fifo')
+            os.mkfifo(fifo)
+            received = []
+            reader = threading.Thread(target=lambda: received.append(open(fifo).read()))
+            reader.start()
+            quiet(m.dump, fifo)
+            reader.join()
+            assert received == [expected] and not os.path.isfile(fifo)
+        locked = os.path.join(tmp, 'locked')
+        os.mkdir(locked)
+        out = os.path.join(locked, 'out.json')
+        open(out, 'w').close()
+        os.chmod(locked, 0o555)
+        try:
+            quiet(m.dump, out)
+            with open(out) as f:
+                assert f.read() == expected and os.listdir(locked) == ['out.json']
+        finally:
+            os.chmod(locked, 0o755)
+
+        print('Memory does not grow with the size of the output.')
+        m = demal.MalParser('big')
+        attrs = {f'step{i}': {'meta': {}, 'type': 'or', 'probability': None, 'cia': None, 'tags': [],
+                              'leads_to': {'0': f'step{i + 1}'}} for i in range(20)}
+        assets = {f'Asset{i}': {'meta': {}, 'attributes': attrs, 'extends': None, 'abstract': False} for i in range(2000)}
+        m.result = {'categories': {'C': {'meta': {}, 'assets': assets}}}
+        tracemalloc.start()
+        size = m.dump_mal(Sink())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert size > 2**20 and peak < 2**19, (size, peak)
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
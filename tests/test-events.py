@@ -0,0 +1,84 @@
+import io, sys, demal
+
+class Counter(demal.Handler):
+    '''
+    Count assets and attack steps per category without building results.
+    '''
+    def __init__(self):
+        self.counts, self.current = {}, None
+
+    def category(self, name):
+        self.current = name
+        self.counts.setdefault(name, [0, 0])
+
+    def asset(self, name, extends, abstract):
+        self.counts[self.current][0] += 1
+
+    def attribute(self, name, kind, probability, cia, tags):
+        self.counts[self.current][1] += 1
+
+class Rebuild(demal.Handler):
+    '''
+    Build a result dictionary again with the parser's own builder, fed from an event stream.
+    '''
+    def __init__(self):
+        self.result = {}
+        self.builder = demal.Builder(self)
+
+    def event(self, name, *args):
+        getattr(self.builder, name)(*args)
+
+def main():
+    print('Events rebuild the same results as a full parse.')
+    for name in ('test1.mal', 'test2.mal'):
+        m = demal.MalParser(name)
+        m.parse()
+        rebuild = Rebuild()
+        for name, *args in demal.MalParser(name).events():
+            if name != 'include':
+                rebuild.event(name, *args)
+        assert rebuild.result == m.result and list(rebuild.result) == list(m.result)
+
+    print('Events come in declaration order, with ends and metadata in place.')
+    source = '#id: "x"\ncategory C\n  user info: "i"\n{\n  abstract asset A extends B {\n    | s [Exponential(0.1)] {C}\n      -> let v = a,\n         b.s\n  }\n}\n'
+    source += 'associations {\n  A [a] 1 <-- L --> * [b] B\n}\n'
+    events = list(demal.MalParser('events').events(io.StringIO(source)))
+    assert events == [
+        ('define', 'id', 'x'),
+        ('category', 'C'), ('meta', 'user info', 'i'),
+        ('asset', 'A', 'B', True),
+        ('attribute', 's', 'or', 'Exponential(0.1)', ['C'], []),
+        ('expression', 'leads_to', 'v', 'a'), ('expression', 'leads_to', '0', 'b.s'),
+        ('asset_end', 'A'), ('category_end', 'C'),
+        ('association', 'L', 'A', 'a', '1', '*', 'b', 'B')
+    ], events
+
+    print('Handlers receive callbacks and nothing is built.')
+    m = demal.MalParser('test2.mal')
+    counter = Counter()
+    m.handle(counter)
+    assert counter.counts == {'C1': [0, 0], 'C2': [6, 26], 'C3': [1, 0], 'C4': [1, 0], 'C5': [1, 0], 'C6': [0, 0]}, counter.counts
+    assert m.result == {} and isinstance(m.handler, demal.Builder)
+
+    print('Includes are reported rather than followed.')
+    events = list(demal.MalParser('events').events(io.StringIO('include "missing.mal"\n#a: "b"\n')))
+    assert events == [('include', 'missing.mal'), ('define', 'a', 'b')], events
+
+    print('Consumers may stop early.')
+    events = demal.MalParser('events').events(io.StringIO('#a: "1"\n#b: "2"\ncategory {'))
+    assert next(events) == ('define', 'a', '1')
+    events.close()
+
+    print('Invalid input raises SyntaxError.')
+    try:
+        list(demal.MalParser('events').events(io.StringIO('category C {\n  asset A {\n')))
+    except SyntaxError:
+        pass
+    else:
+        raise AssertionError('incomplete input was accepted')
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
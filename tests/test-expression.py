@@ -0,0 +1,76 @@
+import io, os, sys, tempfile, demal
+from demal.expression import Expressions, Node, to_source
+
+def parse(source):
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'spec.mal')
+        with io.open(path, 'w', newline='\n') as f:
+            f.write(source)
+        m = demal.MalParser(path)
+        try:
+            m.handle(demal.Handler())
+        except SyntaxError as e:
+            return str(e).replace(path, 'spec.mal')
+        return m
+
+def main():
+    print('Expressions parse into trees of every kind.')
+    table = Expressions()
+    (node,) = table.parse('(a.b \\/ c())[T]* - d')
+    assert node == ('difference', ('star', ('type', ('group', ('union', ('path', ('field', 'a'), ('field', 'b')), ('let', 'c'))), 'T')), ('field', 'd'))
+    assert node.kind == 'difference' and type(node[1][1]) is Node
+    assert table.parse('a, b.c') == (('field', 'a'), ('path', ('field', 'b'), ('field', 'c')))
+
+    print('Equal subexpressions share one node, each text is parsed once.')
+    (x,) = table.parse('hosts.access /\\ hosts.access')
+    assert x[1] is x[2]
+    assert table.parse('a, b.c')[1][1] is table.parse('b.c')[0][1] is table.parse('(b)')[0][1]
+    assert table.parse('a, b.c') is table.parse('a, b.c')
+    assert len(table) == 5
+
+    print('Interning a deep expression hashes no node, so it takes time in proportion to its length.')
+    hashes = 0
+    def counting(node):
+        nonlocal hashes
+        hashes += 1
+        return tuple.__hash__(node)
+    Node.__hash__ = counting
+    try:
+        deep = Expressions()
+        (chain,) = deep.parse('.'.join(f'f{i}' for i in range(3000)))
+    finally:
+        del Node.__hash__
+    assert hashes == 0 and chain.kind == 'path' and chain[2] == ('field', 'f2999')
+    assert chain[1][1] is deep.parse('.'.join(f'f{i}' for i in range(2998)))[0]
+
+    print('Sources print back with canonical spacing and parse back to equal nodes.')
+    for name in ('test1.mal', 'test2.mal'):
+        m = demal.MalParser(name)
+        m.parse()
+        assert len(m.expressions) > 5
+        for text, nodes in m.expressions.parsed.items():
+            assert Expressions().parse(to_source(nodes)) == nodes, text
+    assert to_source(Expressions().parse('a.b  \\/c ,(d)[T] *')) == 'a.b \\/ c, (d)[T]*'
+    built = Node(('path', Node(('union', Node(('field', 'a')), Node(('field', 'b')))), Node(('field', 'c'))))
+    assert built.to_source() == '(a \\/ b).c'
+
+    print('Invalid expressions are errors at parse time, with their position.')
+    spec = 'category C {\n  asset A {\n    | x\n      -> a.b,\n         %s\n  }\n}\n'
+    assert parse(spec % 'c..d') == "Improper syntax in spec.mal at line 5, column 11: 'c..d'"
+    assert parse(spec % '(c') == "Incomplete expression in spec.mal at line 5: '(c'"
+    assert parse(spec % 'c[T') == "Incomplete expression in spec.mal at line 5: 'c[T'"
+    assert parse(spec % 'let v = c d') == "Improper syntax in spec.mal at line 5, column 20: 'let v = c d'"
+    assert isinstance(parse(spec % 'let v = c.d*[T]'), demal.MalParser)
+
+    print('Compiling a graph reuses the parsed expressions.')
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    before = dict(m.expressions.parsed)
+    m.compile()
+    assert m.expressions.parsed == before
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,82 @@
+import io, sys, demal
+
+SPEC = '''category C {
+  asset Network {
+    | access
+      -> hosts.connect, hosts.apps*.run
+    E reachable
+      <- hosts
+      -> let apps = hosts.apps,
+         apps().run
+  }
+  asset Host {
+    | connect [Exponential(0.1)]
+      -> apps[Web].hack, missing.x
+  }
+  asset App {
+    | run
+      -> deps*.run
+  }
+  asset Web extends App {
+    & hack
+  }
+}
+associations {
+  Network [networks] * <-- NetworkAccess --> * [hosts] Host
+  Host [host] 1 <-- Runs --> * [apps] App
+  App [deps] * <-- Dependency --> * [users] App
+}
+'''
+
+def successors(graph, step):
+    return [graph.steps[i] for i in graph.successors(step)]
+
+def main():
+    m = demal.MalParser('graph')
+    m.parse(io.StringIO(SPEC))
+    graph = m.compile()
+
+    print('Steps are interned, inherited steps included.')
+    assert graph.steps == ['App.run', 'Host.connect', 'Network.access', 'Network.reachable', 'Web.run', 'Web.hack'], graph.steps
+    assert graph.ids['Web.run'] == 4 and graph.assets[graph.asset[4]] == 'Web'
+    assert [demal.graph.KINDS[k] for k in graph.kind] == ['or', 'or', 'or', 'exists', 'or', 'and']
+    assert graph.dists == ['Exponential(0.1)'] and list(graph.dist) == [-1, 0, -1, -1, -1, -1]
+
+    print('Expressions resolve through fields, closures, subtypes and let variables.')
+    assert successors(graph, 'Network.access') == ['App.run', 'Host.connect', 'Web.run']
+    assert successors(graph, 'Network.reachable') == ['App.run', 'Web.run']
+    assert successors(graph, 'Host.connect') == ['Web.hack']
+    assert successors(graph, 'Web.run') == successors(graph, 'App.run') == ['App.run', 'Web.run']
+    assert [graph.assets[i] for i in graph.required('Network.reachable')] == ['Host']
+    assert graph.unresolved == [('Host.connect', 'apps[Web].hack, missing.x', "unknown field or variable 'missing' on Host")], graph.unresolved
+
+    print('A field resolves per asset type, falling back to a let variable only where it is not declared.')
+    m = demal.MalParser('mixed')
+    m.parse(io.StringIO('category C {\n  asset Root {\n    | go\n      -> (ps \\/ qs).t.hit\n  }\n'
+                        '  asset P {\n    | x\n  }\n  asset Q {\n    | y\n      -> let t = ts\n  }\n  asset T {\n    | hit\n  }\n}\n'
+                        'associations {\n  Root [root] 1 <-- RP --> * [ps] P\n  Root [root] 1 <-- RQ --> * [qs] Q\n'
+                        '  P [p] 1 <-- PT --> * [t] T\n  Q [q] 1 <-- QT --> * [ts] T\n}\n'))
+    mixed = m.compile()
+    assert successors(mixed, 'Root.go') == ['T.hit'] and not mixed.unresolved, mixed.unresolved
+
+    print('Adjacency is stored in CSR arrays.')
+    assert len(graph.offsets) == len(graph) + 1 and graph.offsets[-1] == len(graph.targets) == 10
+
+    print('Binary save and load.')
+    f = io.BytesIO()
+    graph.save(f)
+    f.seek(0)
+    again = demal.AttackGraph.load(f)
+    for k in ('steps', 'assets', 'dists', 'asset', 'kind', 'dist', 'offsets', 'targets', 'req_offsets', 'requires'):
+        assert getattr(again, k) == getattr(graph, k), k
+    try:
+        demal.AttackGraph.load(io.BytesIO(f.getvalue()[:-1]))
+        raise AssertionError('Truncated graph loaded')
+    except ValueError:
+        pass
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
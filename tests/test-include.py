@@ -0,0 +1,56 @@
+import io, os, sys, tempfile, demal
+
+def write(root, name, text):
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with io.open(path, 'w', newline='\n') as f:
+        f.write(text)
+    return path
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        print('Includes resolve relative to the including file.')
+        write(root, 'lib/core.mal', 'category Core {\n  asset Base {\n    | access\n  }\n}\n')
+        write(root, 'lib/a.mal', '#version: "a"\ninclude "core.mal"\ncategory A {\n  asset X extends Base {\n  }\n}\n')
+        write(root, 'lib/b.mal', 'include "core.mal"\ncategory B {\n  asset Y extends Base {\n  }\n}\n')
+        main = write(root, 'main.mal', '#id: "diamond"\ninclude "lib/a.mal"\ninclude "lib/b.mal"\n#version: "main"\n'
+                                       'associations {\n  X [x] 1 <-- L --> * [y] Y\n}\n')
+        m = demal.MalParser(main)
+        assert m.parse() is None and not m.stop, 'Parse failed'
+        assert list(m) == ['Core.Base', 'A.X', 'B.Y'], list(m)
+        assert m['version'] == 'main', m['version']
+        assert len(m['associations']) == 1
+
+        print('Shared includes are parsed once per cache.')
+        assert len(m.cache) == 3, m.cache.keys()
+        again = demal.MalParser(main, cache=m.cache)
+        calls = []
+        fragment = again.parse_fragment
+        again.parse_fragment = lambda *a: calls.append(a) or fragment(*a)
+        again.parse()
+        assert len(calls) == 1, calls
+        assert again.result == m.result
+
+        print('Cached fragments are not shared with results.')
+        m['categories']['Core']['assets']['Base']['meta']['x'] = 'y'
+        assert again['categories']['Core']['assets']['Base']['meta'] == {}
+
+        print('Include cycles are reported with the chain.')
+        write(root, 'c1.mal', 'include "c2.mal"\n')
+        write(root, 'c2.mal', 'include "c3.mal"\n')
+        write(root, 'c3.mal', 'include "c1.mal"\n')
+        m = demal.MalParser(os.path.join(root, 'c1.mal'))
+        err = io.StringIO()
+        stderr, sys.stderr = sys.stderr, err
+        try:
+            m.parse()
+        finally:
+            sys.stderr = stderr
+        assert m.stop and 'Include cycle:' in err.getvalue(), err.getvalue()
+        assert err.getvalue().count('.mal') == 4, err.getvalue()
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
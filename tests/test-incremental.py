@@ -0,0 +1,84 @@
+import io, re, sys, random, contextlib, demal
+
+# Incremental edits must always give the same result as parsing the edited source from scratch.
+
+SNIPPETS = [
+    '  asset New{n} {{\n    | step\n      -> a.b\n  }}\n',
+    'category K{n} {{\n  asset A{n} {{\n  }}\n}}\n',
+    'associations {{\n  A [a] 1 <-- L{n} --> * [b] B\n}}\n',
+    '#key{n}: "value {n}"\n',
+    '    | step{n} [Exponential(0.{n})]\n      -> x.y,\n         z\n',
+    '    user info: "note {n}"\n',
+    '// comment {n}\n',
+    '/* block\n comment {n} */\n',
+    '}}\n', '{{', '"', '/*', '\n', ' ', 'x{n}',
+]
+
+def parse(source):
+    m = demal.MalParser('full')
+    m.parse(io.StringIO(source))
+    return m
+
+def position(source, offset):
+    line = source.count('\n', 0, offset) + 1
+    return line, offset - source.rfind('\n', 0, offset)
+
+def random_edit(rng, source, n):
+    starts = [0] + [m.end() for m in re.finditer('\n', source)]
+    names = [m.span() for m in re.finditer(r'\b[A-Za-z]\w*\b', source)]
+    kind = rng.randrange(5)
+    if kind == 0 and names:
+        a, b = rng.choice(names)
+        return a, b, rng.choice(['Renamed', 'C2', 'A1', 'Host', 'asset', 'category', 'x']) + str(n % 3)
+    if kind == 1:
+        a = rng.choice(starts)
+        return a, a, rng.choice(SNIPPETS).format(n=n)
+    if kind == 2 and len(starts) > 1:
+        i = rng.randrange(len(starts) - 1)
+        return starts[i], starts[i+1], ''
+    if kind == 3 and len(starts) > 1:
+        i = rng.randrange(len(starts) - 1)
+        return starts[i], starts[i], source[starts[i]:starts[i+1]]
+    a = rng.randrange(len(source) + 1)
+    b = min(len(source), a + rng.randrange(4))
+    return a, b, rng.choice(SNIPPETS).format(n=n)[:rng.randrange(1, 4)]
+
+def check(inc, source, step):
+    full = parse(source)
+    assert inc.source == source, f'Step {step}: source differs'
+    assert inc.stop == full.stop, f'Step {step}: incremental error state {inc.stop}, full {full.stop}'
+    if not full.stop:
+        assert inc.result == full.result, f'Step {step}: results differ'
+    return full.stop
+
+def main(seed, steps):
+    rng = random.Random(seed)
+    with open('test2.mal') as f:
+        source = f.read()
+    with open('test1.mal') as f:
+        source += f.read().replace('#id', '#other')
+    inc = demal.MalParser('incremental')
+    inc.parse(io.StringIO(source), incremental=True)
+    check(inc, source, 0)
+    errors = 0
+    for step in range(1, steps + 1):
+        a, b, text = random_edit(rng, source, step)
+        old = source[a:b]
+        start, end = (a, b) if step % 2 else (position(source, a), position(source, b))
+        inc.edit(start, end, text)
+        source = source[:a] + text + source[b:]
+        if check(inc, source, step):
+            errors += 1
+            inc.edit(a, a + len(text), old)
+            source = source[:a] + old + source[a + len(text):]
+            check(inc, source, step)
+    return errors
+
+try:
+    with contextlib.redirect_stderr(io.StringIO()):
+        for seed in range(4):
+            errors = main(seed, 150)
+            print(f'Seed {seed}: 150 random edits, {errors} leading to syntax errors')
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,90 @@
+import io, sys, json, demal
+
+def main():
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    index = m.index
+
+    print('Assets, categories and attack steps.')
+    assert index.category('Host') == 'System' and index.category('Nope') is None
+    assert index.asset('Password')['attributes']['obtain']['leads_to'] == {'0': 'host.authenticate'}
+    assert index.step('Host.guessedPassword')['probability'] == 'Exponential(0.02)'
+    assert index.step('User', 'phish') is index.step('User.phish')
+
+    print('Associations by asset and by field.')
+    assert [x['name'] for x in index.associations('Password')] == ['Credentials', 'Credentials']
+    link, target = index.field('Network', 'hosts')
+    assert link['name'] == 'NetworkAccess' and target == 'Host'
+    assert index.field('Host', 'networks')[1] == 'Network'
+    assert index.field('Host', 'passwords')[1] == 'Password' and index.field('Password', 'host')[1] == 'Host'
+
+    print('Inheritance.')
+    m.result['categories']['System']['assets']['Admin'] = {'meta': {}, 'attributes': {}, 'extends': 'User', 'abstract': False}
+    m.result['categories']['System']['assets']['Root'] = {'meta': {}, 'attributes': {}, 'extends': 'Admin', 'abstract': False}
+    assert m.index is index and index.asset('Admin') is None
+    m.invalidate()
+    assert m.index is not index
+    assert m.index.children('User') == ['Admin'] and m.index.descendants('User') == ['Admin', 'Root']
+    assert m.index.ancestors('Root') == ['Admin', 'User'] and m.index.parent('Host') is None
+
+    print('Flattened inheritance.')
+    m = demal.MalParser('flatten')
+    m.parse(io.StringIO('category C {\n  asset A {\n    | x\n      -> a, b\n    & y [Exponential(1)]\n  }\n'
+                        '  asset B extends A {\n    | x\n      +> c\n    | z\n  }\n'
+                        '  asset D extends B {\n    & x\n      +> d\n    | y\n      -> e\n  }\n}\n'))
+    flat = m.flatten()
+    assert list(flat['B']) == ['x', 'y', 'z'] and flat['B']['y'] is m.index.step('A.y')
+    assert list(flat['B']['x']['leads_to'].values()) == ['a, b', 'c'] and 'append' not in flat['B']['x']
+    assert list(flat['D']['x']['leads_to'].values()) == ['a, b', 'c', 'd'] and flat['D']['x']['type'] == 'and'
+    assert flat['D']['y'] == m.index.step('D.y') and m.index.flatten('B') is flat['B']
+    assert json.loads(''.join(m.encode(False, True)))['flattened'] == json.loads(json.dumps(flat))
+    assert m.index.step('B.x')['append'] == {'0': 'c'}, 'Results were modified'
+
+    print('Inheritance cycles and unknown parents are reported.')
+    assets = m['categories']['C']['assets']
+    assets['A']['extends'] = 'D'
+    m.invalidate()
+    for error, name in (('Inheritance cycle: B -> A -> D -> B', 'B'), ("Asset 'A' extends unknown asset 'E'", 'D')):
+        try:
+            m.index.flatten(name)
+            raise AssertionError('Expected: ' + error)
+        except SyntaxError as e:
+            assert str(e) == error, e
+        assets['A']['extends'] = 'E'
+        m.invalidate()
+
+    print('Replacing the results, their categories or associations rebuilds the index.')
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    index = m.index
+    m.result['categories']['Extra'] = {'meta': {}, 'assets': {'Thing': {'meta': {}, 'attributes': {}, 'extends': None, 'abstract': False}}}
+    assert m.index is not index and m.index.category('Thing') == 'Extra' and 'Extra.Thing' in list(m)
+    index = m.index
+    m.result['associations'].append({'name': 'Owns', 'meta': {}, 'asset_l': 'Thing', 'field_l': 'things', 'mult_l': '*',
+                                     'mult_r': '*', 'field_r': 'hosts', 'asset_r': 'Host'})
+    assert m.index is not index and m.index.field('Thing', 'hosts')[1] == 'Host'
+    index = m.index
+    m.result['categories'] = dict(m.result['categories'])
+    assert m.index is not index
+    index = m.index
+    assert m.index is index
+    m.result = {}
+    assert list(m) == [] and m.index.asset('Host') is None
+
+    print('next() reads assets from the parser too.')
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    names = list(m)
+    assert [next(m) for _ in names] == names
+    try:
+        next(m)
+        raise AssertionError('Expected StopIteration')
+    except StopIteration:
+        pass
+    assert next(m) == names[0] and list(m) == names and next(m) == names[1]
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
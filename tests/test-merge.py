@@ -0,0 +1,107 @@
+import io, sys, json, operator, functools, demal
+
+def parse(text):
+    m = demal.MalParser('merge')
+    m.parse(io.StringIO(text))
+    return m
+
+def main():
+    a = parse('#id: "a"\ncategory C {\n  asset X {\n    | x\n  }\n}\ncategory D {\n  asset Y {\n  }\n}\n'
+              'associations {\n  X [x] 1 <-- L --> * [y] Y\n}\n')
+    b = parse('#id: "b"\ncategory C\n  user info: "c"\n{\n  asset X extends Y {\n    | y\n  }\n  asset Z {\n  }\n}\n'
+              'associations {\n  X [x] 1 <-- L --> * [y] Y\n  Z [z] 1 <-- M --> * [x] X\n}\n')
+
+    print('Categories, assets and attack steps merge by name.')
+    m = demal.MalParser.merge(a, b)
+    assert list(m) == ['C.X', 'C.Z', 'D.Y'], list(m)
+    assert list(m['categories']['C']['assets']['X']['attributes']) == ['x', 'y']
+    assert m['categories']['C']['assets']['X']['extends'] == 'Y' and m['categories']['C']['meta'] == {'user info': 'c'}
+    assert [x['name'] for x in m['associations']] == ['L', 'M']
+    assert m.conflicts == [('id', 'a', 'b')] and m['id'] == 'b'
+    assert (a + b).result == m.result
+
+    print('Merged data is copied, so changing it by hand leaves the inputs as they were.')
+    c = a + b
+    c['categories']['D']['assets']['Y']['meta']['user info'] = 'y'
+    c['associations'][0]['name'] = 'K'
+    assert a['categories']['D']['assets']['Y']['meta'] == {} and a['associations'][0]['name'] == b['associations'][0]['name'] == 'L'
+    c += {'categories': {'E': {'meta': {}, 'assets': {}}}}
+    assert list(c['categories']) == ['C', 'D', 'E'] and list(b['categories']) == ['C']
+
+    print('With share=True unchanged data is shared, not copied.')
+    m = demal.MalParser.merge(a, b, share=True)
+    assert m['categories']['D'] is a['categories']['D'] and m['categories']['C']['assets']['Z'] is b['categories']['C']['assets']['Z']
+    assert m['categories']['C'] is not a['categories']['C'] and list(a['categories']['C']['assets']['X']['attributes']) == ['x']
+
+    print('Shared data is copied before being changed in place.')
+    m += parse('category D {\n  asset Y {\n    | y\n  }\n}\n')
+    assert list(m['categories']['D']['assets']['Y']['attributes']) == ['y'] and a['categories']['D']['assets']['Y']['attributes'] == {}
+    a += parse('category C {\n  asset Z {\n    | z\n  }\n}\n')
+    assert list(a) == ['C.X', 'C.Z', 'D.Y'] and list(a['categories']['C']['assets']['Z']['attributes']) == ['z']
+    assert b['categories']['C']['assets']['Z']['attributes'] == m['categories']['C']['assets']['Z']['attributes'] == {}
+
+    print('Including a shared file does not change the instances sharing it.')
+    m = demal.MalParser.merge(a, demal.MalParser('b'), share=True)
+    m.parse(io.StringIO('category D {\n  asset W {\n  }\n}\nassociations {\n  W [w] 1 <-- N --> * [x] X\n}\n'))
+    assert list(m) == ['C.X', 'C.Z', 'D.W'] and list(a) == ['C.X', 'C.Z', 'D.Y'] and len(a['associations']) == 1
+
+    print('Conflicting attack steps are reported.')
+    n = parse('category C {\n  asset X {\n    & x\n  }\n}\n')
+    c = a + n
+    assert c.conflicts == [('categories.C.assets.X.attributes.x', a['categories']['C']['assets']['X']['attributes']['x'],
+                           n['categories']['C']['assets']['X']['attributes']['x'])], c.conflicts
+    assert c['categories']['C']['assets']['X']['attributes']['x']['type'] == 'and'
+
+    print('Folding copies each input once, with +=, +, sum() and reduce(), and leaves the inputs as they were.')
+    models = [parse(f'category C{i} {{\n  asset A{i} {{\n    | a\n  }}\n}}\nassociations {{\n  A{i} [a] 1 <-- L --> * [b] B\n}}\n') for i in range(1000)]
+    before = [json.dumps(x.result) for x in models]
+    size = sum(nodes(x.result) for x in models)
+    def fold_in_place(share):
+        total = demal.MalParser('total')
+        for x in models:
+            total.update(x, share)
+        return total
+    for fold in (fold_in_place, lambda share: functools.reduce(operator.add, models), lambda share: sum(models)):
+        for share in (False, True) if fold is fold_in_place else (False,):
+            total, copies = counting(fold, share)
+            assert len(list(total)) == len(total['associations']) == 1000
+            assert copies <= size and (copies == 0) == share, (copies, size)
+            assert [json.dumps(x.result) for x in models] == before
+            assert (total['categories']['C5'] is models[5]['categories']['C5']) == share
+    assert sum(models[:2]).result == (models[0] + models[1]).result and list(sum(models[:1])) == ['C0.A0']
+
+    print('A result of + kept by name is not changed by adding to it.')
+    first = models[0] + models[1]
+    second = first + models[2]
+    assert list(first) == ['C0.A0', 'C1.A1'] and list(second) == ['C0.A0', 'C1.A1', 'C2.A2']
+    assert list({'id': 'x'} + models[0]) == ['C0.A0'] and (models[0] + {'id': 'x'})['id'] == 'x'
+
+def nodes(value):
+    '''
+    Number of containers and values in a result.
+    '''
+    if type(value) is dict:
+        return 1 + sum(nodes(x) for x in value.values())
+    if type(value) is list:
+        return 1 + sum(nodes(x) for x in value)
+    return 1
+
+def counting(fold, share):
+    '''
+    Run a fold, counting the containers and values it copies.
+    '''
+    clone, copies = demal.MalParser._clone, [0]
+    def count(value):
+        copies[0] += 1
+        return clone(value)
+    demal.MalParser._clone = staticmethod(count)
+    try:
+        return fold(share), copies[0]
+    finally:
+        demal.MalParser._clone = staticmethod(clone)
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
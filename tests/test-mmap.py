@@ -0,0 +1,67 @@
+import os, sys, mmap, tempfile, demal
+from demal.demal import Lexer
+
+def parse(file, size):
+    m = demal.MalParser(file)
+    m.mmap_size = size
+    m.parse()
+    assert not m.stop, file
+    return m
+
+def main():
+    print('Memory-mapped files give the same results and tokens as text.')
+    for name in ('test1.mal', 'test2.mal'):
+        assert parse(name, 0).result == parse(name, None).result
+        with open(name, encoding='utf-8') as f:
+            text = f.read()
+        with open(name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            assert [x[:4] for x in Lexer(text)] == [x[:4] for x in Lexer(data)]
+
+    print('Columns count characters, repeated names share a string.')
+    source = 'category Ç { // ü\n  asset Ünï extends Ç {\n    | s [Exponential(0.1)]\n      user info: "hé \\"x\\""\n      -> a.b, /* é\n */ c\n  }\n}\n'
+    text, data = list(Lexer(source)), list(Lexer(source.encode()))
+    assert [x[:4] for x in text] == [x[:4] for x in data]
+    assert data[1].value is data[6].value == 'Ç' and data[5][2:4] == (2, 13)
+    assert Lexer(source.encode()).text(data[-7:-2]) == 'a.b, c'
+
+    print('Errors are reported the same way.')
+    for bad in ('category "abc', 'x /* y', 'category C {\n  asset A {\n'):
+        errors = []
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'bad.mal')
+            with open(path, 'w') as f:
+                f.write(bad)
+            for size in (0, None):
+                m = demal.MalParser(path)
+                m.mmap_size = size
+                try:
+                    list(m.events())
+                except SyntaxError as e:
+                    errors.append(str(e))
+        assert len(errors) == 2 and errors[0] == errors[1], errors
+    try:
+        list(Lexer(b'"\xff"'))
+    except SyntaxError as e:
+        assert 'Invalid UTF-8' in str(e)
+    else:
+        raise AssertionError('invalid UTF-8 was accepted')
+
+    print('The map phase lasts until the mapped file is scanned.')
+    tracer = demal.Tracer()
+    m = demal.MalParser('test1.mal', trace=tracer)
+    m.mmap_size = 0
+    m.parse()
+    events = [x['event'] if x['event'] != 'phase' else x['name'] for x in tracer.sink]
+    assert events[-2:] == ['map', 'parse'] and events.count('line') > 10, events
+
+    print('Incremental parsing keeps reading text.')
+    m = demal.MalParser('test1.mal')
+    m.mmap_size = 0
+    m.parse(incremental=True)
+    assert type(m.source) is str and m.result == parse('test1.mal', None).result
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
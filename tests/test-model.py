@@ -0,0 +1,35 @@
+import sys, json, demal
+
+def main():
+    print('Conversion to and from the result dictionary is lossless.')
+    for name in ('test1.mal', 'test2.mal'):
+        m = demal.MalParser(name)
+        m.parse()
+        model = demal.Model.from_dict(m.result)
+        assert model.to_dict() == m.result and json.dumps(model.to_dict()) == json.dumps(m.result), name
+
+    print('Names and strings are interned, empty containers are shared.')
+    a1, a2 = model.categories['C2'].assets['A1'], model.categories['C2'].assets['A2']
+    assert a1.meta is demal.model.EMPTY and a2.attributes['At1'].tags == () and a2.attributes['At1'].meta is demal.model.EMPTY
+    a5 = model.categories['C2'].assets['A5'].attributes
+    assert a5['A1'].exprs[0][0] == 'leads_to' and type(a5['A1'].exprs[0][1]) is dict and a5['A2'].exprs == (('append', ('a',)),)
+    assert a5['A1'].type is sys.intern('and') and not hasattr(a5['A1'], '__dict__')
+
+    print('Keys outside the schema are kept.')
+    m.result['extra'] = [1]
+    m.result['categories']['C2']['assets']['A1']['note'] = 'x'
+    assert demal.Model.from_dict(m.result).to_dict() == m.result
+
+    print('Structures the parser does not produce are rejected.')
+    del m.result['categories']['C2']['assets']['A1']['meta']
+    try:
+        demal.Model.from_dict(m.result)
+        raise AssertionError('Invalid structure accepted')
+    except SyntaxError as e:
+        assert 'categories.C2.assets.A1' in str(e), e
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
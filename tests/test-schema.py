@@ -0,0 +1,60 @@
+import io, sys, json, demal
+from demal import schema
+
+def errors(change):
+    with open('test2.mal.json') as f:
+        result = json.load(f)
+    change(result)
+    return schema.validate(result)
+
+def main():
+    print(f'JSON output passes validation, loaded with {schema.backend()[0]}.')
+    for name in ('test1.mal', 'test2.mal'):
+        m = demal.MalParser(name)
+        m.parse()
+        out = io.StringIO()
+        m.dump(out)
+        r = demal.MalParser(name)
+        r.load(io.BytesIO(out.getvalue().encode()))
+        assert r.result == m.result
+        m.result = dict(m.result, flattened=m.flatten())
+        assert schema.validate(m.result) == []
+
+    print('Problems are reported with their JSON path.')
+    A1 = lambda r: r['categories']['C2']['assets']['A1']
+    assert errors(lambda r: A1(r)['attributes']['At1'].update(type='xor')) == [
+        "$.categories.C2.assets.A1.attributes.At1.type: expected one of and, defense, exists, lacks, or, got 'xor'"]
+    assert errors(lambda r: A1(r).pop('abstract')) == ['$.categories.C2.assets.A1: missing abstract']
+    assert errors(lambda r: r['associations'][1].update(mult_l=1)) == ['$.associations[1].mult_l: expected a string, got a number']
+    assert errors(lambda r: r['categories']['C2']['meta'].update({'user info': None})) == [
+        '$.categories.C2.meta["user info"]: expected a string, got null']
+    assert errors(lambda r: A1(r)['attributes']['At2'].update(cia=['X'], tags='t', leads_to={'a b': 'c'})) == [
+        "$.categories.C2.assets.A1.attributes.At2.cia: expected null or a list of C, I, A, got an array",
+        "$.categories.C2.assets.A1.attributes.At2.tags: expected a list of names, got 't'",
+        '$.categories.C2.assets.A1.attributes.At2.leads_to["a b"]: expected a number or let variable as key']
+    assert schema.validate([]) == ['$: expected an object, got an array']
+
+    print('Loading fails on invalid JSON and lists every problem.')
+    for data, message in ((b'{"a":', 'Invalid JSON in <stream>'), (b'{"categories": {"C": {"meta": 1}}}', '$.categories.C: missing assets')):
+        try:
+            schema.load(io.BytesIO(data))
+        except SyntaxError as e:
+            assert message in str(e), e
+        else:
+            raise AssertionError('invalid input was accepted')
+
+    print('dump_mal points at the incompatible part.')
+    m = demal.MalParser('test2.mal')
+    m.result = {'categories': {'C': {'meta': {}, 'assets': {'A': {'meta': {}, 'attributes': {}, 'extends': None}}}}}
+    stderr, sys.stderr = sys.stderr, io.StringIO()
+    try:
+        m.dump_mal(io.StringIO())
+        assert '$.categories.C.assets.A: missing abstract' in sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,147 @@
+import io, os, sys, json, time, socket, tempfile, threading, subprocess, demal
+from demal.server import Server, Client
+
+def write(root, name, text):
+    path = os.path.join(root, name)
+    with io.open(path, 'w', newline='\n') as f:
+        f.write(text)
+    return path
+
+def call(server, method, **params):
+    return json.loads(server.handle(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})))
+
+def run(*args, stdin = None):
+    p = subprocess.run(['demal', *args], input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    return p.returncode, p.stdout, p.stderr
+
+def main():
+    cwd = os.getcwd()
+    server = Server()
+
+    print('Requests give the output of the command-line tool.')
+    for name in ('test1.mal', 'test2.mal'):
+        m = demal.MalParser(name)
+        m.parse()
+        assert call(server, 'parse', file=name)['result'] == m.result
+        assert call(server, 'dump', file=name)['result']['text'] == ''.join(m.encode()) + '\n'
+        assert call(server, 'dump', file=name, pretty=False)['result']['text'] == ''.join(m.encode(False)) + '\n'
+        with open(name) as f:
+            assert call(server, 'dump', source=f.read(), cwd=cwd)['result']['text'] == ''.join(m.encode()) + '\n'
+        with open(name + '.json') as f:
+            m.result = json.load(f)
+        mal = ''.join(m.encode_mal())
+        assert call(server, 'dump_mal', file=name + '.json')['result']['text'] == mal
+        assert call(server, 'dump_mal', result=m.result)['result']['text'] == mal
+
+    print('Errors name the input as it was given.')
+    error = call(server, 'dump', file='nothing.mal')['error']
+    assert error == {'code': -32000, 'message': 'Error while opening nothing.mal'}, error
+    error = call(server, 'dump', source='category C {\n  asset A {\n')['error']
+    assert error['code'] == -32000 and 'Incomplete script' in error['message'], error
+    assert call(server, 'dump', file='test1.mal', pretty='yes')['error']['code'] == -32602
+    assert call(server, 'dump')['error']['code'] == -32602
+    assert call(server, 'nothing')['error']['code'] == -32601
+    assert json.loads(server.handle('{'))['error']['code'] == -32700
+    assert server.handle(json.dumps({'jsonrpc': '2.0', 'method': 'stats'})) is None
+
+    with tempfile.TemporaryDirectory() as root:
+        print('Includes stay parsed between requests, until they change.')
+        write(root, 'lib.mal', 'category Lib {\n  asset Base {\n    | access\n  }\n}\n')
+        write(root, 'main.mal', 'include "lib.mal"\ncategory Main {\n  asset Host extends Base {\n  }\n}\n')
+        server = Server()
+        first = call(server, 'parse', file='main.mal', cwd=root)['result']
+        assert list(first['categories']) == ['Lib', 'Main'], first
+        key = next(iter(server.cache))
+        assert call(server, 'parse', source='include "lib.mal"\n', cwd=root)['result']['categories']['Lib']
+        assert list(server.cache) == [key]
+        time.sleep(0.01)
+        write(root, 'lib.mal', 'category Lib {\n  asset Base {\n    | access\n    | other\n  }\n}\n')
+        second = call(server, 'parse', file='main.mal', cwd=root)['result']
+        assert list(second['categories']['Lib']['assets']['Base']['attributes']) == ['access', 'other']
+        assert len(server.cache) == 1 and key not in server.cache
+
+        print('Requests are served concurrently on a Unix socket.')
+        sock = os.path.join(root, 'demal.sock')
+        thread = threading.Thread(target=server.serve, args=(sock,), daemon=True)
+        thread.start()
+        try:
+            while not os.path.exists(sock):
+                time.sleep(0.01)
+            results = []
+            def work():
+                with Client(sock) as client:
+                    results.append(client.call('dump', file='main.mal', cwd=root)['text'])
+            workers = [threading.Thread(target=work) for _ in range(8)]
+            for x in workers:
+                x.start()
+            for x in workers:
+                x.join()
+            assert len(results) == 8 and len(set(results)) == 1, results
+            assert server.counters['requests'] == 11, server.counters
+
+            print('The client writes what the command-line tool writes.')
+            for args in (['test1.mal', '-'], ['test2.mal', '-', '-c', '-f'], ['test1.mal.json', '-', '-r'], ['nothing.mal'], ['test1.mal', os.path.join(root, 'out.json')]):
+                local = run(*args)
+                assert run('--connect', sock, *args) == local, args
+            with open('test2.mal') as f:
+                source = f.read()
+            assert run('--connect', sock, '-', '-', stdin=source) == run('-', '-', stdin=source)
+            assert run('--connect', sock, os.path.join(root, 'main.mal'), '-')[1] == results[0]
+
+            print('Stopping removes the socket, and the client converts alone when DEMAL_SERVER is not running.')
+            with Client(sock) as client:
+                assert client.call('stats')['cached'] == 1
+                assert client.call('shutdown') is True
+            thread.join(5)
+        finally:
+            if thread.is_alive():
+                server.shutdown({})
+        assert not thread.is_alive() and not os.path.exists(sock)
+        assert run('--connect', sock, 'test1.mal', '-')[0] == 1
+        local = run('test1.mal', '-')
+        os.environ['DEMAL_SERVER'] = sock
+        try:
+            assert run('test1.mal', '-') == local
+
+            print('A connection lost after the input was sent is an error, not a reason to convert again.')
+            with socket.socket(socket.AF_UNIX) as listener:
+                listener.bind(sock)
+                listener.listen()
+                def drop():
+                    connection, _ = listener.accept()
+                    connection.makefile('rb').readline()
+                    connection.close()
+                threading.Thread(target=drop, daemon=True).start()
+                code, out, err = run('test1.mal', '-')
+            assert code == 1 and out == '' and 'closed the connection' in err, (code, out, err)
+
+            print('Only a failed connection falls back: a stale socket converts here, an error reply does not.')
+            assert os.path.exists(sock) and run('test1.mal', '-') == local
+            os.remove(sock)
+            with socket.socket(socket.AF_UNIX) as listener:
+                listener.bind(sock)
+                listener.listen()
+                def refuse():
+                    connection, _ = listener.accept()
+                    with connection, connection.makefile('rwb') as f:
+                        ident = json.loads(f.readline())['id']
+                        f.write(json.dumps({'jsonrpc': '2.0', 'id': ident, 'error': {'code': -32603, 'message': 'Overloaded.'}}).encode() + b'\n')
+                threading.Thread(target=refuse, daemon=True).start()
+                code, out, err = run('test1.mal', '-')
+            assert code == 1 and out == '' and 'Overloaded.' in err, (code, out, err)
+            os.remove(sock)
+        finally:
+            del os.environ['DEMAL_SERVER']
+
+    print('Requests are served on stdin and stdout.')
+    lines = [json.dumps({'jsonrpc': '2.0', 'id': i, 'method': 'dump', 'params': {'file': 'test1.mal', 'pretty': i % 2 == 0}}) for i in range(6)]
+    code, out, err = run('--serve', stdin='\n'.join(lines) + '\n')
+    replies = sorted((json.loads(x) for x in out.splitlines()), key=lambda x: x['id'])
+    assert code == 0 and [x['id'] for x in replies] == list(range(6)), (out, err)
+    assert replies[0]['result']['text'] == run('test1.mal', '-')[1]
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,79 @@
+import io, os, sys, zlib, json, tempfile, demal
+from demal.snapshot import MAGIC, SECTION
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        for name in ('test1.mal', 'test2.mal'):
+            print(f'{name} round-trips through a snapshot file, key order included.')
+            m = demal.MalParser(name)
+            m.parse()
+            path = os.path.join(root, name + '.snapshot')
+            size = m.save_snapshot(path)
+            assert size == os.path.getsize(path)
+            loaded = demal.MalParser(path)
+            loaded.load_snapshot(path)
+            assert loaded.result == m.result and json.dumps(loaded.result) == json.dumps(m.result)
+            assert list(loaded.result['categories']) == list(m.result['categories'])
+
+        print('Categories load on their own.')
+        m = demal.MalParser('test2.mal')
+        m.parse()
+        stream = io.BytesIO()
+        m.save_snapshot(stream)
+        snapshot = demal.Snapshot(io.BytesIO(stream.getvalue()))
+        names = list(m.result['categories'])
+        assert list(snapshot.categories) == names and len(names) > 2
+        assert snapshot.category(names[1]) == m.result['categories'][names[1]]
+        assert snapshot.associations() == m.result['associations']
+        part = snapshot.load([names[-1], names[0]])
+        assert list(part['categories']) == [names[0], names[-1]] and part['associations'] == m.result['associations']
+        loaded = demal.MalParser('test2.mal')
+        loaded.load_snapshot(io.BytesIO(stream.getvalue()), names[:1])
+        assert list(loaded.result['categories']) == names[:1]
+
+        print('Equal strings are one object, whichever section they come from.')
+        full = snapshot.load()
+        step = lambda x: next(iter(x['categories'][names[0]]))
+        assert step(full) is step(snapshot.load())
+
+        print('Corrupt and foreign files are refused.')
+        data = stream.getvalue()
+        damaged = bytearray(data)
+        damaged[-3] ^= 0xff
+        snapshot = demal.Snapshot(io.BytesIO(bytes(damaged)))
+        for load in (snapshot.load, lambda: snapshot.category(names[-1])):
+            try:
+                load()
+                assert False, 'Corruption not detected'
+            except ValueError as e:
+                assert 'checksum' in str(e), e
+        assert snapshot.category(names[0]) == m.result['categories'][names[0]]
+        for bad, message in ((b'{"categories": {}}', 'Not a demal snapshot'), (MAGIC[:-2] + b'9\0' + data[8:], 'Unsupported'),
+                             (data[:len(data) // 2], 'Truncated'), (data[:20] + b'X' + data[21:], 'checksum')):
+            try:
+                demal.Snapshot(io.BytesIO(bad)).load()
+                assert False, message
+            except ValueError as e:
+                assert message in str(e), e
+
+        print('Sections that pass their checksum but do not decode to a result are refused too.')
+        def patched(section, payload):
+            # The unpickler stops at the '.' opcode, so padding keeps every other section where it was.
+            offset = snapshot.sections[section]
+            size, _ = SECTION.unpack_from(data, offset)
+            body = payload.ljust(size, b'.')
+            return data[:offset] + SECTION.pack(size, zlib.crc32(body)) + body + data[offset + SECTION.size + size:]
+        root, category = snapshot.header['root'], snapshot.categories[names[0]]
+        for section, payload in ((category, b'P1\n.'), (category, b'J\xff\xff\xff\xffQ.'), (category, b'}]Ns.'),
+                                 (category, b'\x80\x02c'), (root, b'].'), (root, b'}.')):
+            try:
+                demal.Snapshot(io.BytesIO(patched(section, payload))).load()
+                assert False, f'{payload} decoded'
+            except ValueError as e:
+                assert 'Corrupt' in str(e), e
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,81 @@
+import io, sys, random, asyncio, demal
+
+class Reader:
+    '''
+    Async reader handing out small chunks of bytes, like asyncio.StreamReader.
+    '''
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    async def read(self, n):
+        await asyncio.sleep(0)
+        return self.data.read(n)
+
+def quiet(call, *args):
+    stderr, sys.stderr = sys.stderr, io.StringIO()
+    try:
+        return call(*args)
+    finally:
+        sys.stderr = stderr
+
+def main():
+    print('Chunks of any size give the same results as parsing the whole file.')
+    for name in ('test1.mal', 'test2.mal'):
+        m = demal.MalParser(name)
+        m.parse()
+        with open(name, 'rb') as f:
+            data = f.read()
+        for seed in range(20):
+            rnd, feed = random.Random(seed), demal.MalParser(name)
+            source = data if seed % 2 else data.decode()
+            i = 0
+            while i < len(source):
+                n = rnd.choice((1, 2, 3, 5, 8, 64, 4096))
+                feed.feed(source[i:i + n])
+                i += n
+            feed.close()
+            assert not feed.stop and feed.result == m.result, (name, seed)
+
+    print('Declarations are returned as soon as they complete.')
+    m = demal.MalParser('stream')
+    assert m.feed('#id: "a') == [] and m.feed('b" // "c\n') == [{'id': 'ab'}]
+    assert m.feed('category C { /* } */\n  asset A {\n  }\n') == []
+    assert [list(x) for x in m.feed('} associations {\n  A [a] 1 <-- L --> * [b] A\n}')] == [['categories'], ['associations']]
+    assert m.close() == [] and list(m) == ['C.A'] and m['id'] == 'ab'
+
+    print('Incomplete and invalid input is reported.')
+    m = demal.MalParser('stream')
+    quiet(m.feed, 'category C {\n  asset A {\n')
+    assert not m.stop and quiet(m.close) is None and m.stop
+    m = demal.MalParser('stream')
+    assert quiet(m.feed, '#id: "a\n') is None and m.stop
+
+    print('A long declaration in small chunks is scanned once, and joined once it completes.')
+    text = 'category C {\n' + '  asset A {\n    | access\n  }\n' * 4000 + '}\n'
+    feed = demal.demal.Feed()
+    for i in range(0, len(text), 64):
+        feed.push(text[i:i + 64])
+        spans = feed.cut()
+        # Only a token cut short at the end of a chunk is left to scan again.
+        assert len(feed.rest) < 16 and (spans or feed.data == ''), (i, feed.rest, len(feed.data))
+    assert [x[:2] for x in spans] == [(0, len(text) - 1)] and feed.data == text, spans
+
+    print('Async readers and file-like objects.')
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    with open('test1.mal', 'rb') as f:
+        data = f.read()
+    async def consume():
+        a = demal.MalParser('test1.mal')
+        fragments = [x async for x in a.parse_async(Reader(data), 7)]
+        return a, fragments
+    a, fragments = asyncio.run(consume())
+    assert a.result == m.result and len(fragments) == 4
+    b = demal.MalParser('test1.mal')
+    assert len(list(b.parse_stream(io.BytesIO(data), 5))) == 4 and b.result == m.result
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,73 @@
+import io, os, sys, json, tempfile, demal
+
+def write(root, name, text):
+    path = os.path.join(root, name)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+def main():
+    print('Without a tracer nothing is traced.')
+    m = demal.MalParser('test1.mal')
+    m.parse()
+    code = m.iterate('test1.mal')
+    assert m.tracer is None and type(code) is demal.demal.Lexer and type(code.tokens).__name__ == 'generator'
+
+    print('Lines are counted per parse method and phases are timed.')
+    tracer = demal.Tracer()
+    m = demal.MalParser('test1.mal', trace=tracer)
+    m.parse()
+    m.dump(io.StringIO())
+    lines = [x for x in tracer.sink if x['event'] == 'line']
+    assert lines[0] == {'event': 'line', 'file': 'test1.mal', 'line': 18, 'method': 'parse_statements', 'text': '#id: "org.mal-lang.examplelang"'}, lines[0]
+    assert {'event': 'line', 'file': 'test1.mal', 'line': 22, 'method': 'parse_category', 'text': 'asset Network {'} in lines
+
+    print('Lines are credited to the method consuming them, not one looking ahead at them.')
+    # parse_expression peeks past the end of each expression, parse_asset reads the operator starting the next line.
+    methods = {x['line']: x['method'] for x in lines}
+    assert [methods[x] for x in range(23, 28)] == ['parse_asset'] * 5, methods
+    summary = tracer.summary()
+    assert sum(summary['methods'].values()) == len(lines) and summary['methods']['parse_asset'] > 0
+    assert [x['name'] for x in tracer.sink if x['event'] == 'phase'] == ['read', 'parse', 'dump'] == list(summary['phases'])
+
+    print('Include fan-out is recorded, cached includes are marked.')
+    with tempfile.TemporaryDirectory() as root:
+        write(root, 'core.mal', 'category Core {\n}\n')
+        write(root, 'a.mal', 'include "core.mal"\ncategory A {\n}\n')
+        main = write(root, 'main.mal', 'include "a.mal"\ninclude "core.mal"\ncategory M {\n}\n')
+        cache = {}
+        for cached in (False, True):
+            tracer = demal.Tracer(lines=False)
+            demal.MalParser(main, cache=cache, trace=tracer).parse()
+            includes = [(os.path.basename(x['file']), os.path.basename(x['include']), x['cached']) for x in tracer.sink if x['event'] == 'include']
+            assert includes == [('main.mal', 'a.mal', cached), ('a.mal', 'core.mal', cached)], includes
+            assert not any(x['event'] == 'line' for x in tracer.sink) and tracer.methods
+
+    print('JSON to MAL is traced too, and JSON lines can be written to a file.')
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'trace.jsonl')
+        tracer = demal.Tracer(demal.JsonSink(path))
+        m = demal.MalParser('test1.mal.json', trace=tracer)
+        m.load()
+        m.dump_mal(io.StringIO())
+        tracer.close()
+        with open(path) as f:
+            events = [json.loads(x) for x in f]
+        assert [x['name'] for x in events if x['event'] == 'phase'] == ['read', 'decode', 'validate', 'dump_mal']
+        assert events[-1]['event'] == 'summary' and events[-1]['phases']['dump_mal']['count'] == 1
+
+    print('Debug mode prints to stderr.')
+    stderr, sys.stderr = sys.stderr, io.StringIO()
+    try:
+        m = demal.MalParser('test1.mal', debug=True)
+        m.parse()
+        out = sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+    assert isinstance(m.tracer.sink, demal.StderrSink) and "parse_category" in out and "'asset Network {'" in out
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')
@@ -0,0 +1,150 @@
+import io, os, sys, json, tempfile, subprocess, demal
+from demal.validate import Diagnostic, validate_file, validate_files
+
+def write(root, name, text):
+    path = os.path.join(root, name)
+    with io.open(path, 'w', newline='\n') as f:
+        f.write(text)
+    return path
+
+LIB = '''category Lib {
+  abstract asset Machine {
+    | access
+      -> users.login
+  }
+}
+'''
+
+GOOD = '''include "lib.mal"
+category System {
+  asset Host extends Machine {
+    | connect
+      -> access,
+         network.reach
+    E hasUser
+      <- users
+  }
+  asset User {
+    | login
+      -> hosts.connect, hosts[Host].access
+  }
+  asset Network {
+    | reach
+      -> let all = hosts*,
+         hosts.connect
+  }
+}
+associations {
+  Machine [hosts] * <-- Use --> * [users] User
+  Network [network] 1 <-- Link --> 0..* [hosts] Host
+}
+'''
+
+BAD = '''include "lib.mal"
+category System {
+  asset Host extends Machine {
+    | connect
+      -> nothing.access,
+         users.logout
+  }
+  asset Server extends Computer {
+  }
+  asset User {
+  }
+  asset Loop extends Cycle {
+  }
+  asset Cycle extends Loop {
+  }
+}
+category Other {
+  asset Host {
+  }
+}
+associations {
+  Host [hosts] * <-- Use --> 2..1 [users] Person
+  Host [hosts] *..1 <-- Again --> * [users] User
+}
+'''
+
+def main():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        write(root, 'lib.mal', LIB)
+        os.chdir(root)
+
+        print('A sound model has nothing to report.')
+        m = demal.MalParser(write(root, 'good.mal', GOOD))
+        m.parse()
+        assert m.validate() == [], m.validate()
+        assert validate_file('good.mal') == []
+
+        print('Every check reports its problems at the declaration at fault.')
+        bad = write(root, 'bad.mal', BAD)
+        found = [(x.file, x.line, x.column, x.severity, x.code) for x in validate_file('bad.mal')]
+        lib = os.path.join(os.path.realpath(root), 'lib.mal')
+        assert found == [
+            ('bad.mal', 5, 7, 'error', 'unresolved'),
+            ('bad.mal', 6, 10, 'error', 'unresolved'),
+            ('bad.mal', 8, 3, 'error', 'unknown-parent'),
+            ('bad.mal', 14, 3, 'error', 'inheritance-cycle'),
+            ('bad.mal', 18, 3, 'warning', 'duplicate-asset'),
+            ('bad.mal', 22, 3, 'error', 'unknown-asset'),
+            ('bad.mal', 22, 3, 'error', 'invalid-multiplicity'),
+            ('bad.mal', 23, 3, 'error', 'invalid-multiplicity'),
+            ('bad.mal', 23, 3, 'error', 'duplicate-field'),
+            (lib, 4, 7, 'error', 'unresolved'),
+        ], found
+        messages = [x.message for x in validate_file('bad.mal')]
+        assert messages[0] == "Host.connect: cannot resolve 'nothing.access': unknown field or variable 'nothing' on Host", messages
+        assert messages[1] == "Host.connect: cannot resolve 'users.logout': no attack step 'logout' on Person", messages
+        assert messages[2] == "Asset 'Server' extends unknown asset 'Computer'", messages
+        assert messages[3] == 'Inheritance cycle: Cycle -> Loop -> Cycle', messages
+        assert messages[-1] == "Machine.access: cannot resolve 'users.login': unknown field or variable 'users' on Machine", messages
+        assert str(validate_file('bad.mal')[5]) == "bad.mal:22:3: error: Association Use refers to unknown asset 'Person' [unknown-asset]"
+
+        print('Without locating, nothing is parsed again.')
+        m = demal.MalParser(bad)
+        m.parse()
+        unlocated = m.validate(locate=False)
+        assert {x.file for x in unlocated} == {bad} and {x.line for x in unlocated} == {None}
+        assert sorted(x.code for x in unlocated) == sorted(x[4] for x in found)
+
+        print('Parse errors are diagnostics too.')
+        write(root, 'broken.mal', 'category C {\n  asset A {\n    | x\n      -> a..b\n  }\n}\n')
+        assert validate_file('broken.mal') == [Diagnostic('broken.mal', 4, 11, 'error', 'syntax', "Improper syntax in broken.mal at line 4, column 11: '-> a..b'")]
+        assert validate_file('missing.mal')[0].code == 'io'
+
+        print('Files are checked in parallel, problems in shared includes are reported once.')
+        files = ['good.mal', 'bad.mal', 'broken.mal', write(root, 'again.mal', BAD)]
+        serial, parallel = list(validate_files(files, 1)), list(validate_files(files, 2))
+        assert serial == parallel and [x[0] for x in serial] == files
+        assert [len(x[1]) for x in serial] == [0, 10, 1, 9], serial
+
+        print('demal --check prints them and fails on errors.')
+        run = lambda *args: subprocess.run(['demal', '--check', *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        p = run('good.mal')
+        assert p.returncode == 0 and p.stdout == '' and p.stderr == '0 errors, 0 warnings in 1 files.\n', p
+        p = run('bad.mal', 'good.mal', '-j', '2')
+        assert p.returncode == 1 and p.stdout.splitlines()[2] == "bad.mal:8:3: error: Asset 'Server' extends unknown asset 'Computer' [unknown-parent]"
+        assert p.stderr == '9 errors, 1 warnings in 2 files.\n', p.stderr
+        p = subprocess.run(['demal', '--check=json', 'bad.mal'], stdout=subprocess.PIPE, universal_newlines=True)
+        lines = [json.loads(x) for x in p.stdout.splitlines()]
+        assert p.returncode == 1 and lines[2] == {'file': 'bad.mal', 'line': 8, 'column': 3, 'severity': 'error', 'code': 'unknown-parent',
+                                                  'message': "Asset 'Server' extends unknown asset 'Computer'"}, lines[2]
+
+        print('A reader stopping early, such as head, fails the check without a traceback.')
+        # More diagnostics than a pipe holds, so that printing them blocks until the reader is gone.
+        write(root, 'many.mal', 'category C {\n' + ''.join(f'  asset A{i} extends B{i} {{\n  }}\n' for i in range(3000)) + '}\n')
+        p = subprocess.Popen(['demal', '--check', 'many.mal'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        assert p.stdout.readline().startswith('many.mal:2:3: error:')
+        p.stdout.close()
+        err = p.stderr.read()
+        assert p.wait() == 1 and err == '', err
+        p.stderr.close()
+        os.chdir(cwd)
+
+try:
+    main()
+    print('\nPassed\n')
+except Exception as e:
+    sys.exit(f'Error: {e}\n\nFailed\n')